@@ -1,13 +1,13 @@
 from backend.core.agents.state.chatbot_state import ChatBotState
 from datetime import datetime
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from backend.core.env import PROJECT_ID, LOCATION
+from backend.core.env import PROJECT_ID, LOCATION, LLM_INTERACTIVE_DEADLINE_SECONDS, LLM_HEDGE_PERCENTILE, LLM_INTERACTIVE_RESPONSE_CACHE_MODE
 from langchain_core.messages import trim_messages
 from loguru import logger
 from typing import List
 from pydantic import BaseModel, Field
 from backend.core.utils.chat_model import ChatVertexAIWX
-from backend.core.utils.utils_llm import run_chain_on_inputs, create_gemini_llm_client
+from backend.core.utils.utils_llm import run_chain_on_inputs, get_gemini_llm_client
 
 def extract_ingredients_node(messages: List):
     logger.info("Extracting ingredients...")
@@ -88,7 +88,7 @@ async def assess_ingredient_node(messages: List, ingredients: List[str], quantit
         ]
     )
     
-    chat_model = create_gemini_llm_client(project_id=PROJECT_ID, location=LOCATION, model_name="gemini-1.5-pro-002")
+    chat_model = get_gemini_llm_client(project_id=PROJECT_ID, location=LOCATION, model_name="gemini-1.5-pro-002")
     
     assess_ingredient_chain = prompt | chat_model.with_structured_output(IngredientAssessment)
 
@@ -101,7 +101,11 @@ async def assess_ingredient_node(messages: List, ingredients: List[str], quantit
             "quantity": quantity
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(assess_ingredient_chain, assessment_inputs, IngredientAssessment)
+    results, estimated_cost, _, _ = await run_chain_on_inputs(
+        assess_ingredient_chain, assessment_inputs, IngredientAssessment, stage="assess_ingredients",
+        cache_mode=LLM_INTERACTIVE_RESPONSE_CACHE_MODE, deadline_seconds=LLM_INTERACTIVE_DEADLINE_SECONDS,
+        hedge_percentile=LLM_HEDGE_PERCENTILE,
+    )
     logger.info(f"Estimated cost to assess {len(results)} ingredients: ${estimated_cost} AUD.")
     
     assessments = []
@@ -2,16 +2,36 @@ from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
 from langchain_google_vertexai import VertexAIEmbeddings
 from backend.core.utils.utils_mongodb import get_mongodb_collection
 from backend.core.env import MONGODB_ATLAS_CLUSTER_URI, PROJECT_ID, LOCATION, PROCESSED_REDDIT_RECIPE_DATA_PATH, RECIPE_VECTOR_INDEX_NAME, RECIPE_FULLTEXT_SEARCH_INDEX_NAME
+from backend.core.env import LOCAL_RECIPE_INDEX_PATH, LOCAL_RECIPE_INDEX_MODE, LOCAL_RECIPE_INDEX_QUANTIZATION, INGREDIENT_VOCABULARY_PATH, RECIPE_FIELD_STATISTICS_PATH
+from backend.core.utils.utils_ingredients import IngredientVocabulary, recipe_ingredient_ids
+from backend.core.utils.utils_dedupe import assign_recipe_clusters
+from backend.core.tools.local_vector_search import LocalVectorSearch
+from backend.core.tools.local_fulltext_search import LocalBM25Index
+from backend.core.tools.query_planner import FieldStatistics
 from langchain_mongodb import MongoDBAtlasVectorSearch
-from langchain_mongodb.index import create_fulltext_search_index
+from langchain_mongodb.index import create_fulltext_search_index, update_vector_search_index
 from langchain_core.documents import Document
 import pandas as pd
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from loguru import logger
 from typing import List, Dict
+from datetime import datetime, timezone
+import hashlib
+import argparse
 import ast
 import uuid
 
+# Fields filtered by build_pre_filter, summarized at ingest for the search planner
+RECIPE_STATISTICS_FIELDS = ["servings", "total_time", "difficulty_level", "cooking_method", "cleanup_effort",
+                            "meal_types", "course_types", "dietary_restrictions", "ingredient_ids"]
+
+# Fields the Atlas vector index declares as filters, every field build_pre_filter filters on must be listed
+RECIPE_VECTOR_INDEX_FILTERS = ["servings", "difficulty_level", "cooking_method", "equipment", "cleanup_effort", "meal_types",
+                               "course_types", "dietary_restrictions", "total_time", "ingredients", "ingredient_ids", "quantities"]
+
+# How long to wait for Atlas to rebuild the vector index after its filters change
+RECIPE_VECTOR_INDEX_UPDATE_TIMEOUT_SECONDS = 600
+
 def convert_string_to_list(value):
     if isinstance(value, str):
         # Check if the string looks like a list
@@ -48,6 +68,31 @@ def recipe_data_from_csv(csv_path: str, id_seed: str) -> List[Document]:
 
     return recipe_data
 
+def recipe_dataset_version(csv_path: str) -> str:
+    """Hash the processed recipe CSV, so caches of search results can tell when the data was reloaded."""
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+def add_canonical_ingredients(recipe_data: List[Dict], vocabulary_path: str = INGREDIENT_VOCABULARY_PATH) -> IngredientVocabulary:
+    """
+    Store the canonical ingredient ids on each recipe and save the corpus vocabulary for the query-side normalizer.
+
+    Args:
+        recipe_data: Recipe dicts from recipe_data_from_csv, updated in place with "ingredient_ids"
+        vocabulary_path: Where to save the vocabulary JSON
+
+    Returns:
+        IngredientVocabulary: The canonical vocabulary of the corpus
+    """
+    for i in recipe_data:
+        i["ingredient_ids"] = recipe_ingredient_ids(i["ingredients"])
+    vocabulary = IngredientVocabulary.build(i["ingredients"] for i in recipe_data)
+    vocabulary.save(vocabulary_path)
+    return vocabulary
+
 def recipe_data_to_documents(recipe_data: List[Dict]) -> List[Document]:
     # Prepare Langchain Document objects
     metadata = [{k: v for k, v in i.items() if k != 'search_description'} for i in recipe_data]
@@ -74,6 +119,11 @@ def recipe_data_to_chunks(documents: List[Document]) -> List[Document]:
     logger.info(f"Loaded {len(chunks)} recipe data chunks")
     return chunks
 
+def vector_index_filter_paths(search_index: Dict) -> List[str]:
+    """Return the filter paths declared by an Atlas vector search index, as listed by list_search_indexes."""
+    definition = search_index.get("latestDefinition", search_index.get("definition", {}))
+    return [field["path"] for field in definition.get("fields", []) if field.get("type") == "filter"]
+
 def recipe_data_to_vector_store(csv_path: str, mongodb_uri: str, db_name: str, collection_name: str):
     """
     Load recipe data into MongoDB Atlas Vector Search and create vector and fulltext search indexes.
@@ -87,6 +137,9 @@ def recipe_data_to_vector_store(csv_path: str, mongodb_uri: str, db_name: str, c
         MongoDBAtlasVectorSearch: The configured vector store
     """
     recipe_data = recipe_data_from_csv(csv_path, "raw_comment")
+    _ = add_canonical_ingredients(recipe_data)
+    _ = assign_recipe_clusters(recipe_data)
+    FieldStatistics.build(recipe_data, RECIPE_STATISTICS_FIELDS).save(RECIPE_FIELD_STATISTICS_PATH)
     documents = recipe_data_to_documents(recipe_data)
     #chunks = recipe_data_to_chunks(documents)
     embeddings = VertexAIEmbeddings(model="textembedding-gecko@003", project=PROJECT_ID, location=LOCATION)
@@ -112,25 +165,30 @@ def recipe_data_to_vector_store(csv_path: str, mongodb_uri: str, db_name: str, c
     # Create the index
     # Check if the index already exists
     # Check if index exists by getting list of indexes from collection
-    search_indexes = recipe_mongodb_collection.list_search_indexes()
-    indexes = recipe_mongodb_collection.list_indexes()
+    search_indexes = list(recipe_mongodb_collection.list_search_indexes())
+    indexes = list(recipe_mongodb_collection.list_indexes())
     index_exists_fulltext = any(index['name'] == RECIPE_FULLTEXT_SEARCH_INDEX_NAME for index in search_indexes)
-    index_exists_vector = any(index['name'] == RECIPE_VECTOR_INDEX_NAME for index in search_indexes)
+    vector_index = next((index for index in search_indexes if index['name'] == RECIPE_VECTOR_INDEX_NAME), None)
 
-    if not index_exists_vector:
+    if vector_index is None:
         logger.info(f"Creating the vector search index")
-        vector_store.create_vector_search_index(dimensions=768, filters = ["servings", 
-                                                                           "difficulty_level",
-                                                                           "cooking_method",
-                                                                           "equipment",
-                                                                           "cleanup_effort",
-                                                                           "meal_types",
-                                                                           "course_types",
-                                                                           "dietary_restrictions",
-                                                                           "total_time",
-                                                                           "ingredients",
-                                                                           "quantities"])
+        vector_store.create_vector_search_index(dimensions=768, filters=RECIPE_VECTOR_INDEX_FILTERS)
         logger.info(f"Vector search index created")
+    else:
+        # An index created before a filter field was added, e.g. ingredient_ids, rejects queries filtering on it
+        missing_filters = sorted(set(RECIPE_VECTOR_INDEX_FILTERS) - set(vector_index_filter_paths(vector_index)))
+        if missing_filters:
+            logger.info(f"Updating the vector search index to declare the filters {missing_filters}")
+            update_vector_search_index(
+                recipe_mongodb_collection,
+                RECIPE_VECTOR_INDEX_NAME,
+                dimensions=768,
+                path="embedding",
+                similarity="cosine",
+                filters=RECIPE_VECTOR_INDEX_FILTERS,
+                wait_until_complete=RECIPE_VECTOR_INDEX_UPDATE_TIMEOUT_SECONDS,
+            )
+            logger.info(f"Vector search index updated")
 
     if not index_exists_fulltext:
         logger.info(f"Creating the fulltext search index")
@@ -156,6 +214,52 @@ def recipe_data_to_vector_store(csv_path: str, mongodb_uri: str, db_name: str, c
     if not index_exists_total_time:
         _ = recipe_mongodb_collection.create_index("total_time")
         logger.info("Created index on total_time")
+
+    index_exists_ingredient_ids = any("ingredient_ids" in index['name'] for index in indexes)
+    if not index_exists_ingredient_ids:
+        _ = recipe_mongodb_collection.create_index("ingredient_ids")
+        logger.info("Created index on ingredient_ids")
+
+    # Record which data is loaded, cached search results from an older version are discarded
+    dataset_version = recipe_dataset_version(csv_path)
+    recipe_mongodb_collection.database["dataset_versions"].replace_one(
+        {"_id": collection_name},
+        {"_id": collection_name, "version": dataset_version, "loaded_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    logger.info(f"Recorded dataset version {dataset_version}")
+    return vector_store
+
+def recipe_data_to_local_index(csv_path: str, index_path: str, mode: str = "exact", nlist: int = None, quantization: str = "float32"):
+    """
+    Embed the recipe data and build a local vector index and BM25 fulltext index from the same documents written to Atlas.
+
+    Args:
+        csv_path: Path to the processed recipe CSV
+        index_path: Directory to write the index files to
+        mode: "exact" for brute-force search, "ivf" for partitioned search on large corpora
+        nlist: Number of IVF partitions, defaults to 4 * sqrt(number of recipes)
+        quantization: "float32", or "float16" / "int8" to score candidates on a compressed in-memory copy
+
+    Returns:
+        LocalVectorSearch: The built index
+    """
+    recipe_data = recipe_data_from_csv(csv_path, "raw_comment")
+    _ = add_canonical_ingredients(recipe_data)
+    _ = assign_recipe_clusters(recipe_data)
+    FieldStatistics.build(recipe_data, RECIPE_STATISTICS_FIELDS).save(RECIPE_FIELD_STATISTICS_PATH)
+    documents = recipe_data_to_documents(recipe_data)
+    embeddings = VertexAIEmbeddings(model="textembedding-gecko@003", project=PROJECT_ID, location=LOCATION)
+
+    logger.info(f"Embedding {len(documents)} recipe documents for the local {mode} {quantization} index")
+    vector_store = LocalVectorSearch.from_documents(
+        documents, embeddings, mode=mode, nlist=nlist, quantization=quantization, dataset_version=recipe_dataset_version(csv_path)
+    )
+    vector_store.save(index_path)
+
+    # Lexical half of the local hybrid search, over the same field as the Atlas fulltext index
+    fulltext_index = LocalBM25Index.build([document.page_content for document in documents])
+    fulltext_index.save(index_path)
     return vector_store
 
 def recipe_data_to_mongodb(csv_path: str, mongodb_uri: str, db_name: str, collection_name: str):
@@ -180,16 +284,20 @@ def recipe_data_to_mongodb(csv_path: str, mongodb_uri: str, db_name: str, collec
     return recipe_mongodb_collection
 
 if __name__ == "__main__":
-    # _ = recipe_data_to_mongodb(
-    #     PROCESSED_REDDIT_RECIPE_DATA_PATH,
-    #     MONGODB_ATLAS_CLUSTER_URI,
-    #     "savour",
-    #     "reddit_recipe_parent_data"
-    # )
-
-    _ = recipe_data_to_vector_store(
-        PROCESSED_REDDIT_RECIPE_DATA_PATH,
-        MONGODB_ATLAS_CLUSTER_URI,
-        "savour",
-        "reddit_recipe_data"
-    )
+    parser = argparse.ArgumentParser(description="Load the processed recipes into a search backend.")
+    parser.add_argument("--target", choices=["atlas", "local", "mongodb"], default="atlas",
+                        help="atlas: Atlas vector and fulltext search, local: the in-process index used by RECIPE_SEARCH_BACKEND=local "
+                             "and retrieval_evaluation.py --recorded, mongodb: a plain collection without search indexes.")
+    parser.add_argument("--csv", default=PROCESSED_REDDIT_RECIPE_DATA_PATH)
+    parser.add_argument("--index-path", default=LOCAL_RECIPE_INDEX_PATH, help="Where to write the local index.")
+    parser.add_argument("--mode", choices=["exact", "ivf"], default=LOCAL_RECIPE_INDEX_MODE, help="The local index search mode.")
+    parser.add_argument("--nlist", type=int, default=None, help="The number of IVF partitions of the local index.")
+    parser.add_argument("--quantization", choices=["float32", "float16", "int8"], default=LOCAL_RECIPE_INDEX_QUANTIZATION)
+    args = parser.parse_args()
+
+    if args.target == "local":
+        _ = recipe_data_to_local_index(args.csv, args.index_path, args.mode, nlist=args.nlist, quantization=args.quantization)
+    elif args.target == "mongodb":
+        _ = recipe_data_to_mongodb(args.csv, MONGODB_ATLAS_CLUSTER_URI, "savour", "reddit_recipe_parent_data")
+    else:
+        _ = recipe_data_to_vector_store(args.csv, MONGODB_ATLAS_CLUSTER_URI, "savour", "reddit_recipe_data")
@@ -34,6 +34,72 @@ GEMINI_FLASH = "gemini-1.5-flash-002"
 PROCESSED_REDDIT_RECIPE_DATA_PATH = "backend/data/recipes_reddit_extracted.csv"
 RECIPE_VECTOR_INDEX_NAME = "recipe_vector_index"
 RECIPE_FULLTEXT_SEARCH_INDEX_NAME = "recipe_fulltext_search_index"
+INGREDIENT_VOCABULARY_PATH = os.environ.get("INGREDIENT_VOCABULARY_PATH", "backend/data/ingredient_vocabulary.json")
+RECIPE_FIELD_STATISTICS_PATH = os.environ.get("RECIPE_FIELD_STATISTICS_PATH", "backend/data/recipe_field_statistics.json")
+
+# Recipe search backend - "mongodb" (Atlas hybrid search) or "local" (in-process vector index)
+RECIPE_SEARCH_BACKEND = os.environ.get("RECIPE_SEARCH_BACKEND", "mongodb")
+LOCAL_RECIPE_INDEX_PATH = os.environ.get("LOCAL_RECIPE_INDEX_PATH", "backend/data/recipe_index")
+LOCAL_RECIPE_INDEX_MODE = os.environ.get("LOCAL_RECIPE_INDEX_MODE", "exact")
+# "float32", or "float16" / "int8" to search a 2x / 4x smaller in-memory copy and rescore the top candidates
+LOCAL_RECIPE_INDEX_QUANTIZATION = os.environ.get("LOCAL_RECIPE_INDEX_QUANTIZATION", "float32")
+# Filtered searches expected to match at most this many recipes score every match exactly instead of ANN
+RECIPE_EXACT_SEARCH_MAX_MATCHES = int(os.environ.get("RECIPE_EXACT_SEARCH_MAX_MATCHES", 2000))
+
+# Caches
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "backend/data/cache/embeddings.sqlite")
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 10000))
+RERANK_CACHE_PATH = os.environ.get("RERANK_CACHE_PATH", "backend/data/cache/rerank_judgments.sqlite")
+RERANK_CACHE_TTL_SECONDS = float(os.environ.get("RERANK_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+RERANK_CACHE_MAX_ENTRIES = int(os.environ.get("RERANK_CACHE_MAX_ENTRIES", 100000))
+# Whole-search results, reused for queries with the same filters and a query embedding within the cosine threshold
+RESULT_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("RESULT_CACHE_SIMILARITY_THRESHOLD", 0.95))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 1000))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", 24 * 60 * 60))
+DATASET_VERSION_CHECK_SECONDS = float(os.environ.get("DATASET_VERSION_CHECK_SECONDS", 60))
+
+# Search results fetched per requested recipe, the surplus backfills near-duplicates collapsed before rerank
+RECIPE_DEDUPE_OVERFETCH = float(os.environ.get("RECIPE_DEDUPE_OVERFETCH", 2))
+
+# Multi-query fan-out - pantry searches also run one sub-query per ingredient group, fused with the full query
+RECIPE_FANOUT_ENABLED = os.environ.get("RECIPE_FANOUT_ENABLED", "false").lower() == "true"
+RECIPE_FANOUT_GROUP_SIZE = int(os.environ.get("RECIPE_FANOUT_GROUP_SIZE", 2))
+RECIPE_FANOUT_MAX_SUBQUERIES = int(os.environ.get("RECIPE_FANOUT_MAX_SUBQUERIES", 4))
+# Searches of one request in flight at once, the full query included
+RECIPE_FANOUT_CONCURRENCY = int(os.environ.get("RECIPE_FANOUT_CONCURRENCY", 3))
+
+# Rerank - candidates past the cutoff are scored locally on ingredient overlap instead of by the LLM
+RERANK_LLM_CUTOFF = int(os.environ.get("RERANK_LLM_CUTOFF", 6))
+# "listwise" judges all candidates in one call per sub-batch, "pointwise" makes one call per candidate
+RERANK_MODE = os.environ.get("RERANK_MODE", "listwise")
+
+# Batch LLM calls - run_chain_on_inputs grows in-flight calls from the initial window up to the ceiling while healthy
+LLM_INITIAL_CONCURRENCY = int(os.environ.get("LLM_INITIAL_CONCURRENCY", 4))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 32))
+# Retries of transient LLM errors (quota, timeout, 5xx), with at most LLM_RETRY_BUDGET_RATIO retries per input in a batch
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 4))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.environ.get("LLM_RETRY_BASE_DELAY_SECONDS", 1.0))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.environ.get("LLM_RETRY_MAX_DELAY_SECONDS", 30.0))
+LLM_RETRY_BUDGET_RATIO = float(os.environ.get("LLM_RETRY_BUDGET_RATIO", 0.2))
+LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get("LLM_CALL_TIMEOUT_SECONDS", 120))
+# Structured chain outputs cached by prompt, model, params and schema - "readwrite", "replay" (read-only, misses are not sent) or "off"
+LLM_RESPONSE_CACHE_MODE = os.environ.get("LLM_RESPONSE_CACHE_MODE", "readwrite")
+# The same for interactive chains, off by default: their inputs carry the conversation so they rarely repeat, and rerank has its own judgment cache
+LLM_INTERACTIVE_RESPONSE_CACHE_MODE = os.environ.get("LLM_INTERACTIVE_RESPONSE_CACHE_MODE", "off")
+LLM_RESPONSE_CACHE_PATH = os.environ.get("LLM_RESPONSE_CACHE_PATH", "backend/data/cache/llm_responses.sqlite")
+LLM_RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("LLM_RESPONSE_CACHE_MAX_BYTES", 1024 ** 3))
+# Identical requests in flight at the same time (same prompt, model, params and schema) share one call
+LLM_COALESCE_REQUESTS = os.environ.get("LLM_COALESCE_REQUESTS", "true").lower() == "true"
+# Time budget of the LLM calls of interactive paths (rerank, ingredient assessment), stragglers get fallbacks.
+# Calls slower than the LLM_HEDGE_PERCENTILE latency of their chain get a hedged duplicate, once LLM_HEDGE_MIN_SAMPLES latencies are known
+LLM_INTERACTIVE_DEADLINE_SECONDS = float(os.environ.get("LLM_INTERACTIVE_DEADLINE_SECONDS", 20))
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", 0.95))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", 20))
+# Token bucket shared by all clients of a (model, location) - "memory" (per process) or "sqlite" (shared by the processes on a host)
+LLM_RATE_LIMITER_BACKEND = os.environ.get("LLM_RATE_LIMITER_BACKEND", "memory")
+LLM_RATE_LIMITER_PATH = os.environ.get("LLM_RATE_LIMITER_PATH", "backend/data/cache/llm_rate_limits.sqlite")
+LLM_REQUESTS_PER_SECOND = float(os.environ.get("LLM_REQUESTS_PER_SECOND", 5))
+LLM_MAX_BUCKET_SIZE = int(os.environ.get("LLM_MAX_BUCKET_SIZE", 5))
 
 # Reddit
 REDDIT_USER = os.environ["REDDIT_USER"]
@@ -0,0 +1,221 @@
+from typing import Any, Dict, List, Optional
+import time
+from loguru import logger
+from langchain_core.documents import Document
+from langchain_mongodb.pipelines import (
+    combine_pipelines,
+    final_hybrid_stage,
+    reciprocal_rank_stage,
+    text_search_stage,
+    vector_search_stage,
+)
+from langchain_mongodb.utils import make_serializable
+from backend.core.tools.local_vector_search import LocalVectorSearch
+from backend.core.tools.local_fulltext_search import LocalBM25Index
+
+
+def mongodb_hybrid_search_pipeline(
+    query: str,
+    query_vector: List[float],
+    collection_name: str,
+    vector_index_name: str,
+    fulltext_index_name: str,
+    top_k: int,
+    pre_filter: Optional[Dict[str, Any]] = None,
+    vector_penalty: float = 60.0,
+    fulltext_penalty: float = 60.0,
+    oversampling_factor: int = 10,
+    embedding_key: str = "embedding",
+    text_key: str = "text",
+    exact: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Build the Atlas hybrid search aggregation pipeline used by MongoDBAtlasHybridSearchRetriever.
+
+    The vector and full-text result lists are fused with Reciprocal Rank Fusion,
+    score = 1 / (rank + penalty + 1) summed over both lists. With exact=True the vector half
+    scores every document passing the filter (ENN) instead of an approximate candidate set.
+
+    Returns:
+        List[Dict[str, Any]]: The aggregation pipeline.
+    """
+    pipeline: List[Any] = []
+
+    vector_stage = vector_search_stage(
+        query_vector=query_vector,
+        search_field=embedding_key,
+        index_name=vector_index_name,
+        top_k=top_k,
+        filter=pre_filter,
+        oversampling_factor=oversampling_factor,
+    )
+    if exact:
+        # numCandidates is not allowed on exact searches
+        vector_stage["$vectorSearch"].pop("numCandidates", None)
+        vector_stage["$vectorSearch"]["exact"] = True
+    vector_pipeline = [vector_stage]
+    vector_pipeline += reciprocal_rank_stage("vector_score", vector_penalty)
+    combine_pipelines(pipeline, vector_pipeline, collection_name)
+
+    text_pipeline = text_search_stage(
+        query=query,
+        search_field=text_key,
+        index_name=fulltext_index_name,
+        limit=top_k,
+        filter=pre_filter,
+    )
+    text_pipeline.extend(reciprocal_rank_stage("fulltext_score", fulltext_penalty))
+    combine_pipelines(pipeline, text_pipeline, collection_name)
+
+    pipeline.extend(final_hybrid_stage(scores_fields=["vector_score", "fulltext_score"], limit=top_k))
+    pipeline.append({"$project": {embedding_key: 0}})
+    return pipeline
+
+
+async def amongodb_hybrid_search(
+    collection: Any,
+    query: str,
+    query_vector: List[float],
+    vector_index_name: str,
+    fulltext_index_name: str,
+    top_k: int,
+    pre_filter: Optional[Dict[str, Any]] = None,
+    vector_penalty: float = 60.0,
+    fulltext_penalty: float = 60.0,
+    oversampling_factor: int = 10,
+    text_key: str = "text",
+    exact: bool = False,
+) -> List[Document]:
+    """
+    Run an Atlas hybrid search on an AsyncMongoClient collection.
+
+    All search parameters are passed per call, so concurrent searches never share state.
+
+    Args:
+        collection (Any): An AsyncMongoClient collection.
+        query (str): The query text, used as-is for the full-text search.
+        query_vector (List[float]): The embedded query, used for the vector search.
+        vector_index_name (str): The Atlas vector search index name.
+        fulltext_index_name (str): The Atlas full-text search index name.
+        top_k (int): The number of documents to return.
+        pre_filter (dict): MQL match expression applied to both searches.
+        vector_penalty (float): The RRF penalty of the vector search results.
+        fulltext_penalty (float): The RRF penalty of the full-text search results.
+        oversampling_factor (int): This times top_k is the number of vector search candidates.
+        text_key (str): The field holding the document text.
+        exact (bool): Score every filtered document in the vector search instead of approximate candidates.
+
+    Returns:
+        List[Document]: The fused search results.
+    """
+    pipeline = mongodb_hybrid_search_pipeline(
+        query=query,
+        query_vector=query_vector,
+        collection_name=collection.name,
+        vector_index_name=vector_index_name,
+        fulltext_index_name=fulltext_index_name,
+        top_k=top_k,
+        pre_filter=pre_filter,
+        vector_penalty=vector_penalty,
+        fulltext_penalty=fulltext_penalty,
+        oversampling_factor=oversampling_factor,
+        text_key=text_key,
+        exact=exact,
+    )
+    cursor = await collection.aggregate(pipeline)
+    documents = []
+    for result in await cursor.to_list():
+        text = result.pop(text_key)
+        make_serializable(result)
+        documents.append(Document(page_content=text, metadata=result))
+    return documents
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Dict[str, List[Document]],
+    penalties: Dict[str, float],
+    top_k: int,
+    id_key: str = "uuid",
+) -> List[Document]:
+    """
+    Fuse ranked result lists with Reciprocal Rank Fusion, following the Atlas hybrid search pipeline.
+
+    Each document gets one score field per list, 1 / (rank + penalty + 1) or 0 if the list missed it,
+    and "score" is their sum. Documents are matched across lists on metadata[id_key], so lists from
+    different backends (e.g. Atlas vector search and the local BM25 index) can be fused.
+
+    Args:
+        ranked_lists (Dict[str, List[Document]]): Score field name -> results, best first, e.g. {"vector_score": [...]}.
+        penalties (Dict[str, float]): Score field name -> RRF penalty.
+        top_k (int): The number of documents to return.
+        id_key (str): The metadata field identifying a document, falls back to the page content.
+
+    Returns:
+        List[Document]: The fused results, best first.
+    """
+    fused: Dict[Any, Document] = {}
+    for score_field, documents in ranked_lists.items():
+        for rank, document in enumerate(documents):
+            key = document.metadata.get(id_key, document.page_content)
+            if key not in fused:
+                fused[key] = document
+                for field in ranked_lists:
+                    document.metadata[field] = 0.0
+            fused[key].metadata[score_field] = max(fused[key].metadata[score_field], 1.0 / (rank + penalties[score_field] + 1))
+
+    for document in fused.values():
+        document.metadata["score"] = sum(document.metadata[field] for field in ranked_lists)
+    return sorted(fused.values(), key=lambda document: document.metadata["score"], reverse=True)[:top_k]
+
+
+def local_hybrid_search(
+    vector_store: LocalVectorSearch,
+    fulltext_index: LocalBM25Index,
+    query: str,
+    query_vector: List[float],
+    top_k: int,
+    pre_filter: Optional[Dict[str, Any]] = None,
+    vector_penalty: float = 60.0,
+    fulltext_penalty: float = 60.0,
+    nprobe: Optional[int] = None,
+    exact: bool = False,
+) -> List[Document]:
+    """
+    Run a hybrid search on the local vector and BM25 indexes, with no Atlas dependency.
+
+    Mirrors amongodb_hybrid_search: top_k hits from each half, fused with the same RRF penalties.
+    The latency of each half is logged at debug level.
+
+    Args:
+        vector_store (LocalVectorSearch): The local vector index.
+        fulltext_index (LocalBM25Index): The BM25 index built from the same documents.
+        query (str): The query text, used for the BM25 search.
+        query_vector (List[float]): The embedded query, used for the vector search.
+        top_k (int): The number of documents to return.
+        pre_filter (dict): MQL match expression applied to both searches.
+        vector_penalty (float): The RRF penalty of the vector search results.
+        fulltext_penalty (float): The RRF penalty of the BM25 results.
+        nprobe (int): Overrides the number of IVF partitions scored.
+        exact (bool): Score every row passing the filter, even on an IVF index.
+
+    Returns:
+        List[Document]: The fused search results.
+    """
+    start = time.perf_counter()
+    vector_results = [
+        document for document, _ in vector_store.similarity_search_by_vector_with_score(query_vector, top_k, pre_filter, nprobe=nprobe, exact=exact)
+    ]
+    vector_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows, _ = fulltext_index.search(query, top_k, mask=vector_store.filter_index.mask(pre_filter))
+    fulltext_results = [vector_store.get_document(int(row)) for row in rows]
+    fulltext_seconds = time.perf_counter() - start
+
+    logger.debug(f"Local hybrid search: vector {vector_seconds * 1000:.1f} ms, BM25 {fulltext_seconds * 1000:.1f} ms")
+    return reciprocal_rank_fusion(
+        {"vector_score": vector_results, "fulltext_score": fulltext_results},
+        {"vector_score": vector_penalty, "fulltext_score": fulltext_penalty},
+        top_k,
+        id_key="_id",
+    )
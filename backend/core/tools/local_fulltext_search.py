@@ -0,0 +1,190 @@
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from pathlib import Path
+import json
+import re
+import numpy as np
+from loguru import logger
+
+BM25_POSTINGS_FILE = "bm25_postings.npz"
+BM25_TERMS_FILE = "bm25_terms.json"
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenizer, close to the Atlas lucene.standard analyzer used by the fulltext index."""
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the positions of the k highest scores, sorted descending."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class LocalBM25Index:
+    """
+    In-process inverted index with BM25 scoring, a drop-in for the lexical half of Atlas hybrid search.
+
+    Postings are stored compactly as flat arrays sorted by term then row:
+        - term_offsets (n_terms + 1,): postings of term t are posting_rows[term_offsets[t]:term_offsets[t + 1]]
+        - posting_rows (n_postings,): int32 row ids, ascending within each term
+        - posting_tfs (n_postings,): uint16 term frequencies
+        - doc_lengths (n_docs,): int32 token counts
+
+    Rows line up with the documents of the LocalVectorSearch index built from the same documents,
+    so both halves of a hybrid search share one pre_filter mask.
+
+    Args:
+        terms (Dict[str, int]): The vocabulary, term -> term id.
+        term_offsets (np.ndarray): The start of each term's postings.
+        posting_rows (np.ndarray): The row ids of all postings.
+        posting_tfs (np.ndarray): The term frequencies of all postings.
+        doc_lengths (np.ndarray): The number of tokens per row.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+
+    def __init__(
+        self,
+        terms: Dict[str, int],
+        term_offsets: np.ndarray,
+        posting_rows: np.ndarray,
+        posting_tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.posting_rows = posting_rows
+        self.posting_tfs = posting_tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.average_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        # Per-row part of the BM25 denominator, precomputed once
+        self._length_norms = (k1 * (1 - b + b * doc_lengths / max(self.average_doc_length, 1e-9))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts: List[str], k1: float = 1.2, b: float = 0.75) -> "LocalBM25Index":
+        """
+        Tokenize the texts and build the inverted index.
+
+        Args:
+            texts (List[str]): The document texts, in row order.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+
+        Returns:
+            LocalBM25Index: The index.
+        """
+        terms: Dict[str, int] = {}
+        term_ids, rows, tfs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(terms.setdefault(term, len(terms)))
+                rows.append(row)
+                tfs.append(min(tf, np.iinfo(np.uint16).max))
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        # Rows were appended in ascending order, so a stable sort on term id keeps them sorted within each term
+        order = np.argsort(term_ids, kind="stable")
+        term_offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(terms)))]).astype(np.int64)
+        posting_rows = np.asarray(rows, dtype=np.int32)[order]
+        posting_tfs = np.asarray(tfs, dtype=np.uint16)[order]
+        logger.info(f"Built BM25 index with {len(terms)} terms and {len(posting_rows)} postings over {len(texts)} documents")
+        return cls(terms, term_offsets, posting_rows, posting_tfs, doc_lengths, k1=k1, b=b)
+
+    def save(self, index_path: str) -> None:
+        """Persist the index next to the local vector index files."""
+        path = Path(index_path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path / BM25_POSTINGS_FILE,
+            term_offsets=self.term_offsets,
+            posting_rows=self.posting_rows,
+            posting_tfs=self.posting_tfs,
+            doc_lengths=self.doc_lengths,
+            params=np.asarray([self.k1, self.b]),
+        )
+        # Terms are written in term id order, so the list index is the term id
+        with open(path / BM25_TERMS_FILE, "w") as f:
+            json.dump(sorted(self.terms, key=self.terms.get), f)
+        logger.info(f"Saved BM25 index with {len(self.terms)} terms to {index_path}")
+
+    @classmethod
+    def load(cls, index_path: str) -> "LocalBM25Index":
+        path = Path(index_path)
+        with open(path / BM25_TERMS_FILE) as f:
+            terms = {term: term_id for term_id, term in enumerate(json.load(f))}
+        with np.load(path / BM25_POSTINGS_FILE) as arrays:
+            k1, b = arrays["params"]
+            index = cls(
+                terms,
+                arrays["term_offsets"],
+                arrays["posting_rows"],
+                arrays["posting_tfs"],
+                arrays["doc_lengths"],
+                k1=float(k1),
+                b=float(b),
+            )
+        logger.info(f"Loaded BM25 index with {len(terms)} terms over {len(index)} documents from {index_path}")
+        return index
+
+    @classmethod
+    def exists(cls, index_path: str) -> bool:
+        return (Path(index_path) / BM25_POSTINGS_FILE).exists()
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Return the BM25 score of every row for the query, zero for rows without any query term.
+
+        Args:
+            query (str): The query text.
+
+        Returns:
+            np.ndarray: The float32 scores, shape (n_docs,).
+        """
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        n_docs = len(self.doc_lengths)
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            rows = self.posting_rows[start:end]
+            tfs = self.posting_tfs[start:end].astype(np.float32)
+            document_frequency = end - start
+            idf = np.log(1 + (n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+            scores[rows] += query_tf * idf * tfs * (self.k1 + 1) / (tfs + self._length_norms[rows])
+        return scores
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the k best matching rows for the query.
+
+        Only rows containing at least one query term are returned, as with an Atlas $search stage.
+
+        Args:
+            query (str): The query text.
+            k (int): The maximum number of rows to return.
+            mask (np.ndarray): Boolean pre_filter mask over rows, e.g. from MetadataFilterIndex.mask.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The row ids and their BM25 scores, best first.
+        """
+        scores = self.score(query)
+        matched = scores > 0
+        if mask is not None:
+            matched &= mask
+        rows = np.flatnonzero(matched)
+        top = _top_k(scores[rows], k)
+        return rows[top], scores[rows[top]]
@@ -0,0 +1,463 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+import json
+import numpy as np
+from loguru import logger
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks.manager import CallbackManagerForRetrieverRun
+from backend.core.utils.utils_filter import MetadataFilterIndex
+from backend.core.tools.vector_quantization import FLOAT32, QuantizedVectors
+
+EXACT_MODE = "exact"
+IVF_MODE = "ivf"
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+DOCUMENTS_FILE = "documents.jsonl"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+IVF_ROWS_FILE = "ivf_rows.npy"
+
+# Rows scored per matmul in exact mode, keeps the working set small when the matrix is memory-mapped
+SCORING_CHUNK_SIZE = 65536
+
+# Scores materialized per matmul when assigning vectors to IVF centroids, about 64 MB of float32
+CENTROID_SCORES_PER_CHUNK = 1 << 24
+
+# Upper bound on the k-means training sample, whatever the number of partitions
+IVF_MAX_TRAINING_SAMPLE = 262144
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the positions of the k highest scores, sorted descending."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Return the position of the nearest centroid of every vector.
+
+    Vectors are scored in chunks sized so that the chunk x centroid score matrix stays around
+    CENTROID_SCORES_PER_CHUNK entries, however many centroids there are.
+    """
+    chunk_size = max(1, CENTROID_SCORES_PER_CHUNK // len(centroids))
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_ivf_centroids(vectors: np.ndarray, nlist: int, n_iter: int = 20, sample_size: int = 256, seed: int = 42, max_sample: int = IVF_MAX_TRAINING_SAMPLE) -> np.ndarray:
+    """
+    Train IVF partition centroids with spherical k-means on a sample of the (normalized) vectors.
+
+    Args:
+        vectors (np.ndarray): The normalized vectors, shape (n, d).
+        nlist (int): The number of partitions.
+        n_iter (int): The number of k-means iterations.
+        sample_size (int): The number of training vectors sampled per partition.
+        seed (int): The random seed.
+        max_sample (int): The maximum number of training vectors, at least nlist are always sampled.
+
+    Returns:
+        np.ndarray: The normalized centroids, shape (nlist, d).
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = vectors.shape[0]
+    n_sample = min(n_rows, max(nlist, min(nlist * sample_size, max_sample)))
+    sample_rows = np.sort(rng.choice(n_rows, size=n_sample, replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        # Re-seed empty partitions with random sample points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def assign_ivf_partitions(vectors: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assign every vector to its nearest centroid and lay the row ids out contiguously per partition.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The partition offsets (nlist + 1,) and the row ids sorted by partition.
+    """
+    assignments = nearest_centroids(vectors, centroids)
+    rows = np.argsort(assignments, kind="stable").astype(np.int64)
+    counts = np.bincount(assignments, minlength=len(centroids))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return offsets, rows
+
+
+class LocalVectorSearch(VectorStore):
+    """
+    In-process vector index over recipe documents, a drop-in for MongoDBAtlasVectorSearch.
+
+    Vectors are L2-normalized and stored as a float32 matrix that is memory-mapped from disk.
+    Two search modes are supported:
+        - exact: brute-force cosine similarity with a NumPy matmul over the (pre-filtered) matrix
+        - ivf: vectors are partitioned around k-means centroids and only the nprobe closest partitions are scored
+
+    With quantization "float16" or "int8", candidates are scored on an in-memory quantized copy of the
+    vectors and the best k * rescore_factor are rescored against the memory-mapped float32 matrix, so
+    only those rows of the full-precision vectors are read per query.
+
+    pre_filter accepts the same MQL dict that retrieve_recipes builds for Atlas.
+    Scores follow the Atlas cosine convention of (1 + cosine) / 2.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        vectors: np.ndarray,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        mode: str = EXACT_MODE,
+        ivf_centroids: Optional[np.ndarray] = None,
+        ivf_offsets: Optional[np.ndarray] = None,
+        ivf_rows: Optional[np.ndarray] = None,
+        nprobe: int = 16,
+        dataset_version: Optional[str] = None,
+        quantization: str = FLOAT32,
+        quantized: Optional[QuantizedVectors] = None,
+        rescore_factor: int = 4,
+    ):
+        if mode not in (EXACT_MODE, IVF_MODE):
+            raise ValueError(f"Unknown search mode: {mode}")
+        if mode == IVF_MODE and ivf_centroids is None:
+            raise ValueError("IVF mode requires trained centroids")
+        self._embedding = embedding
+        self.vectors = vectors
+        self.texts = texts
+        self.metadatas = metadatas
+        self.mode = mode
+        self.ivf_centroids = ivf_centroids
+        self.ivf_offsets = ivf_offsets
+        self.ivf_rows = ivf_rows
+        self.nprobe = nprobe
+        self.dataset_version = dataset_version
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        if quantization != FLOAT32 and quantized is None:
+            quantized = QuantizedVectors.build(vectors, quantization)
+        self.quantized = quantized if quantization != FLOAT32 else None
+        self.filter_index = MetadataFilterIndex(metadatas)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def get_document(self, row: int) -> Document:
+        """Return a fresh Document for a row, with the row id as its _id."""
+        return Document(page_content=self.texts[row], metadata={"_id": str(row), **self.metadatas[row]})
+
+    # ====================================================================================
+    # Building and persistence
+    # ====================================================================================
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[Dict]] = None,
+        mode: str = EXACT_MODE,
+        nlist: Optional[int] = None,
+        batch_size: int = 250,
+        **kwargs: Any,
+    ) -> "LocalVectorSearch":
+        """
+        Embed the texts and build an in-memory index.
+
+        Args:
+            texts (List[str]): The texts to embed, i.e. the document page contents.
+            embedding (Embeddings): The embedding model.
+            metadatas (List[Dict]): The metadata for each text.
+            mode (str): "exact" or "ivf".
+            nlist (int): The number of IVF partitions, defaults to 4 * sqrt(n).
+            batch_size (int): The number of texts embedded per request.
+
+        Returns:
+            LocalVectorSearch: The index.
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.empty((0, 0), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = np.asarray(embedding.embed_documents(texts[start:start + batch_size]), dtype=np.float32)
+            if start == 0:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[start:start + len(batch)] = _normalize(batch)
+        return cls.from_vectors(vectors, texts, metadatas, embedding, mode=mode, nlist=nlist, **kwargs)
+
+    @classmethod
+    def from_vectors(
+        cls,
+        vectors: np.ndarray,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embedding: Embeddings,
+        mode: str = EXACT_MODE,
+        nlist: Optional[int] = None,
+        **kwargs: Any,
+    ) -> "LocalVectorSearch":
+        """Build an index from precomputed vectors, training IVF partitions if required."""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        ivf = {}
+        if mode == IVF_MODE:
+            nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+            nlist = min(nlist, len(vectors))
+            logger.info(f"Training {nlist} IVF partitions over {len(vectors)} vectors")
+            centroids = train_ivf_centroids(vectors, nlist)
+            offsets, rows = assign_ivf_partitions(vectors, centroids)
+            ivf = {"ivf_centroids": centroids, "ivf_offsets": offsets, "ivf_rows": rows}
+        return cls(embedding, vectors, list(texts), list(metadatas), mode=mode, **ivf, **kwargs)
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], embedding: Embeddings, **kwargs: Any) -> "LocalVectorSearch":
+        texts = [document.page_content for document in documents]
+        metadatas = [document.metadata for document in documents]
+        return cls.from_texts(texts, embedding, metadatas=metadatas, **kwargs)
+
+    def save(self, index_path: str) -> None:
+        """
+        Persist the index to a directory.
+
+        Args:
+            index_path (str): The directory to write the index files to.
+        """
+        path = Path(index_path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / VECTORS_FILE, np.asarray(self.vectors, dtype=np.float32))
+        with open(path / DOCUMENTS_FILE, "w") as f:
+            for text, metadata in zip(self.texts, self.metadatas):
+                f.write(json.dumps({"text": text, "metadata": metadata}, default=str) + "\n")
+        if self.quantized is not None:
+            self.quantized.save(index_path)
+        if self.mode == IVF_MODE:
+            np.save(path / IVF_CENTROIDS_FILE, self.ivf_centroids)
+            np.save(path / IVF_OFFSETS_FILE, self.ivf_offsets)
+            np.save(path / IVF_ROWS_FILE, self.ivf_rows)
+        manifest = {
+            "mode": self.mode,
+            "size": len(self.texts),
+            "dimensions": int(self.vectors.shape[1]) if len(self.texts) else 0,
+            "nlist": int(len(self.ivf_centroids)) if self.mode == IVF_MODE else 0,
+            "dataset_version": self.dataset_version,
+            "quantization": self.quantization,
+        }
+        with open(path / MANIFEST_FILE, "w") as f:
+            json.dump(manifest, f, indent=2)
+        logger.info(f"Saved {self.mode} local vector index with {len(self.texts)} documents to {index_path}")
+
+    @classmethod
+    def load(cls, index_path: str, embedding: Embeddings, nprobe: int = 16, rescore_factor: int = 4) -> "LocalVectorSearch":
+        """
+        Load a persisted index, memory-mapping the vector matrix.
+
+        Args:
+            index_path (str): The directory containing the index files.
+            embedding (Embeddings): The embedding model used to embed queries.
+            nprobe (int): The number of IVF partitions scored per query.
+            rescore_factor (int): Candidates rescored at full precision per result for quantized indexes, 0 disables rescoring.
+
+        Returns:
+            LocalVectorSearch: The index.
+        """
+        path = Path(index_path)
+        if not (path / MANIFEST_FILE).exists():
+            raise FileNotFoundError(f"No local recipe index at {index_path}, build it with backend/scripts/build_local_index.sh")
+        with open(path / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        vectors = np.load(path / VECTORS_FILE, mmap_mode="r")
+        texts, metadatas = [], []
+        with open(path / DOCUMENTS_FILE) as f:
+            for line in f:
+                record = json.loads(line)
+                texts.append(record["text"])
+                metadatas.append(record["metadata"])
+        ivf = {}
+        if manifest["mode"] == IVF_MODE:
+            ivf = {
+                "ivf_centroids": np.load(path / IVF_CENTROIDS_FILE),
+                "ivf_offsets": np.load(path / IVF_OFFSETS_FILE),
+                "ivf_rows": np.load(path / IVF_ROWS_FILE, mmap_mode="r"),
+            }
+        quantization = manifest.get("quantization", FLOAT32)
+        quantized = QuantizedVectors.load(index_path, quantization) if quantization != FLOAT32 else None
+        logger.info(f"Loaded {manifest['mode']} {quantization} local vector index with {manifest['size']} documents from {index_path}")
+        return cls(
+            embedding,
+            vectors,
+            texts,
+            metadatas,
+            mode=manifest["mode"],
+            nprobe=nprobe,
+            dataset_version=manifest.get("dataset_version"),
+            quantization=quantization,
+            quantized=quantized,
+            rescore_factor=rescore_factor,
+            **ivf,
+        )
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None, **kwargs: Any) -> List[str]:
+        """Embed and append texts to the in-memory index, assigning them to their nearest IVF partition."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        new_vectors = _normalize(np.asarray(self._embedding.embed_documents(texts), dtype=np.float32))
+        start = len(self.texts)
+        self.vectors = np.concatenate([np.asarray(self.vectors), new_vectors]) if start else new_vectors
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        if self.mode == IVF_MODE:
+            self.ivf_offsets, self.ivf_rows = assign_ivf_partitions(self.vectors, self.ivf_centroids)
+        if self.quantized is not None:
+            self.quantized = QuantizedVectors.build(self.vectors, self.quantization)
+        self.filter_index = MetadataFilterIndex(self.metadatas)
+        return [str(i) for i in range(start, len(self.texts))]
+
+    # ====================================================================================
+    # Search
+    # ====================================================================================
+    def _dot(self, query_vector: np.ndarray, rows: Any) -> np.ndarray:
+        # Candidate scores come from the quantized copy when there is one
+        if self.quantized is not None:
+            return self.quantized.score(query_vector, rows)
+        return np.asarray(self.vectors[rows]) @ query_vector
+
+    def _score_rows(self, query_vector: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORING_CHUNK_SIZE):
+            chunk_rows = rows[start:start + SCORING_CHUNK_SIZE]
+            scores[start:start + len(chunk_rows)] = self._dot(query_vector, chunk_rows)
+        return scores
+
+    def _exact_candidates(self, query_vector: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if mask.all():
+            scores = np.empty(len(self.texts), dtype=np.float32)
+            for start in range(0, len(self.texts), SCORING_CHUNK_SIZE):
+                chunk_scores = self._dot(query_vector, slice(start, start + SCORING_CHUNK_SIZE))
+                scores[start:start + len(chunk_scores)] = chunk_scores
+            return np.arange(len(self.texts)), scores
+        rows = np.flatnonzero(mask)
+        return rows, self._score_rows(query_vector, rows)
+
+    def _ivf_candidates(self, query_vector: np.ndarray, mask: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        centroid_order = np.argsort(-(self.ivf_centroids @ query_vector))
+        nprobe = min(nprobe, len(centroid_order))
+        while True:
+            probed = centroid_order[:nprobe]
+            rows = np.concatenate([self.ivf_rows[self.ivf_offsets[i]:self.ivf_offsets[i + 1]] for i in probed])
+            rows = rows[mask[rows]]
+            # Widen the probe when a selective filter leaves fewer than k candidates
+            if len(rows) >= k or nprobe >= len(centroid_order):
+                break
+            nprobe = min(nprobe * 2, len(centroid_order))
+        return rows, self._score_rows(query_vector, rows)
+
+    def _rescore(self, query_vector: np.ndarray, rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rescore the best k * rescore_factor quantized candidates with the full-precision vectors."""
+        top = _top_k(scores, k * self.rescore_factor)
+        # Sorted row reads keep the memory-mapped access pattern sequential
+        rows = np.sort(rows[top])
+        return rows, np.asarray(self.vectors[rows], dtype=np.float32) @ query_vector
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        pre_filter: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the documents most similar to the query vector and their scores.
+
+        Args:
+            embedding (List[float]): The query embedding.
+            k (int): The number of documents to return.
+            pre_filter (dict): MQL match expression applied before scoring.
+            nprobe (int): Overrides the number of IVF partitions scored.
+            exact (bool): Score every row passing the filter, even in IVF mode.
+
+        Returns:
+            List[Tuple[Document, float]]: The documents and their (1 + cosine) / 2 scores.
+        """
+        if not self.texts:
+            return []
+        query_vector = _normalize(np.asarray(embedding, dtype=np.float32))
+        mask = self.filter_index.mask(pre_filter)
+        if self.mode == IVF_MODE and not exact:
+            rows, scores = self._ivf_candidates(query_vector, mask, k, nprobe or self.nprobe)
+        else:
+            rows, scores = self._exact_candidates(query_vector, mask)
+        if self.quantized is not None and self.rescore_factor > 0:
+            rows, scores = self._rescore(query_vector, rows, scores, k)
+
+        results = []
+        for position in _top_k(scores, k):
+            results.append((self.get_document(int(rows[position])), float((1 + scores[position]) / 2)))
+        return results
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, pre_filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k, pre_filter=pre_filter, **kwargs)
+
+    def similarity_search(
+        self, query: str, k: int = 4, pre_filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        results = self.similarity_search_with_score(query, k=k, pre_filter=pre_filter, **kwargs)
+        for document, score in results:
+            document.metadata["score"] = score
+        return [document for document, _ in results]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+
+class LocalVectorSearchRetriever(BaseRetriever):
+    """
+    Retriever over a LocalVectorSearch index.
+
+    Exposes the same top_k and pre_filter attributes as MongoDBAtlasHybridSearchRetriever,
+    so the two can be swapped by configuration.
+    """
+
+    vectorstore: LocalVectorSearch
+    """Local vector index"""
+    top_k: int = 4
+    """Number of documents to return."""
+    pre_filter: Optional[Dict[str, Any]] = None
+    """(Optional) Any MQL match expression comparing a metadata field"""
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        results = self.vectorstore.similarity_search_with_score(query, k=self.top_k, pre_filter=self.pre_filter)
+        documents = []
+        for document, score in results:
+            document.metadata["vector_score"] = score
+            documents.append(document)
+        return documents
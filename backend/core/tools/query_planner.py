@@ -0,0 +1,220 @@
+from typing import Any, Dict, List, Optional
+from dataclasses import asdict, dataclass
+from enum import Enum
+from pathlib import Path
+import json
+import math
+import numpy as np
+from loguru import logger
+from backend.core.utils.utils_filter import COMPARISON_OPERATORS
+
+ANN_STRATEGY = "ann"
+EXACT_STRATEGY = "exact"
+
+# Atlas rejects $vectorSearch stages with more candidates than this
+MAX_NUM_CANDIDATES = 10000
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and not (isinstance(value, float) and math.isnan(value))
+
+
+def _value_key(value: Any) -> str:
+    return str(value.value if isinstance(value, Enum) else value)
+
+
+class FieldStatistics:
+    """
+    Per-field value distributions of the recipe collection, collected at ingest for filter selectivity estimates.
+
+    Numeric fields keep an equi-depth histogram (bin edges at quantiles). Categorical and array fields keep
+    the fraction of recipes containing each value. Filters are estimated assuming independent fields.
+
+    Args:
+        size (int): The number of recipes.
+        numeric (Dict[str, Dict]): Field -> {"edges": quantile bin edges, "non_null": fraction with a value,
+            and for low-cardinality fields "values": value -> fraction}.
+        categorical (Dict[str, Dict[str, float]]): Field -> value -> fraction of recipes containing the value.
+    """
+
+    def __init__(self, size: int, numeric: Dict[str, Dict[str, Any]], categorical: Dict[str, Dict[str, float]]):
+        self.size = size
+        self.numeric = numeric
+        self.categorical = categorical
+
+    @classmethod
+    def build(cls, recipe_data: List[Dict[str, Any]], fields: List[str], bins: int = 32, max_discrete_values: int = 64) -> "FieldStatistics":
+        """
+        Collect histograms for the filterable fields.
+
+        Args:
+            recipe_data (List[Dict]): The recipe dicts as loaded into the collection.
+            fields (List[str]): The filterable fields.
+            bins (int): The number of equi-depth bins per numeric field.
+            max_discrete_values (int): Numeric fields with at most this many distinct values also keep exact value fractions.
+
+        Returns:
+            FieldStatistics: The statistics.
+        """
+        size = len(recipe_data)
+        numeric, categorical = {}, {}
+        for field in fields:
+            values = [recipe.get(field) for recipe in recipe_data]
+            present = [value for value in values if value is not None and not (isinstance(value, float) and math.isnan(value))]
+            if present and all(_is_number(value) for value in present):
+                edges = np.quantile(np.asarray(present, dtype=np.float64), np.linspace(0, 1, bins + 1))
+                numeric[field] = {"edges": edges.tolist(), "non_null": len(present) / max(size, 1)}
+                distinct, counts = np.unique(np.asarray(present, dtype=np.float64), return_counts=True)
+                if len(distinct) <= max_discrete_values:
+                    # Few distinct values (e.g. servings), keep exact fractions
+                    numeric[field]["values"] = {str(float(value)): count / size for value, count in zip(distinct, counts)}
+            else:
+                counts: Dict[str, int] = {}
+                for value in present:
+                    # Count each value once per recipe, arrays follow MongoDB's any-element semantics
+                    for item in set(map(_value_key, value if isinstance(value, (list, tuple)) else [value])):
+                        counts[item] = counts.get(item, 0) + 1
+                categorical[field] = {item: count / max(size, 1) for item, count in counts.items()}
+        return cls(size, numeric, categorical)
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"size": self.size, "numeric": self.numeric, "categorical": self.categorical}, f)
+        logger.info(f"Saved field statistics for {len(self.numeric) + len(self.categorical)} fields to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "FieldStatistics":
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def _numeric_cdf(self, field: str, value: float) -> float:
+        """Estimated fraction of recipes with field <= value, interpolating within the equi-depth bins."""
+        statistics = self.numeric[field]
+        if "values" in statistics:
+            return sum(fraction for item, fraction in statistics["values"].items() if float(item) <= value)
+        edges = np.asarray(statistics["edges"])
+        if value < edges[0]:
+            return 0.0
+        if value >= edges[-1]:
+            return statistics["non_null"]
+        # Each of the len(edges) - 1 bins holds an equal share of the non-null values. Repeated edges
+        # mark a heavy value, so the CDF at it jumps to the last bin ending there.
+        unique_edges = np.unique(edges)
+        positions = (np.searchsorted(edges, unique_edges, side="right") - 1) / (len(edges) - 1)
+        return float(np.interp(value, unique_edges, positions)) * statistics["non_null"]
+
+    def _value_fraction(self, field: str, value: Any) -> float:
+        if field in self.numeric:
+            if not _is_number(value):
+                return 0.0
+            if "values" in self.numeric[field]:
+                return self.numeric[field]["values"].get(str(float(value)), 0.0)
+            # Continuous values rarely repeat, assume a single recipe
+            return 1 / max(self.size, 1)
+        return self.categorical.get(field, {}).get(_value_key(value), 0.0)
+
+    def _field_selectivity(self, field: str, condition: Any) -> float:
+        if field not in self.numeric and field not in self.categorical:
+            # Unknown fields are assumed not to filter anything
+            return 1.0
+        if not isinstance(condition, dict) or not set(condition) <= COMPARISON_OPERATORS:
+            condition = {"$eq": condition}
+        selectivity = 1.0
+        # Range operators narrow one [lower, upper] interval of the CDF
+        lower, upper, has_range = 0.0, None, False
+        for operator, value in condition.items():
+            if operator in ("$gt", "$gte", "$lt", "$lte") and field in self.numeric and _is_number(value):
+                has_range = True
+                if operator in ("$gt", "$gte"):
+                    lower = max(lower, self._numeric_cdf(field, value - (1e-9 if operator == "$gte" else 0)))
+                else:
+                    cdf = self._numeric_cdf(field, value - (1e-9 if operator == "$lt" else 0))
+                    upper = cdf if upper is None else min(upper, cdf)
+            elif operator == "$eq":
+                selectivity *= self._value_fraction(field, value)
+            elif operator == "$ne":
+                selectivity *= 1 - self._value_fraction(field, value)
+            elif operator in ("$in", "$nin"):
+                # P(any value present), assuming values occur independently
+                none_present = float(np.prod([1 - self._value_fraction(field, item) for item in value]))
+                selectivity *= 1 - none_present if operator == "$in" else none_present
+        if has_range:
+            upper = self.numeric[field]["non_null"] if upper is None else upper
+            selectivity *= max(upper - lower, 0.0)
+        return min(max(selectivity, 0.0), 1.0)
+
+    def selectivity(self, mql_filter: Optional[Dict[str, Any]]) -> float:
+        """
+        Estimate the fraction of recipes matching an MQL pre_filter.
+
+        Args:
+            mql_filter (dict): The pre_filter, as built by build_pre_filter.
+
+        Returns:
+            float: The estimated selectivity in [0, 1].
+        """
+        if not mql_filter:
+            return 1.0
+        selectivity = 1.0
+        for key, condition in mql_filter.items():
+            if key == "$and":
+                selectivity *= float(np.prod([self.selectivity(clause) for clause in condition]))
+            elif key == "$or":
+                selectivity *= 1 - float(np.prod([1 - self.selectivity(clause) for clause in condition]))
+            elif key == "$nor":
+                selectivity *= float(np.prod([1 - self.selectivity(clause) for clause in condition]))
+            else:
+                selectivity *= self._field_selectivity(key, condition)
+        return selectivity
+
+
+@dataclass
+class SearchPlan:
+    """The vector search strategy chosen for one query."""
+    strategy: str
+    estimated_selectivity: float
+    estimated_matches: int
+    oversampling_factor: int
+    nprobe_multiplier: float = 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def plan_vector_search(
+    pre_filter: Optional[Dict[str, Any]],
+    top_k: int,
+    statistics: Optional[FieldStatistics],
+    exact_max_matches: int = 2000,
+    base_oversampling_factor: int = 10,
+) -> SearchPlan:
+    """
+    Choose between filtered approximate search and exact scoring of the filtered recipes.
+
+    Approximate search visits top_k * oversampling_factor candidates and then applies the filter, so a filter
+    keeping a fraction s of recipes leaves about s of them. The planner:
+        - scores the filtered recipes exactly when few enough are expected to match (at most exact_max_matches)
+        - otherwise raises the candidate count by 1 / s, so about top_k * base_oversampling_factor survive the filter
+
+    Args:
+        pre_filter (dict): The MQL pre_filter.
+        top_k (int): The number of results requested.
+        statistics (FieldStatistics): The ingest statistics, None plans the default approximate search.
+        exact_max_matches (int): The largest expected filtered set that is scored exactly.
+        base_oversampling_factor (int): The oversampling factor of an unfiltered search.
+
+    Returns:
+        SearchPlan: The chosen plan.
+    """
+    if statistics is None or not pre_filter:
+        return SearchPlan(ANN_STRATEGY, 1.0, statistics.size if statistics else -1, base_oversampling_factor)
+
+    selectivity = statistics.selectivity(pre_filter)
+    estimated_matches = int(math.ceil(selectivity * statistics.size))
+    if estimated_matches <= exact_max_matches:
+        return SearchPlan(EXACT_STRATEGY, selectivity, estimated_matches, base_oversampling_factor)
+
+    multiplier = 1 / max(selectivity, 1e-6)
+    oversampling_factor = int(min(math.ceil(base_oversampling_factor * multiplier), max(MAX_NUM_CANDIDATES // max(top_k, 1), 1)))
+    return SearchPlan(ANN_STRATEGY, selectivity, estimated_matches, max(oversampling_factor, base_oversampling_factor), nprobe_multiplier=multiplier)
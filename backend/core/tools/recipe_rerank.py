@@ -0,0 +1,508 @@
+from typing import Any, AsyncIterator, Awaitable, List, Optional, Tuple
+import asyncio
+import json
+import time
+import threading
+import re
+import numpy as np
+from loguru import logger
+from pydantic import BaseModel, Field
+from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
+from backend.core.utils.utils_llm import ChainCallStatus, ChainResults, apply_chain_to_input_with_status, get_token_count, get_usage_meter
+from backend.core.utils.utils_cache import LRUCache, SQLiteCache, hash_key
+from backend.core.utils.utils_async import aiter_until
+from backend.core.utils.utils_ingredients import canonical_ingredient_ids, recipe_ingredient_ids
+
+# ====================================================================================
+# Aspect filtering - determine if the product matches the customer query
+# ====================================================================================
+ASPECT_SUMMARY_PROMPT = """-- Role --
+    You are an expert chef working for an online recipe recommendation service.
+
+    -- Task --
+    You are given a customer request, and a recipe candidate.
+    Your task is to determine whether or not the recipe is a good match for the customer request.
+
+    -- Instructions --
+        -is_match: The recipe is a match if it contains ANY of the requested ingredients.
+        -match_score: The match score should be calculated (0-100, higher is better) based on the following criteria:
+            1. Match on ingredients, ingredient state and ingredient quantity
+                - Pay attention to the ingredient state. For example, if the customer requests "tomatoes", and the recipe uses "tomato sauce", this is NOT a good match.
+                - If the recipe contains more of the requested ingredients, the match score should be higher.
+                    - If the recipe uses MORE of an ingredient than the customer requested, the match score should be lower, since the customer does not have that much of that ingredient.
+
+            2. Match on description
+                - The description should be relevant to the customer query.
+
+    Customer query: {query}
+    Recipe details: {recipe_candidate}
+    """
+
+
+# Listwise variant - all candidates are judged in one request, so the instructions and query are sent once
+LISTWISE_ASPECT_SUMMARY_PROMPT = """-- Role --
+    You are an expert chef working for an online recipe recommendation service.
+
+    -- Task --
+    You are given a customer request, and a list of recipe candidates, each labelled with a candidate id.
+    Your task is to determine, for EVERY candidate, whether or not the recipe is a good match for the customer request.
+
+    -- Instructions --
+        -candidate_id: The id of the candidate being judged. Return exactly one judgment per candidate id.
+        -is_match: The recipe is a match if it contains ANY of the requested ingredients.
+        -match_score: The match score should be calculated (0-100, higher is better) based on the following criteria:
+            1. Match on ingredients, ingredient state and ingredient quantity
+                - Pay attention to the ingredient state. For example, if the customer requests "tomatoes", and the recipe uses "tomato sauce", this is NOT a good match.
+                - If the recipe contains more of the requested ingredients, the match score should be higher.
+                    - If the recipe uses MORE of an ingredient than the customer requested, the match score should be lower, since the customer does not have that much of that ingredient.
+
+            2. Match on description
+                - The description should be relevant to the customer query.
+        - Judge each candidate on its own merits, do not compare candidates against each other.
+
+    Customer query: {query}
+    Recipe candidates:
+    {recipe_candidates}
+    """
+
+# Cached judgments are only reused while the judge prompts are unchanged
+ASPECT_SUMMARY_PROMPT_VERSION = hash_key(ASPECT_SUMMARY_PROMPT, LISTWISE_ASPECT_SUMMARY_PROMPT)[:16]
+
+POINTWISE_RERANK_MODE = "pointwise"
+LISTWISE_RERANK_MODE = "listwise"
+
+# Candidate token budget and size bound of one listwise sub-batch
+LISTWISE_MAX_TOKENS = 16000
+LISTWISE_MAX_CANDIDATES = 20
+
+# Candidates matched locally past the cutoff score at most this fraction of the lowest LLM-judged match
+LOCAL_MATCH_SCORE_SCALE = 0.9
+
+# A user is waiting on the rerank, so a failing judgment is retried once and then scored as a non-match
+RERANK_MAX_RETRIES = 1
+
+# Reasoning of the non-match fallback of candidates the LLM did not judge before the deadline
+DEADLINE_EXCEEDED_REASONING = "Not judged within the time budget."
+
+
+class RecipeMatch(BaseModel):
+    reasoning: str = Field(description="A short explanation of your reasoning for the customer to read.")
+    is_match: bool = Field(description="Whether or not the product is a match for the customer query. You should return True if any requested ingredients are present in the recipe. If none of the requested ingredients are present, you should return False.")
+    match_score: float = Field(description="The score of the match, between 0 and 100, higher is better.")
+
+
+class CandidateRecipeMatch(RecipeMatch):
+    candidate_id: int = Field(description="The id of the recipe candidate being judged.")
+
+
+class RecipeMatchList(BaseModel):
+    """Judgments for every recipe candidate in the list."""
+    matches: List[CandidateRecipeMatch] = Field(description="One judgment per recipe candidate.")
+
+
+def format_recipe_candidate(document: Document) -> str:
+    """Format a retrieved recipe document as the candidate text shown to the judge."""
+    return document.metadata['title'] + "\n\n" + document.page_content + "\n\n" + document.metadata["display_description"]
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def ingredient_overlap_scores(requested_ingredients: List[str], results: List[Document]) -> np.ndarray:
+    """
+    Score each candidate by the fraction of requested ingredients found in its canonical ingredient ids.
+
+    Both sides are compared as canonical ids (see utils_ingredients), so "roma tomatoes" matches a recipe
+    using "tomato" but not one using "tomato sauce". Recipes indexed before canonical ids were stored are
+    canonicalized from their ingredient names on the fly.
+
+    Args:
+        requested_ingredients (List[str]): The ingredients the user has.
+        results (List[Document]): The retrieved recipes.
+
+    Returns:
+        np.ndarray: The overlap per candidate in [0, 1], or NaN where the recipe has no ingredient metadata.
+    """
+    requested_ids = [ids for ids in map(canonical_ingredient_ids, requested_ingredients) if ids]
+    requested_ids = list({tuple(ids): ids for ids in requested_ids}.values())
+    if not requested_ids:
+        return np.full(len(results), np.nan)
+
+    # Binary candidate x requested-ingredient matrix
+    presence = np.zeros((len(results), len(requested_ids)), dtype=np.float64)
+    has_metadata = np.ones(len(results), dtype=bool)
+    for row, result in enumerate(results):
+        recipe_ids = result.metadata.get("ingredient_ids")
+        if not isinstance(recipe_ids, list) or not recipe_ids:
+            recipe_ingredients = result.metadata.get("ingredients")
+            if not isinstance(recipe_ingredients, list) or not recipe_ingredients:
+                has_metadata[row] = False
+                continue
+            recipe_ids = recipe_ingredient_ids(recipe_ingredients)
+        recipe_ids = set(recipe_ids)
+        columns = [column for column, ids in enumerate(requested_ids) if any(i in recipe_ids for i in ids)]
+        presence[row, columns] = 1.0
+
+    scores = presence.sum(axis=1) / len(requested_ids)
+    scores[~has_metadata] = np.nan
+    return scores
+
+
+class RerankJudgmentCache:
+    """
+    Persistent cache of RecipeMatch judgments keyed by (normalized query, recipe uuid, prompt version).
+
+    Each entry also records a hash of the recipe content it was judged on. If the recipe content
+    changes, e.g. after the collection is reloaded with re-extracted descriptions, the entry is dropped.
+
+    Args:
+        cache_path (str): The SQLite file for the persistent tier.
+        ttl_seconds (float): How long a judgment stays valid.
+        max_entries (int): The maximum number of persisted judgments, least recently used are evicted first.
+        max_memory_entries (int): The size bound of the in-memory LRU in front of SQLite.
+        prompt_version (str): The version of the judge prompt.
+        read_only (bool): If True, recorded judgments are replayed but nothing is written, e.g. for offline evaluation.
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_memory_entries: int = 2048,
+        prompt_version: str = ASPECT_SUMMARY_PROMPT_VERSION,
+        read_only: bool = False,
+    ):
+        self.prompt_version = prompt_version
+        self.memory_cache = LRUCache(max_size=max_memory_entries, ttl_seconds=ttl_seconds)
+        self.disk_cache = SQLiteCache(cache_path, table="rerank_judgments", ttl_seconds=ttl_seconds, max_entries=max_entries, read_only=read_only)
+        self.hits = 0
+        self.misses = 0
+        # Lookups run on worker threads, see aget_many
+        self._stats_lock = threading.Lock()
+
+    def key(self, query: str, recipe_uuid: str) -> str:
+        return hash_key(normalize_query(query), recipe_uuid, self.prompt_version)
+
+    def get(self, query: str, recipe_uuid: str, content_hash: str) -> Optional[RecipeMatch]:
+        key = self.key(query, recipe_uuid)
+        entry = self.memory_cache.get(key)
+        if entry is None:
+            value = self.disk_cache.get(key)
+            entry = json.loads(value) if value is not None else None
+        if entry is None or entry["content_hash"] != content_hash:
+            if entry is not None:
+                # The recipe changed since it was judged
+                self.memory_cache.delete(key)
+                self.disk_cache.delete(key)
+            with self._stats_lock:
+                self.misses += 1
+            return None
+        self.memory_cache.set(key, entry)
+        with self._stats_lock:
+            self.hits += 1
+        return RecipeMatch(**entry["match"])
+
+    def get_many(self, query: str, recipe_uuids: List[str], content_hashes: List[str]) -> List[Optional[RecipeMatch]]:
+        return [self.get(query, recipe_uuid, content_hash) for recipe_uuid, content_hash in zip(recipe_uuids, content_hashes)]
+
+    def set(self, query: str, recipe_uuid: str, content_hash: str, recipe_match: RecipeMatch) -> None:
+        key = self.key(query, recipe_uuid)
+        entry = {"content_hash": content_hash, "match": recipe_match.model_dump()}
+        self.memory_cache.set(key, entry)
+        self.disk_cache.set(key, json.dumps(entry).encode("utf-8"))
+
+    async def aget_many(self, query: str, recipe_uuids: List[str], content_hashes: List[str]) -> List[Optional[RecipeMatch]]:
+        """get_many on a worker thread, so the SQLite reads of a whole candidate list do not block the event loop."""
+        return await asyncio.to_thread(self.get_many, query, recipe_uuids, content_hashes)
+
+    async def aset(self, query: str, recipe_uuid: str, content_hash: str, recipe_match: RecipeMatch) -> None:
+        """set on a worker thread, so the SQLite write and eviction do not block the event loop."""
+        await asyncio.to_thread(self.set, query, recipe_uuid, content_hash, recipe_match)
+
+    def close(self) -> None:
+        self.disk_cache.close()
+
+
+def batch_candidates_by_tokens(recipe_candidates: List[str], max_tokens: int, max_candidates: int) -> List[List[int]]:
+    """
+    Greedily pack candidate positions into sub-batches that fit the token and candidate limits.
+
+    Args:
+        recipe_candidates (List[str]): The formatted candidate texts.
+        max_tokens (int): The maximum number of candidate tokens per sub-batch.
+        max_candidates (int): The maximum number of candidates per sub-batch, bounds the output length.
+
+    Returns:
+        List[List[int]]: The candidate positions in each sub-batch.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for i, recipe_candidate in enumerate(recipe_candidates):
+        tokens = get_token_count(recipe_candidate)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_candidates):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def count_judge_calls(results: List[Document], mode: str = LISTWISE_RERANK_MODE, max_tokens: int = LISTWISE_MAX_TOKENS, max_candidates: int = LISTWISE_MAX_CANDIDATES) -> int:
+    """Count the LLM requests needed to judge the given recipes, ignoring cached judgments and fallbacks."""
+    if mode != LISTWISE_RERANK_MODE or len(results) <= 1:
+        return len(results)
+    return len(batch_candidates_by_tokens([format_recipe_candidate(i) for i in results], max_tokens, max_candidates))
+
+
+async def _indexed(index: Any, awaitable: Awaitable) -> Tuple[Any, Any]:
+    return index, await awaitable
+
+
+async def _astream_pointwise(query: str, recipe_candidates: List[str], model: Any, hedge_percentile: Optional[float] = None) -> AsyncIterator[Tuple[int, RecipeMatch, ChainCallStatus]]:
+    prompt = PromptTemplate(template=ASPECT_SUMMARY_PROMPT, input_variables=["query", "recipe_details"])
+    chain = prompt | model.with_structured_output(RecipeMatch)
+    callbacks = [get_usage_meter().callback("rerank", RecipeMatch.__name__)]
+    # No LLMResponseCache here, judgments are already stored in the RerankJudgmentCache
+    tasks = [
+        asyncio.ensure_future(_indexed(i, apply_chain_to_input_with_status(
+            chain, {"query": query, "recipe_candidate": recipe_candidate}, default_model=RecipeMatch, max_retries=RERANK_MAX_RETRIES, callbacks=callbacks,
+            hedge_percentile=hedge_percentile,
+        )))
+        for i, recipe_candidate in enumerate(recipe_candidates)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            i, (recipe_match, status) = await task
+            yield i, recipe_match, status
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _astream_listwise(query: str, recipe_candidates: List[str], model: Any, max_tokens: int, max_candidates: int, hedge_percentile: Optional[float] = None) -> AsyncIterator[Tuple[int, RecipeMatch, ChainCallStatus]]:
+    prompt = PromptTemplate(template=LISTWISE_ASPECT_SUMMARY_PROMPT, input_variables=["query", "recipe_candidates"])
+    chain = prompt | model.with_structured_output(RecipeMatchList)
+
+    callbacks = [get_usage_meter().callback("rerank", RecipeMatchList.__name__)]
+    # No LLMResponseCache here, judgments are already stored in the RerankJudgmentCache
+    # The tokenizer runs synchronously, so count tokens on a worker thread instead of blocking the event loop
+    batches = await asyncio.to_thread(batch_candidates_by_tokens, recipe_candidates, max_tokens, max_candidates)
+    tasks = [
+        asyncio.ensure_future(_indexed(batch_number, apply_chain_to_input_with_status(chain, {
+            "query": query,
+            "recipe_candidates": "\n\n".join(f"[Candidate {i}]\n{recipe_candidates[i]}" for i in batch),
+        }, default_model=RecipeMatchList, max_retries=RERANK_MAX_RETRIES, callbacks=callbacks,
+           hedge_percentile=hedge_percentile)))
+        for batch_number, batch in enumerate(batches)
+    ]
+    missing = []
+    try:
+        # Yield each sub-batch as soon as it is judged
+        for task in asyncio.as_completed(tasks):
+            # A failed sub-batch comes back as an empty match list, so all of it falls back to pointwise below
+            batch_number, (match_list, _) = await task
+            batch = batches[batch_number]
+            judged = set()
+            for candidate_match in match_list.matches:
+                # Ignore ids the model invented, repeated or took from another sub-batch
+                if candidate_match.candidate_id in batch and candidate_match.candidate_id not in judged:
+                    judged.add(candidate_match.candidate_id)
+                    yield candidate_match.candidate_id, RecipeMatch(**candidate_match.model_dump(exclude={"candidate_id"})), ChainCallStatus.OK
+            missing.extend(i for i in batch if i not in judged)
+    finally:
+        for task in tasks:
+            task.cancel()
+    logger.info(f"Listwise rerank judged {len(recipe_candidates)} candidates in {len(batches)} requests")
+
+    # Fall back to one call per candidate for anything the listwise response missed
+    if missing:
+        logger.warning(f"Listwise rerank missed {len(missing)} of {len(recipe_candidates)} candidates, judging them individually")
+        async for position, recipe_match, status in _astream_pointwise(query, [recipe_candidates[i] for i in missing], model, hedge_percentile):
+            yield missing[position], recipe_match, status
+
+
+async def astream_judge_recipes(
+    query: str,
+    results: List[Document],
+    model: Any,
+    cache: Optional[RerankJudgmentCache] = None,
+    mode: str = LISTWISE_RERANK_MODE,
+    listwise_max_tokens: int = LISTWISE_MAX_TOKENS,
+    listwise_max_candidates: int = LISTWISE_MAX_CANDIDATES,
+    deadline_seconds: Optional[float] = None,
+    hedge_percentile: Optional[float] = None,
+) -> AsyncIterator[Tuple[int, RecipeMatch, ChainCallStatus]]:
+    """
+    Judge every given recipe against the query with the LLM, yielding (position, RecipeMatch, status) as judgments arrive.
+
+    Cached judgments are yielded first, then LLM judgments in completion order. Candidates still unjudged at
+    the deadline are yielded last as non-matches with the DEADLINE_EXCEEDED status, and are not cached.
+
+    Args:
+        query (str): The user's query.
+        results (List[Document]): The recipes to judge.
+        model (Any): The chat model used as the judge.
+        cache (RerankJudgmentCache): Optional judgment cache.
+        mode (str): "listwise" judges all candidates in one structured call per sub-batch,
+            "pointwise" makes one call per candidate.
+        listwise_max_tokens (int): The candidate token budget of a listwise sub-batch.
+        listwise_max_candidates (int): The maximum number of candidates in a listwise sub-batch.
+        deadline_seconds (float): The time budget of the LLM judgments, None waits for every judgment.
+        hedge_percentile (float): Hedge judge calls slower than this latency percentile, None never hedges.
+
+    Yields:
+        Tuple[int, RecipeMatch, ChainCallStatus]: The position of the judged result, its judgment and how the
+            judgment ended. Anything but OK means the judgment is a fallback.
+    """
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
+    recipe_candidates = [format_recipe_candidate(i) for i in results]
+    content_hashes = [hash_key(recipe_candidate) for recipe_candidate in recipe_candidates]
+    recipe_uuids = [i.metadata.get("uuid") or content_hash for i, content_hash in zip(results, content_hashes)]
+
+    cached_matches = await cache.aget_many(query, recipe_uuids, content_hashes) if cache is not None else [None] * len(results)
+    uncached = []
+    for i, recipe_match in enumerate(cached_matches):
+        if recipe_match is None:
+            uncached.append(i)
+        else:
+            yield i, recipe_match, ChainCallStatus.OK
+    if cache is not None:
+        logger.info(f"Rerank cache: {len(results) - len(uncached)} hits, {len(uncached)} misses")
+    if not uncached:
+        return
+
+    uncached_candidates = [recipe_candidates[i] for i in uncached]
+    if mode == LISTWISE_RERANK_MODE and len(uncached) > 1:
+        judgments = _astream_listwise(query, uncached_candidates, model, listwise_max_tokens, listwise_max_candidates, hedge_percentile)
+    else:
+        judgments = _astream_pointwise(query, uncached_candidates, model, hedge_percentile)
+    judged = set()
+    async for position, recipe_match, status in aiter_until(judgments, deadline):
+        i = uncached[position]
+        judged.add(i)
+        # Failed calls come back as empty default models, which must not be cached
+        if cache is not None and status == ChainCallStatus.OK:
+            await cache.aset(query, recipe_uuids[i], content_hashes[i], recipe_match)
+        yield i, recipe_match, status
+
+    stragglers = [i for i in uncached if i not in judged]
+    if stragglers:
+        logger.warning(f"Rerank deadline of {deadline_seconds:.1f}s passed, {len(stragglers)} of {len(uncached)} candidates were not judged")
+    for i in stragglers:
+        yield i, RecipeMatch(reasoning=DEADLINE_EXCEEDED_REASONING, is_match=False, match_score=0.0), ChainCallStatus.DEADLINE_EXCEEDED
+
+
+async def judge_recipes(query: str, results: List[Document], model: Any, cache: Optional[RerankJudgmentCache] = None, **kwargs: Any) -> ChainResults:
+    """
+    Judge every given recipe against the query with the LLM, see astream_judge_recipes for the arguments.
+
+    Returns:
+        ChainResults: One judgment per result, in the same order, with the status of each judgment.
+    """
+    recipe_matches: List[Optional[RecipeMatch]] = [None] * len(results)
+    statuses: List[Optional[ChainCallStatus]] = [None] * len(results)
+    async for i, recipe_match, status in astream_judge_recipes(query, results, model, cache, **kwargs):
+        recipe_matches[i], statuses[i] = recipe_match, status
+    return ChainResults(recipe_matches, statuses)
+
+
+async def astream_rerank_recipes(
+    query: str,
+    results: List[Document],
+    model: Any,
+    cache: Optional[RerankJudgmentCache] = None,
+    requested_ingredients: Optional[List[str]] = None,
+    llm_cutoff: Optional[int] = None,
+    mode: str = LISTWISE_RERANK_MODE,
+    deadline_seconds: Optional[float] = None,
+    hedge_percentile: Optional[float] = None,
+) -> AsyncIterator[Tuple[int, RecipeMatch, ChainCallStatus]]:
+    """
+    Judge every retrieved recipe against the query, pruning candidates with a cheap ingredient check first.
+
+    When requested_ingredients are given, a deterministic cascade runs before the LLM judge:
+        1. Candidates containing none of the requested ingredients fail the "ANY requested ingredient" rule
+           and are rejected locally.
+        2. The remaining candidates are ordered by ingredient overlap and only the top llm_cutoff are sent
+           to the LLM judge.
+        3. Candidates past the cutoff contain a requested ingredient, so they are matched locally, with an
+           overlap score below every LLM-judged match.
+    Candidates of unknown overlap, without ingredient metadata or when no requested ingredient canonicalizes,
+    are always sent to the LLM, even past the cutoff.
+
+    Args:
+        query (str): The user's query.
+        results (List[Document]): The retrieved recipes.
+        model (Any): The chat model used as the judge.
+        cache (RerankJudgmentCache): Optional judgment cache.
+        requested_ingredients (List[str]): The user's ingredients, enables the cascade.
+        llm_cutoff (int): The maximum number of candidates sent to the LLM. None sends every plausible candidate.
+        mode (str): "listwise" or "pointwise" LLM judging, see astream_judge_recipes.
+        deadline_seconds (float): The time budget of the LLM judgments, see astream_judge_recipes.
+        hedge_percentile (float): Hedge judge calls slower than this latency percentile, None never hedges.
+
+    Yields:
+        Tuple[int, RecipeMatch, ChainCallStatus]: The position of the judged result, its judgment and its status,
+            in completion order. Local decisions are OK.
+    """
+    judge_kwargs = {"mode": mode, "deadline_seconds": deadline_seconds, "hedge_percentile": hedge_percentile}
+    if not requested_ingredients:
+        async for i, recipe_match, status in astream_judge_recipes(query, results, model, cache, **judge_kwargs):
+            yield i, recipe_match, status
+        return
+
+    overlap = ingredient_overlap_scores(requested_ingredients, results)
+    for i in np.flatnonzero(overlap == 0):
+        yield int(i), RecipeMatch(reasoning="The recipe does not contain any of the requested ingredients.", is_match=False, match_score=0.0), ChainCallStatus.OK
+
+    # Candidates of unknown overlap always reach the judge, the cutoff only trims the scored ones, best first
+    unknown = [int(i) for i in np.flatnonzero(np.isnan(overlap))]
+    scored = sorted(np.flatnonzero(overlap > 0).tolist(), key=lambda i: -overlap[i])
+    if llm_cutoff is not None:
+        n_scored = max(llm_cutoff - len(unknown), 0)
+        llm_candidates, local_candidates = unknown + scored[:n_scored], scored[n_scored:]
+    else:
+        llm_candidates, local_candidates = unknown + scored, []
+
+    llm_scores = []
+    async for position, recipe_match, status in astream_judge_recipes(query, [results[i] for i in llm_candidates], model, cache, **judge_kwargs):
+        if recipe_match.is_match and status == ChainCallStatus.OK:
+            llm_scores.append(recipe_match.match_score)
+        yield llm_candidates[position], recipe_match, status
+
+    # Candidates past the cutoff contain a requested ingredient, so they match, ranked after every LLM-judged match
+    score_ceiling = min(llm_scores, default=100.0) * LOCAL_MATCH_SCORE_SCALE
+    for i in local_candidates:
+        yield i, RecipeMatch(
+            reasoning=f"The recipe contains {overlap[i]:.0%} of the requested ingredients.",
+            is_match=True,
+            match_score=float(overlap[i]) * score_ceiling,
+        ), ChainCallStatus.OK
+
+    # In listwise mode many candidates share one request, so count requests rather than candidates
+    all_calls, llm_calls = await asyncio.gather(
+        asyncio.to_thread(count_judge_calls, results, mode),
+        asyncio.to_thread(count_judge_calls, [results[i] for i in llm_candidates], mode),
+    )
+    logger.info(
+        f"Cascade rerank: {len(results) - len(llm_candidates)} of {len(results)} candidates decided locally, "
+        f"saved {all_calls - llm_calls} of {all_calls} LLM calls"
+    )
+
+
+async def rerank_recipes(query: str, results: List[Document], model: Any, cache: Optional[RerankJudgmentCache] = None, **kwargs: Any) -> ChainResults:
+    """
+    Judge every retrieved recipe against the query, see astream_rerank_recipes for the arguments.
+
+    Returns:
+        ChainResults: One judgment per result, in the same order, with the status of each judgment.
+    """
+    recipe_matches: List[Optional[RecipeMatch]] = [None] * len(results)
+    statuses: List[Optional[ChainCallStatus]] = [None] * len(results)
+    async for i, recipe_match, status in astream_rerank_recipes(query, results, model, cache, **kwargs):
+        recipe_matches[i], statuses[i] = recipe_match, status
+    return ChainResults(recipe_matches, statuses)
@@ -1,63 +1,200 @@
 from loguru import logger
-from pydantic import BaseModel, Field
 from backend.core.env import PROJECT_ID, LOCATION
 from backend.core.env import MONGODB_ATLAS_CLUSTER_URI, RECIPE_VECTOR_INDEX_NAME, RECIPE_FULLTEXT_SEARCH_INDEX_NAME
-from langchain.prompts import PromptTemplate
-from backend.core.utils.utils_llm import run_chain_on_inputs, create_gemini_llm_client
-from langchain_mongodb import MongoDBAtlasVectorSearch
-from langchain_mongodb.retrievers.hybrid_search import MongoDBAtlasHybridSearchRetriever
-from backend.core.utils.utils_mongodb import get_mongodb_collection
+from backend.core.env import RECIPE_SEARCH_BACKEND, LOCAL_RECIPE_INDEX_PATH, INGREDIENT_VOCABULARY_PATH
+from backend.core.env import RECIPE_FIELD_STATISTICS_PATH, RECIPE_EXACT_SEARCH_MAX_MATCHES
+from backend.core.env import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE
+from backend.core.env import RECIPE_DEDUPE_OVERFETCH
+from backend.core.env import RECIPE_FANOUT_ENABLED, RECIPE_FANOUT_GROUP_SIZE, RECIPE_FANOUT_MAX_SUBQUERIES, RECIPE_FANOUT_CONCURRENCY
+from backend.core.env import RESULT_CACHE_SIMILARITY_THRESHOLD, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, DATASET_VERSION_CHECK_SECONDS
+from backend.core.env import RERANK_CACHE_PATH, RERANK_CACHE_TTL_SECONDS, RERANK_CACHE_MAX_ENTRIES, RERANK_LLM_CUTOFF, RERANK_MODE
+from backend.core.env import LLM_INTERACTIVE_DEADLINE_SECONDS, LLM_HEDGE_PERCENTILE
+from backend.core.utils.utils_llm import ChainCallStatus, get_gemini_llm_client
+from backend.core.utils.utils_mongodb import get_async_mongodb_collection, aclose_async_mongodb_clients
+from backend.core.utils.utils_async import run_sync
+from backend.core.tools.local_vector_search import LocalVectorSearch
+from backend.core.tools.local_fulltext_search import LocalBM25Index
+from backend.core.tools.hybrid_search import amongodb_hybrid_search, local_hybrid_search, reciprocal_rank_fusion
+from backend.core.tools.query_planner import EXACT_STRATEGY, FieldStatistics, SearchPlan, plan_vector_search
+from backend.core.utils.utils_embeddings import CachedEmbeddings
+from backend.core.utils.utils_cache import SemanticCache
+from backend.core.utils.utils_ingredients import IngredientVocabulary, canonicalize_ingredient
+from backend.core.utils.utils_dedupe import collapse_by_cluster
+from backend.core.tools.recipe_rerank import RecipeMatch, RerankJudgmentCache, rerank_recipes, astream_rerank_recipes
 from langchain_google_vertexai import VertexAIEmbeddings
-from loguru import logger
 from langchain_core.documents import Document
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Optional
+from dataclasses import dataclass
+from pathlib import Path
 import asyncio
+import json
+import math
+import threading
+import time
 
-recipe_mongodb_collection = get_mongodb_collection(MONGODB_ATLAS_CLUSTER_URI, "savour", "reddit_recipe_data")
-
-embeddings = VertexAIEmbeddings(model="textembedding-gecko@003", project=PROJECT_ID, location=LOCATION)
-vector_store = MongoDBAtlasVectorSearch(
-    collection=recipe_mongodb_collection,
-    embedding=embeddings,
-    index_name=RECIPE_VECTOR_INDEX_NAME,
-    relevance_score_fn="cosine",
-)
+RECIPE_DB_NAME = "savour"
+RECIPE_COLLECTION_NAME = "reddit_recipe_data"
+RECIPE_FULLTEXT_PENALTY = 50
+RECIPE_VECTOR_PENALTY = 50
+RECIPE_FANOUT_PENALTY = 50
 
-retriever = MongoDBAtlasHybridSearchRetriever(
-    vectorstore = vector_store,
-    search_index_name = RECIPE_FULLTEXT_SEARCH_INDEX_NAME,
-    top_k = 15,
-    fulltext_penalty = 50,
-    vector_penalty = 50
-)
+class RecipeSearchService:
+    """
+    Lazily built, thread-safe holder of the clients and indexes behind recipe search.
 
+    Nothing is constructed at import. Each component is built on first use, under a lock so concurrent
+    first searches build it once. Call warmup() to build everything up front, e.g. on a background
+    thread at app start, and close() to release the caches and database clients.
 
-def retrieve_recipes(query:str, 
-                     k:int = 10, 
-                     servings:int = 0, 
-                     max_total_time:int = 0, 
-                     ingredients:list[str] = [],
-                     meal_types:list[str] = [],
-                     course_types:list[str] = [],
-                     dietary_restrictions:list[str] = [],
-                     difficulty_level:list[str] = []) -> list[Document]:
-    """
-    Retrieve recipes from the database based on the user's query and filters.
-    
     Args:
-        query (str): The user's query.
-        k (int): The number of recipes to retrieve.
-        servings (int): The number of servings the recipe should make.
-        max_total_time (int): The maximum total time the recipe should take.
-        ingredients (list[str]): The ingredients the user wants to use.
-        meal_types (list[str]): The meal types the user wants to use.
-        course_types (list[str]): The course types the user wants to use.
-        dietary_restrictions (list[str]): The dietary restrictions the user wants to use.
-        difficulty_level (list[str]): The difficulty level the user wants to use.
-
-    Returns:
-        list[Document]: The recipes that match the user's query and filters.
+        backend (str): "mongodb" for Atlas hybrid search, "local" for the in-process indexes.
+        index_path (str): The local index directory, used by the local backend.
+        vocabulary_path (str): The canonical ingredient vocabulary written at ingest.
+        statistics_path (str): The filter field statistics written at ingest, used to plan filtered searches.
     """
-    retriever.top_k = k
+
+    def __init__(self,
+                 backend: str = RECIPE_SEARCH_BACKEND,
+                 index_path: str = LOCAL_RECIPE_INDEX_PATH,
+                 vocabulary_path: str = INGREDIENT_VOCABULARY_PATH,
+                 statistics_path: str = RECIPE_FIELD_STATISTICS_PATH):
+        self.backend = backend
+        self.index_path = index_path
+        self.vocabulary_path = vocabulary_path
+        self.statistics_path = statistics_path
+        self._lock = threading.RLock()
+        self._components: Dict[str, Any] = {}
+        self._dataset_version: Optional[str] = None
+        self._dataset_version_checked_at: Optional[float] = None
+
+    def _get(self, name: str, build: Callable[[], Any]) -> Any:
+        # Fast path without the lock once the component exists
+        if name in self._components:
+            return self._components[name]
+        with self._lock:
+            if name not in self._components:
+                logger.info(f"Initializing recipe search {name}")
+                self._components[name] = build()
+            return self._components[name]
+
+    @property
+    def embeddings(self) -> CachedEmbeddings:
+        # Query prompts repeat heavily, so the embeddings are cached in memory and on disk
+        return self._get("embeddings", lambda: CachedEmbeddings(
+            VertexAIEmbeddings(model="textembedding-gecko@003", project=PROJECT_ID, location=LOCATION),
+            cache_path=EMBEDDING_CACHE_PATH,
+            max_memory_entries=EMBEDDING_CACHE_SIZE,
+        ))
+
+    @property
+    def vector_store(self) -> Optional[LocalVectorSearch]:
+        # In-process index built by recipe_data_to_local_index, no network round trip for retrieval
+        return self._get("vector_store", lambda: LocalVectorSearch.load(self.index_path, self.embeddings) if self.backend == "local" else None)
+
+    @property
+    def fulltext_index(self) -> Optional[LocalBM25Index]:
+        # BM25 index over the same documents, turns the local search into a hybrid search when present
+        return self._get("fulltext_index", lambda: LocalBM25Index.load(self.index_path)
+                         if self.backend == "local" and LocalBM25Index.exists(self.index_path) else None)
+
+    @property
+    def ingredient_vocabulary(self) -> Optional[IngredientVocabulary]:
+        def build() -> Optional[IngredientVocabulary]:
+            if Path(self.vocabulary_path).exists():
+                return IngredientVocabulary.load(self.vocabulary_path)
+            logger.warning(f"Ingredient vocabulary not found at {self.vocabulary_path}, falling back to exact ingredient name filters")
+            return None
+        return self._get("ingredient_vocabulary", build)
+
+    @property
+    def field_statistics(self) -> Optional[FieldStatistics]:
+        def build() -> Optional[FieldStatistics]:
+            if Path(self.statistics_path).exists():
+                return FieldStatistics.load(self.statistics_path)
+            logger.warning(f"Field statistics not found at {self.statistics_path}, filtered searches use the default plan")
+            return None
+        return self._get("field_statistics", build)
+
+    @property
+    def rerank_cache(self) -> RerankJudgmentCache:
+        # Judgments for the same (query, recipe, prompt) are reused across searches
+        return self._get("rerank_cache", lambda: RerankJudgmentCache(
+            cache_path=RERANK_CACHE_PATH,
+            ttl_seconds=RERANK_CACHE_TTL_SECONDS,
+            max_entries=RERANK_CACHE_MAX_ENTRIES,
+        ))
+
+    @property
+    def result_cache(self) -> SemanticCache:
+        # Paraphrased searches with the same filters reuse the ranked recipes of an earlier search
+        return self._get("result_cache", lambda: SemanticCache(
+            threshold=RESULT_CACHE_SIMILARITY_THRESHOLD,
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+        ))
+
+    async def adataset_version(self) -> Optional[str]:
+        """
+        Return the version of the loaded recipe data, recorded at ingest.
+
+        The Atlas record is re-read at most every DATASET_VERSION_CHECK_SECONDS, so a reload of the
+        collection invalidates cached results without restarting the app.
+        """
+        if self.backend == "local":
+            return self.vector_store.dataset_version
+        now = time.monotonic()
+        if self._dataset_version_checked_at is None or now - self._dataset_version_checked_at > DATASET_VERSION_CHECK_SECONDS:
+            record = await self.collection().database["dataset_versions"].find_one({"_id": RECIPE_COLLECTION_NAME})
+            self._dataset_version = record["version"] if record else None
+            self._dataset_version_checked_at = now
+        return self._dataset_version
+
+    def collection(self) -> Any:
+        """Return the recipe collection on the AsyncMongoClient of the running event loop."""
+        return get_async_mongodb_collection(MONGODB_ATLAS_CLUSTER_URI, RECIPE_DB_NAME, RECIPE_COLLECTION_NAME)
+
+    def warmup(self) -> None:
+        """Build every component and connect to the database, so the first search pays no startup cost."""
+        _ = self.embeddings, self.vector_store, self.fulltext_index, self.ingredient_vocabulary, self.field_statistics
+        _ = self.rerank_cache, self.result_cache
+        if self.backend != "local":
+            # Searches from sync code run on the shared background loop, so connect that loop's client
+            run_sync(self.collection().database.command("ping"))
+        logger.info("Recipe search warmed up")
+
+    def close(self) -> None:
+        """Close the caches and database clients. The service rebuilds them if it is used again."""
+        with self._lock:
+            components, self._components = self._components, {}
+            self._dataset_version_checked_at = None
+        for name in ("embeddings", "rerank_cache"):
+            if components.get(name) is not None:
+                components[name].close()
+        if self.backend != "local":
+            run_sync(aclose_async_mongodb_clients())
+
+
+recipe_search_service = RecipeSearchService()
+
+
+@dataclass
+class RecipeSearchUpdate:
+    """A single rerank judgment from astream_recipes, with the running ordering of matches so far."""
+    document: Document
+    recipe_match: RecipeMatch
+    top_results: list[Document]
+    completed: int
+    total: int
+
+
+def build_pre_filter(servings: int = 0,
+                     max_total_time: int = 0,
+                     ingredients: list[str] = [],
+                     meal_types: list[str] = [],
+                     course_types: list[str] = [],
+                     dietary_restrictions: list[str] = [],
+                     difficulty_level: list[str] = []) -> Dict[str, Any]:
+    """Build the MQL pre_filter shared by the Atlas and local search backends."""
     pre_filter = {}
     if servings:
         pre_filter["servings"] = {"$gt": servings}
@@ -70,57 +207,196 @@ def retrieve_recipes(query:str,
     if dietary_restrictions:
         pre_filter["dietary_restrictions"] = {"$in": dietary_restrictions}
     if ingredients:
-        pre_filter["ingredient_names"] = {"$in": ingredients}
+        ingredient_vocabulary = recipe_search_service.ingredient_vocabulary
+        if ingredient_vocabulary is not None:
+            # Exact match on canonical ids, so "Tomatoes", "tomato" and "roma tomatoes" all hit the same recipes
+            ingredient_ids = ingredient_vocabulary.ids(ingredients)
+            if len(ingredient_ids) < len(ingredients):
+                logger.info(f"Ingredients not in the recipe corpus: {[i for i in ingredients if ingredient_vocabulary.normalize(i) is None]}")
+            # An empty $in matches nothing, so ingredients unknown to the corpus leave the search unfiltered
+            if ingredient_ids:
+                pre_filter["ingredient_ids"] = {"$in": ingredient_ids}
+        else:
+            pre_filter["ingredient_names"] = {"$in": ingredients}
     if difficulty_level:
         pre_filter["difficulty_level"] = {"$in": difficulty_level}
+    return pre_filter
 
 
-    retriever.pre_filter = pre_filter
+def plan_recipe_search(pre_filter: Optional[Dict[str, Any]], k: int) -> SearchPlan:
+    """
+    Choose the vector search strategy for a filtered recipe search from the ingest field statistics.
 
-    logger.info(f"Retrieving recipes for query: {query}")
-    results = retriever.invoke(query)
+    Args:
+        pre_filter (dict): MQL match expression applied before ranking.
+        k (int): The number of recipes to retrieve.
 
+    Returns:
+        SearchPlan: The chosen plan.
+    """
+    plan = plan_vector_search(pre_filter, k, recipe_search_service.field_statistics, exact_max_matches=RECIPE_EXACT_SEARCH_MAX_MATCHES)
+    logger.info(f"Recipe search plan: {plan.to_dict()}")
+    return plan
 
-    # ====================================================================================
-    # Aspect filtering - determine if the product matches the customer query
-    # ====================================================================================
-    aspect_summary_prompt = """-- Role --
-    You are an expert chef working for an online recipe recommendation service.
 
-    -- Task --
-    You are given a customer request, and a recipe candidate.
-    Your task is to determine whether or not the recipe is a good match for the customer request.
+async def asearch_recipes(query: str, k: int, pre_filter: Optional[Dict[str, Any]] = None) -> list[Document]:
+    """
+    Run the first-stage recipe search on the configured backend.
 
-    -- Instructions --
-        -is_match: The recipe is a match if it contains ANY of the requested ingredients.
-        -match_score: The match score should be calculated (0-100, higher is better) based on the following criteria:
-            1. Match on ingredients, ingredient state and ingredient quantity
-                - Pay attention to the ingredient state. For example, if the customer requests "tomatoes", and the recipe uses "tomato sauce", this is NOT a good match.
-                - If the recipe contains more of the requested ingredients, the match score should be higher.
-                    - If the recipe uses MORE of an ingredient than the customer requested, the match score should be lower, since the customer does not have that much of that ingredient.
+    Every parameter is local to the call, so concurrent searches cannot see each other's filters.
+    The strategy chosen by plan_recipe_search is recorded on each result as metadata["search_plan"].
 
-            2. Match on description
-                - The description should be relevant to the customer query.
+    Args:
+        query (str): The user's query.
+        k (int): The number of recipes to retrieve.
+        pre_filter (dict): MQL match expression applied before ranking.
+
+    Returns:
+        list[Document]: The retrieved recipes, best first.
+    """
+    service = recipe_search_service
+    plan = plan_recipe_search(pre_filter, k)
+    exact = plan.strategy == EXACT_STRATEGY
+    query_vector = await service.embeddings.aembed_query(query)
+    if service.backend == "local":
+        vector_store = service.vector_store
+        # Selective filters leave fewer matches per IVF partition, so more partitions are scored (capped at the partition count)
+        nprobe = math.ceil(vector_store.nprobe * plan.nprobe_multiplier)
+        if service.fulltext_index is not None:
+            documents = await asyncio.to_thread(
+                local_hybrid_search,
+                vector_store,
+                service.fulltext_index,
+                query,
+                query_vector,
+                top_k=k,
+                pre_filter=pre_filter,
+                vector_penalty=RECIPE_VECTOR_PENALTY,
+                fulltext_penalty=RECIPE_FULLTEXT_PENALTY,
+                nprobe=nprobe,
+                exact=exact,
+            )
+        else:
+            results = await asyncio.to_thread(vector_store.similarity_search_by_vector_with_score, query_vector, k, pre_filter, nprobe=nprobe, exact=exact)
+            documents = []
+            for document, score in results:
+                document.metadata["vector_score"] = score
+                documents.append(document)
+    else:
+        documents = await amongodb_hybrid_search(
+            service.collection(),
+            query,
+            query_vector,
+            vector_index_name=RECIPE_VECTOR_INDEX_NAME,
+            fulltext_index_name=RECIPE_FULLTEXT_SEARCH_INDEX_NAME,
+            top_k=k,
+            pre_filter=pre_filter,
+            vector_penalty=RECIPE_VECTOR_PENALTY,
+            fulltext_penalty=RECIPE_FULLTEXT_PENALTY,
+            oversampling_factor=plan.oversampling_factor,
+            exact=exact,
+        )
+    for document in documents:
+        document.metadata["search_plan"] = plan.strategy
+    return documents
+
+
+def ingredient_subqueries(ingredients: list[str],
+                          group_size: int = RECIPE_FANOUT_GROUP_SIZE,
+                          max_subqueries: int = RECIPE_FANOUT_MAX_SUBQUERIES) -> list[str]:
+    """
+    Split a pantry into ingredient-group sub-queries, so recipes built around a few of the ingredients are found.
 
-    Customer query: {query}
-    Recipe details: {recipe_candidate}
+    Ingredients are deduplicated on their canonical form and dealt round-robin into at most max_subqueries groups
+    of about group_size, so every ingredient is searched when the pantry is larger than the groups allow.
+
+    Args:
+        ingredients (list[str]): The pantry ingredients.
+        group_size (int): The target number of ingredients per sub-query.
+        max_subqueries (int): The maximum number of sub-queries.
+
+    Returns:
+        list[str]: The sub-queries, empty if the pantry fits in a single group.
     """
+    unique_ingredients = {}
+    for ingredient in ingredients:
+        unique_ingredients.setdefault(canonicalize_ingredient(ingredient) or ingredient.lower(), ingredient)
+    ingredients = list(unique_ingredients.values())
+    n_groups = min(math.ceil(len(ingredients) / max(group_size, 1)), max_subqueries)
+    if n_groups <= 1:
+        return []
+    groups = [ingredients[i::n_groups] for i in range(n_groups)]
+    return [f"A recipe made with {', '.join(group)}" for group in groups]
 
-    prompt = PromptTemplate(template=aspect_summary_prompt, input_variables=["query", "recipe_details"])
 
+async def asearch_fanout_recipes(query: str,
+                                 subqueries: list[str],
+                                 k: int,
+                                 pre_filter: Optional[Dict[str, Any]] = None,
+                                 max_concurrency: int = RECIPE_FANOUT_CONCURRENCY) -> list[Document]:
+    """
+    Search the full query and each sub-query concurrently and fuse the result lists with Reciprocal Rank Fusion.
 
-    class RecipeMatch(BaseModel):
-        reasoning: str = Field(description="A short explanation of your reasoning for the customer to read.")
-        is_match: bool = Field(description="Whether or not the product is a match for the customer query. You should return True if any requested ingredients are present in the recipe. If none of the requested ingredients are present, you should return False.")
-        match_score: float = Field(description="The score of the match, between 0 and 100, higher is better.")
+    Every search uses the same pre_filter and the loop's shared database client. A semaphore caps the searches
+    of this call in flight at once, so a large pantry cannot multiply the load of one request.
 
-    model = create_gemini_llm_client(project_id=PROJECT_ID, location=LOCATION, model_name="gemini-1.5-pro-002")
-    chain = prompt | model.with_structured_output(RecipeMatch)
+    Args:
+        query (str): The user's query.
+        subqueries (list[str]): The sub-queries, e.g. from ingredient_subqueries.
+        k (int): The number of recipes to return, and to retrieve per search.
+        pre_filter (dict): MQL match expression applied before ranking.
+        max_concurrency (int): The maximum number of searches of this call running at once.
 
-    # Prepare the chain inputs
-    recipe_candidates = [i.metadata['title'] + "\n\n" + i.page_content + "\n\n" + i.metadata["display_description"] for i in results]
-    chain_inputs = [{"query":query, "recipe_candidate":recipe_candidate} for recipe_candidate in recipe_candidates]
-    recipe_matches, _, _, _ = asyncio.run(run_chain_on_inputs(chain, chain_inputs, default_model=RecipeMatch))
+    Returns:
+        list[Document]: The fused results, best first, with one "fanout_score_<i>" field per search.
+    """
+    semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+    async def search(search_query: str) -> list[Document]:
+        async with semaphore:
+            return await asearch_recipes(search_query, k, pre_filter)
+
+    start = time.perf_counter()
+    result_lists = await asyncio.gather(*(search(search_query) for search_query in [query, *subqueries]))
+    # The full query is list 0, so a recipe it ranks first wins ties against sub-query-only hits
+    ranked_lists = {f"fanout_score_{i}": results for i, results in enumerate(result_lists)}
+    fused = reciprocal_rank_fusion(ranked_lists, {name: RECIPE_FANOUT_PENALTY for name in ranked_lists}, top_k=k)
+    logger.info(f"Fanned out {len(subqueries)} sub-queries in {time.perf_counter() - start:.2f}s, "
+                f"fused {sum(len(results) for results in result_lists)} hits into {len(fused)} recipes")
+    return fused
+
+
+async def asearch_unique_recipes(query: str,
+                                 k: int,
+                                 pre_filter: Optional[Dict[str, Any]] = None,
+                                 subqueries: Optional[list[str]] = None) -> list[Document]:
+    """
+    Search with overfetch and keep one recipe per near-duplicate cluster, so k distinct recipes reach the rerank.
+
+    Args:
+        query (str): The user's query.
+        k (int): The number of distinct recipes to return.
+        pre_filter (dict): MQL match expression applied before ranking.
+        subqueries (list[str]): Sub-queries searched alongside the query and fused with it, see asearch_fanout_recipes.
+
+    Returns:
+        list[Document]: At most k recipes from different clusters, best first.
+    """
+    n_results = max(k, int(k * RECIPE_DEDUPE_OVERFETCH))
+    if subqueries:
+        results = await asearch_fanout_recipes(query, subqueries, n_results, pre_filter)
+    else:
+        results = await asearch_recipes(query, n_results, pre_filter)
+    return collapse_by_cluster(results, k)
+
+
+def result_cache_key(pre_filter: Dict[str, Any], k: int, requested_ingredients: list[str], llm_rerank_cutoff: int, fan_out: bool = False) -> Hashable:
+    """The exact part of a result cache key, everything except the free-text query."""
+    return (json.dumps(pre_filter, sort_keys=True, default=str), k, tuple(sorted(requested_ingredients)), llm_rerank_cutoff, fan_out)
+
+
+def rank_recipe_matches(results: list[Document], recipe_matches: list[RecipeMatch]) -> list[Document]:
+    """Attach the rerank judgments to the results and keep the matches, best first."""
     # Add reasoning and match_score to results
     for result, recipe_match in zip(results, recipe_matches):
         result.metadata['reasoning'] = recipe_match.reasoning
@@ -130,6 +406,205 @@ def retrieve_recipes(query:str,
     scored_results = [(result, recipe_match.match_score) for result, recipe_match in zip(results, recipe_matches) if recipe_match.is_match]
     scored_results.sort(key=lambda x: x[1], reverse=True)
     # Extract just the results in sorted order
-    recipe_results = [result for result, _ in scored_results]
+    return [result for result, _ in scored_results]
+
+
+async def aretrieve_recipes(query:str, 
+                            k:int = 10, 
+                            servings:int = 0, 
+                            max_total_time:int = 0, 
+                            ingredients:list[str] = [],
+                            meal_types:list[str] = [],
+                            course_types:list[str] = [],
+                            dietary_restrictions:list[str] = [],
+                            difficulty_level:list[str] = [],
+                            pantry_ingredients:list[str] = [],
+                            llm_rerank_cutoff:int = RERANK_LLM_CUTOFF,
+                            fan_out:bool = RECIPE_FANOUT_ENABLED) -> list[Document]:
+    """
+    Retrieve recipes from the database based on the user's query and filters.
+
+    Re-entrant: search parameters are built per call, so many searches can run concurrently in one process.
+    
+    Args:
+        query (str): The user's query.
+        k (int): The number of recipes to retrieve.
+        servings (int): The number of servings the recipe should make.
+        max_total_time (int): The maximum total time the recipe should take.
+        ingredients (list[str]): The ingredients the user wants to use.
+        meal_types (list[str]): The meal types the user wants to use.
+        course_types (list[str]): The course types the user wants to use.
+        dietary_restrictions (list[str]): The dietary restrictions the user wants to use.
+        difficulty_level (list[str]): The difficulty level the user wants to use.
+        pantry_ingredients (list[str]): The ingredients the user has, used to prune candidates before the LLM rerank without filtering the search.
+        llm_rerank_cutoff (int): The maximum number of candidates sent to the LLM rerank.
+        fan_out (bool): Also search ingredient-group sub-queries of the pantry and fuse them with the query.
+
+    Returns:
+        list[Document]: The recipes that match the user's query and filters.
+    """
+    pre_filter = build_pre_filter(servings, max_total_time, ingredients, meal_types, course_types, dietary_restrictions, difficulty_level)
+
+    requested_ingredients = pantry_ingredients or ingredients
+    service = recipe_search_service
+
+    # A paraphrase of an earlier search with the same filters returns its ranked recipes without search or rerank
+    cache_key = result_cache_key(pre_filter, k, requested_ingredients, llm_rerank_cutoff, fan_out)
+    query_vector = await service.embeddings.aembed_query(query)
+    dataset_version = await service.adataset_version()
+    cached_results = service.result_cache.get(cache_key, query_vector, dataset_version)
+    service.result_cache.log_stats("Recipe result cache")
+    if cached_results is not None:
+        logger.info(f"Serving cached recipes for query: {query}")
+        return [document.model_copy(deep=True) for document in cached_results]
 
-    return recipe_results
\ No newline at end of file
+    logger.info(f"Retrieving recipes for query: {query}")
+    subqueries = ingredient_subqueries(requested_ingredients) if fan_out else []
+    results = await asearch_unique_recipes(query, k, pre_filter, subqueries)
+    service.embeddings.log_stats()
+
+    # ====================================================================================
+    # Aspect filtering - determine if the product matches the customer query
+    # ====================================================================================
+    model = get_gemini_llm_client(project_id=PROJECT_ID, location=LOCATION, model_name="gemini-1.5-pro-002")
+    recipe_matches = await rerank_recipes(
+        query,
+        results,
+        model,
+        cache=service.rerank_cache,
+        requested_ingredients=requested_ingredients,
+        llm_cutoff=llm_rerank_cutoff,
+        mode=RERANK_MODE,
+        deadline_seconds=LLM_INTERACTIVE_DEADLINE_SECONDS,
+        hedge_percentile=LLM_HEDGE_PERCENTILE,
+    )
+    ranked_results = rank_recipe_matches(results, recipe_matches)
+    # Partial rerankings are served once but not cached, the next identical search judges the stragglers
+    if ChainCallStatus.DEADLINE_EXCEEDED not in recipe_matches.statuses:
+        service.result_cache.set(cache_key, query_vector, [document.model_copy(deep=True) for document in ranked_results], dataset_version)
+    return ranked_results
+
+
+async def astream_recipes(query:str, 
+                         k:int = 10, 
+                         servings:int = 0, 
+                         max_total_time:int = 0, 
+                         ingredients:list[str] = [],
+                         meal_types:list[str] = [],
+                         course_types:list[str] = [],
+                         dietary_restrictions:list[str] = [],
+                         difficulty_level:list[str] = [],
+                         pantry_ingredients:list[str] = [],
+                         llm_rerank_cutoff:int = RERANK_LLM_CUTOFF,
+                         fan_out:bool = RECIPE_FANOUT_ENABLED,
+                         top_n:int = 10) -> AsyncIterator[RecipeSearchUpdate]:
+    """
+    Streaming variant of aretrieve_recipes that yields each recipe as soon as its rerank judgment is ready.
+
+    Judgments are requested per candidate, so the first match arrives after about one LLM latency
+    instead of the slowest of k calls. See aretrieve_recipes for the search arguments.
+
+    Args:
+        top_n (int): The length of the running ordering of matches reported with every update.
+
+    Yields:
+        RecipeSearchUpdate: The judged recipe, its judgment, and the current top_n matches, best first.
+    """
+    pre_filter = build_pre_filter(servings, max_total_time, ingredients, meal_types, course_types, dietary_restrictions, difficulty_level)
+
+    requested_ingredients = pantry_ingredients or ingredients
+    service = recipe_search_service
+
+    cache_key = result_cache_key(pre_filter, k, requested_ingredients, llm_rerank_cutoff, fan_out)
+    query_vector = await service.embeddings.aembed_query(query)
+    dataset_version = await service.adataset_version()
+    cached_results = service.result_cache.get(cache_key, query_vector, dataset_version)
+    service.result_cache.log_stats("Recipe result cache")
+    if cached_results is not None:
+        logger.info(f"Serving cached recipes for query: {query}")
+        top_results = [document.model_copy(deep=True) for document in cached_results]
+        for completed, result in enumerate(top_results, start=1):
+            recipe_match = RecipeMatch(reasoning=result.metadata['reasoning'], is_match=True, match_score=result.metadata['match_score'])
+            yield RecipeSearchUpdate(
+                document=result,
+                recipe_match=recipe_match,
+                top_results=top_results[:top_n],
+                completed=completed,
+                total=len(top_results),
+            )
+        return
+
+    logger.info(f"Streaming recipes for query: {query}")
+    subqueries = ingredient_subqueries(requested_ingredients) if fan_out else []
+    results = await asearch_unique_recipes(query, k, pre_filter, subqueries)
+    service.embeddings.log_stats()
+
+    model = get_gemini_llm_client(project_id=PROJECT_ID, location=LOCATION, model_name="gemini-1.5-pro-002")
+    matches = []
+    completed = 0
+    deadline_exceeded = False
+    async for i, recipe_match, status in astream_rerank_recipes(
+        query,
+        results,
+        model,
+        cache=service.rerank_cache,
+        requested_ingredients=requested_ingredients,
+        llm_cutoff=llm_rerank_cutoff,
+        mode="pointwise",
+        deadline_seconds=LLM_INTERACTIVE_DEADLINE_SECONDS,
+        hedge_percentile=LLM_HEDGE_PERCENTILE,
+    ):
+        completed += 1
+        deadline_exceeded = deadline_exceeded or status == ChainCallStatus.DEADLINE_EXCEEDED
+        result = results[i]
+        result.metadata['reasoning'] = recipe_match.reasoning
+        result.metadata['match_score'] = recipe_match.match_score
+        if recipe_match.is_match:
+            matches.append(result)
+            matches.sort(key=lambda x: x.metadata['match_score'], reverse=True)
+        yield RecipeSearchUpdate(
+            document=result,
+            recipe_match=recipe_match,
+            top_results=matches[:top_n],
+            completed=completed,
+            total=len(results),
+        )
+    # Only a fully judged search is cached, not one the consumer stopped early or with stragglers
+    if not deadline_exceeded:
+        service.result_cache.set(cache_key, query_vector, [document.model_copy(deep=True) for document in matches], dataset_version)
+
+
+def retrieve_recipes(query:str, 
+                     k:int = 10, 
+                     servings:int = 0, 
+                     max_total_time:int = 0, 
+                     ingredients:list[str] = [],
+                     meal_types:list[str] = [],
+                     course_types:list[str] = [],
+                     dietary_restrictions:list[str] = [],
+                     difficulty_level:list[str] = [],
+                     pantry_ingredients:list[str] = [],
+                     llm_rerank_cutoff:int = RERANK_LLM_CUTOFF,
+                     fan_out:bool = RECIPE_FANOUT_ENABLED) -> list[Document]:
+    """
+    Retrieve recipes from the database based on the user's query and filters.
+
+    Synchronous wrapper around aretrieve_recipes, see it for the arguments.
+
+    Returns:
+        list[Document]: The recipes that match the user's query and filters.
+    """
+    return run_sync(aretrieve_recipes(
+        query,
+        k=k,
+        servings=servings,
+        max_total_time=max_total_time,
+        ingredients=ingredients,
+        meal_types=meal_types,
+        course_types=course_types,
+        dietary_restrictions=dietary_restrictions,
+        difficulty_level=difficulty_level,
+        pantry_ingredients=pantry_ingredients,
+        llm_rerank_cutoff=llm_rerank_cutoff,
+        fan_out=fan_out,
+    ))
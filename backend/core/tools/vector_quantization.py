@@ -0,0 +1,113 @@
+from typing import Optional, Union
+from pathlib import Path
+import numpy as np
+from loguru import logger
+
+FLOAT32 = "float32"
+FLOAT16 = "float16"
+INT8 = "int8"
+QUANTIZATIONS = (FLOAT32, FLOAT16, INT8)
+
+QUANTIZED_CODES_FILE = "vectors_{quantization}.npy"
+QUANTIZED_SCALES_FILE = "vector_scales.npy"
+
+# Rows converted to float32 per matmul, small enough for the temporary copy to stay in cache
+QUANTIZED_CHUNK_SIZE = 4096
+
+
+class QuantizedVectors:
+    """
+    Compressed copy of the normalized index vectors, used for candidate scoring.
+
+    - float16: the vectors cast to half precision, 2 bytes per dimension
+    - int8: symmetric scalar quantization with one float32 scale per vector, v ~= codes * scale,
+      1 byte per dimension plus 4 bytes per vector
+
+    Scores are approximate dot products with a float32 query. Callers rescore the best candidates
+    against the full-precision vectors.
+
+    Args:
+        quantization (str): "float16" or "int8".
+        codes (np.ndarray): The quantized vectors, shape (n, d).
+        scales (np.ndarray): The per-vector int8 scales, shape (n,), None for float16.
+    """
+
+    def __init__(self, quantization: str, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        if quantization not in (FLOAT16, INT8):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        if quantization == INT8 and scales is None:
+            raise ValueError("int8 quantization requires per-vector scales")
+        self.quantization = quantization
+        self.codes = codes
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, quantization: str) -> "QuantizedVectors":
+        """
+        Quantize a (possibly memory-mapped) float32 matrix chunk by chunk.
+
+        Args:
+            vectors (np.ndarray): The normalized float32 vectors, shape (n, d).
+            quantization (str): "float16" or "int8".
+
+        Returns:
+            QuantizedVectors: The quantized vectors.
+        """
+        n_rows, dimensions = vectors.shape
+        if quantization == FLOAT16:
+            codes = np.empty((n_rows, dimensions), dtype=np.float16)
+            for start in range(0, n_rows, QUANTIZED_CHUNK_SIZE):
+                codes[start:start + QUANTIZED_CHUNK_SIZE] = np.asarray(vectors[start:start + QUANTIZED_CHUNK_SIZE])
+            return cls(FLOAT16, codes)
+        if quantization != INT8:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        codes = np.empty((n_rows, dimensions), dtype=np.int8)
+        scales = np.empty(n_rows, dtype=np.float32)
+        for start in range(0, n_rows, QUANTIZED_CHUNK_SIZE):
+            chunk = np.asarray(vectors[start:start + QUANTIZED_CHUNK_SIZE], dtype=np.float32)
+            chunk_scales = np.abs(chunk).max(axis=1) / 127
+            chunk_scales[chunk_scales == 0] = 1.0
+            codes[start:start + len(chunk)] = np.clip(np.rint(chunk / chunk_scales[:, None]), -127, 127)
+            scales[start:start + len(chunk)] = chunk_scales
+        return cls(INT8, codes, scales)
+
+    def score(self, query_vector: np.ndarray, rows: Union[np.ndarray, slice]) -> np.ndarray:
+        """
+        Return the approximate dot products of the query with the given rows.
+
+        Args:
+            query_vector (np.ndarray): The normalized float32 query, shape (d,).
+            rows (np.ndarray | slice): Row ids or a contiguous slice of rows.
+
+        Returns:
+            np.ndarray: The float32 scores.
+        """
+        codes = self.codes[rows]
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), QUANTIZED_CHUNK_SIZE):
+            scores[start:start + QUANTIZED_CHUNK_SIZE] = codes[start:start + QUANTIZED_CHUNK_SIZE].astype(np.float32) @ query_vector
+        if self.scales is not None:
+            scores *= self.scales[rows]
+        return scores
+
+    def save(self, index_path: str) -> None:
+        path = Path(index_path)
+        np.save(path / QUANTIZED_CODES_FILE.format(quantization=self.quantization), self.codes)
+        if self.scales is not None:
+            np.save(path / QUANTIZED_SCALES_FILE, self.scales)
+        logger.info(f"Saved {self.quantization} vectors ({self.nbytes / 2**20:.1f} MiB) to {index_path}")
+
+    @classmethod
+    def load(cls, index_path: str, quantization: str) -> "QuantizedVectors":
+        # Loaded into memory, unlike the float32 matrix which stays memory-mapped for rescoring
+        path = Path(index_path)
+        codes = np.load(path / QUANTIZED_CODES_FILE.format(quantization=quantization))
+        scales = np.load(path / QUANTIZED_SCALES_FILE) if quantization == INT8 else None
+        return cls(quantization, codes, scales)
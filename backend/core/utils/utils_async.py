@@ -0,0 +1,102 @@
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+import asyncio
+import threading
+import time
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop that runs on a daemon thread, starting it on first use."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_background_loop.run_forever, name="savour-async", daemon=True)
+            thread.start()
+        return _background_loop
+
+
+# Blocking on the background loop from its own thread would wait forever for work the loop can no longer run
+BACKGROUND_LOOP_DEADLOCK_ERROR = "Cannot block on the background loop from a coroutine running on it, await the coroutine instead"
+
+
+def _is_running_on(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """
+    Run a coroutine to completion from synchronous code.
+
+    Unlike asyncio.run, every caller shares one long-lived loop, so loop-bound clients (e.g. AsyncMongoClient)
+    are reused across calls and concurrent callers from different threads run their coroutines concurrently.
+
+    Args:
+        coroutine (Coroutine): The coroutine to run.
+
+    Returns:
+        Any: The coroutine's result.
+
+    Raises:
+        RuntimeError: If called from a coroutine running on the background loop, which would deadlock.
+    """
+    loop = get_background_loop()
+    if _is_running_on(loop):
+        # Never awaited, close it to avoid a "coroutine was never awaited" warning
+        coroutine.close()
+        raise RuntimeError(BACKGROUND_LOOP_DEADLOCK_ERROR)
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+def iterate_sync(async_iterator: AsyncIterator) -> Iterator:
+    """
+    Consume an async iterator from synchronous code, item by item, on the shared background loop.
+
+    Args:
+        async_iterator (AsyncIterator): The async iterator, e.g. an async generator.
+
+    Yields:
+        Any: The items of the async iterator as they become available.
+
+    Raises:
+        RuntimeError: If called from a coroutine running on the background loop, which would deadlock.
+    """
+    loop = get_background_loop()
+    if _is_running_on(loop):
+        raise RuntimeError(BACKGROUND_LOOP_DEADLOCK_ERROR)
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+async def aiter_until(async_iterator: AsyncIterator, deadline: Optional[float]) -> AsyncIterator:
+    """
+    Yield the items of an async iterator until a deadline, then close it.
+
+    Closing an async generator runs its finally blocks, e.g. cancelling the calls it still waits for.
+
+    Args:
+        async_iterator (AsyncIterator): The async iterator, e.g. an async generator.
+        deadline (float): The time.monotonic() deadline, None waits for every item.
+
+    Yields:
+        Any: The items available before the deadline.
+    """
+    try:
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            try:
+                item = await asyncio.wait_for(async_iterator.__anext__(), timeout)
+            except (StopAsyncIteration, asyncio.TimeoutError):
+                return
+            yield item
+    finally:
+        if hasattr(async_iterator, "aclose"):
+            await async_iterator.aclose()
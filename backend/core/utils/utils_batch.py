@@ -0,0 +1,261 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import json
+from loguru import logger
+from pydantic import ValidationError
+from langchain_core.messages import BaseMessage
+from backend.core.utils.utils_llm import ChainCallStatus, ChainResults, UsageMeter, create_empty_model, get_usage_meter, run_chain_on_inputs
+from backend.core.utils.utils_llm_cache import find_chat_model, llm_request_key
+
+# Batch prediction is billed at half the online price
+BATCH_PRICE_FACTOR = 0.5
+
+BATCH_REQUESTS_FILE = "{stage}_requests.jsonl"
+BATCH_RESPONSES_FILE = "{stage}_responses.jsonl"
+
+
+class BatchPending(Exception):
+    """Raised when a stage's batch requests are written and its responses are not available yet."""
+
+    def __init__(self, stage: str, requests_path: Path, responses_path: Path):
+        super().__init__(f"Batch requests of {stage} written to {requests_path}, waiting for {responses_path}")
+        self.stage = stage
+        self.requests_path = requests_path
+        self.responses_path = responses_path
+
+
+def batch_request_id(stage: str, index: int, request_key: str) -> str:
+    """The id of a batch request, its position and the hash of its prompt, model and schema."""
+    return f"{stage}-{index:06d}-{request_key[:16]}"
+
+
+def _inline_refs(schema: Any, definitions: Dict[str, Any]) -> Any:
+    if isinstance(schema, dict):
+        if "$ref" in schema:
+            return _inline_refs(definitions[schema["$ref"].split("/")[-1]], definitions)
+        return {key: _inline_refs(value, definitions) for key, value in schema.items() if key != "$defs"}
+    if isinstance(schema, list):
+        return [_inline_refs(item, definitions) for item in schema]
+    return schema
+
+
+def response_schema(schema: type) -> Dict[str, Any]:
+    """The JSON schema of the output model with its references inlined, as batch prediction requires."""
+    json_schema = schema.model_json_schema()
+    return _inline_refs(json_schema, json_schema.get("$defs", {}))
+
+
+def _message_parts(content: Any) -> List[Dict[str, Any]]:
+    parts = []
+    for part in [content] if isinstance(content, str) else content:
+        if isinstance(part, str):
+            parts.append({"text": part})
+        elif part.get("type") == "text":
+            parts.append({"text": part["text"]})
+        elif part.get("type") == "image_url" and str(part["image_url"].get("url", "")).startswith("data:"):
+            header, data = part["image_url"]["url"].split(",", 1)
+            parts.append({"inlineData": {"mimeType": header[len("data:"):].split(";")[0], "data": data}})
+        else:
+            raise ValueError(f"Unsupported message part in a batch request: {part.get('type')}")
+    return parts
+
+
+def messages_to_request(messages: List[BaseMessage], model: Any, schema: type) -> Dict[str, Any]:
+    """
+    Build a Gemini GenerateContent request asking for JSON output matching the schema.
+
+    Args:
+        messages (List[BaseMessage]): The formatted prompt.
+        model (Any): The chat model whose generation params are used.
+        schema (type): The Pydantic output model.
+
+    Returns:
+        Dict[str, Any]: The request.
+    """
+    contents, system_parts = [], []
+    for message in messages:
+        if message.type == "system":
+            system_parts.extend(_message_parts(message.content))
+        else:
+            contents.append({"role": "model" if message.type == "ai" else "user", "parts": _message_parts(message.content)})
+    generation_config = {"responseMimeType": "application/json", "responseSchema": response_schema(schema)}
+    for param, key in (("temperature", "temperature"), ("top_p", "topP"), ("max_output_tokens", "maxOutputTokens")):
+        if getattr(model, param, None) is not None:
+            generation_config[key] = getattr(model, param)
+    request = {"contents": contents, "generationConfig": generation_config}
+    if system_parts:
+        request["systemInstruction"] = {"parts": system_parts}
+    return request
+
+
+def placeholder_output(schema: Dict[str, Any]) -> Any:
+    """A minimal value valid against a JSON schema, the default answer of the local executor."""
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "anyOf" in schema:
+        return placeholder_output(schema["anyOf"][0])
+    if schema.get("type") == "object":
+        return {name: placeholder_output(property_schema) for name, property_schema in schema.get("properties", {}).items()}
+    return {"string": "", "integer": 0, "number": 0.0, "boolean": False, "array": [], "null": None}.get(schema.get("type"), None)
+
+
+def execute_batch_locally(requests_path: Path, responses_path: Path, respond: Optional[Callable[[Dict[str, Any]], Any]] = None) -> None:
+    """
+    Stand-in for the batch prediction endpoint: answer every request of a JSONL request file and write the
+    JSONL response file in the endpoint's output format.
+
+    Args:
+        requests_path (Path): The request file.
+        responses_path (Path): The response file to write.
+        respond (Callable[[Dict], Any]): Returns the JSON output of a request. By default a placeholder valid
+            against the request's response schema.
+    """
+    respond = respond or (lambda request: placeholder_output(request["generationConfig"]["responseSchema"]))
+    n_requests = 0
+    with open(requests_path) as requests_file, open(responses_path, "w") as responses_file:
+        for line in requests_file:
+            request = json.loads(line)["request"]
+            response = {"candidates": [{"content": {"role": "model", "parts": [{"text": json.dumps(respond(request))}]}, "finishReason": "STOP"}]}
+            responses_file.write(json.dumps({"status": "", "request": request, "response": response}) + "\n")
+            n_requests += 1
+    logger.info(f"Answered {n_requests} batch requests locally into {responses_path}")
+
+
+class BatchJob:
+    """
+    Offline batch mode for bulk chain runs: every stage writes its requests to a JSONL file for a batch
+    prediction endpoint, and ingests the matching JSONL response file on a later run.
+
+    Each request carries its id in its labels, built from its position and the hash of its prompt, model and
+    schema, so responses are matched by id and a response file from different inputs is rejected.
+
+    Args:
+        directory (str): The directory of the request and response files.
+        executor (Callable[[Path, Path], None]): Fills a response file from a request file right away, e.g.
+            execute_batch_locally. None raises BatchPending until the responses are provided.
+    """
+
+    def __init__(self, directory: str, executor: Optional[Callable[[Path, Path], None]] = None):
+        self.directory = Path(directory)
+        self.executor = executor
+
+    def requests_path(self, stage: str) -> Path:
+        return self.directory / BATCH_REQUESTS_FILE.format(stage=stage)
+
+    def responses_path(self, stage: str) -> Path:
+        return self.directory / BATCH_RESPONSES_FILE.format(stage=stage)
+
+    def build_requests(self, chain: Any, inputs: List[Any], default_model: type, stage: str) -> List[Dict[str, Any]]:
+        """
+        Format the batch requests of a chain of a prompt and a chat model, one per input.
+
+        Returns:
+            List[Dict[str, Any]]: The request lines, {"request": {...}} with the id in the request labels.
+        """
+        model = find_chat_model(chain)
+        steps = getattr(chain, "steps", None)
+        if model is None or not steps:
+            raise ValueError(f"Batch mode needs a chain of a prompt and a chat model, got {type(chain).__name__}")
+        lines = []
+        for i, input in enumerate(inputs):
+            request = messages_to_request(steps[0].invoke(input).to_messages(), model, default_model)
+            request["labels"] = {"request_id": batch_request_id(stage, i, llm_request_key(chain, input, default_model))}
+            lines.append({"request": request})
+        return lines
+
+    def write_requests(self, stage: str, lines: List[Dict[str, Any]]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.requests_path(stage), "w") as f:
+            for line in lines:
+                f.write(json.dumps(line) + "\n")
+        logger.info(f"Wrote {len(lines)} batch requests of {stage} to {self.requests_path(stage)}")
+
+    def read_responses(self, stage: str, request_ids: List[str], default_model: type, meter: UsageMeter, model_name: Optional[str]) -> ChainResults:
+        """
+        Parse a response file into results in request order, after checking its ids match the requests.
+
+        Rows the endpoint failed, or whose output does not validate, get default models with PERMANENT_ERROR.
+
+        Raises:
+            ValueError: If the response ids are not exactly the request ids.
+        """
+        responses: Dict[str, Dict[str, Any]] = {}
+        duplicates = []
+        with open(self.responses_path(stage)) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                request_id = row.get("request", {}).get("labels", {}).get("request_id")
+                if request_id in responses:
+                    duplicates.append(request_id)
+                responses[request_id] = row
+        missing = [request_id for request_id in request_ids if request_id not in responses]
+        unexpected = set(responses) - set(request_ids)
+        if missing or unexpected or duplicates:
+            raise ValueError(
+                f"Batch responses of {stage} do not match its requests: {len(missing)} missing, {len(unexpected)} unexpected "
+                f"and {len(duplicates)} duplicate ids, e.g. {(missing + sorted(map(str, unexpected)) + duplicates)[:3]}"
+            )
+
+        results, statuses = [], []
+        for request_id in request_ids:
+            row = responses[request_id]
+            response = row.get("response") or {}
+            usage = response.get("usageMetadata")
+            if usage:
+                meter.record(stage, default_model.__name__, model_name, usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0), price_factor=BATCH_PRICE_FACTOR)
+            else:
+                meter.record_unmetered(stage, default_model.__name__, model_name)
+            try:
+                if row.get("status"):
+                    raise ValueError(row["status"])
+                text = "".join(part.get("text", "") for part in response["candidates"][0]["content"]["parts"])
+                results.append(default_model.model_validate_json(text))
+                statuses.append(ChainCallStatus.OK)
+            except (KeyError, IndexError, ValueError, ValidationError) as e:
+                logger.error(f"Batch response {request_id} failed: {type(e).__name__}: {e}. Returning default model.")
+                results.append(create_empty_model(default_model))
+                statuses.append(ChainCallStatus.PERMANENT_ERROR)
+        return ChainResults(results, statuses)
+
+    async def run_chain_on_inputs(self, chain: Any, inputs: List[Any], default_model: type, stage: str) -> Tuple[ChainResults, float, int, int]:
+        """
+        Batch counterpart of run_chain_on_inputs: ingest the stage's responses, or write its requests.
+
+        Args:
+            chain (Any): The chain to run, a prompt and a chat model.
+            inputs (List[Any]): The inputs.
+            default_model (type): The output model.
+            stage (str): The stage name, used for the file names and the request ids.
+
+        Returns:
+            Tuple[ChainResults, float, int, int]: The results, the cost in AUD and the input and output tokens.
+
+        Raises:
+            BatchPending: If the responses are not available yet and there is no executor.
+        """
+        lines = self.build_requests(chain, inputs, default_model, stage)
+        request_ids = [line["request"]["labels"]["request_id"] for line in lines]
+        if not self.responses_path(stage).exists():
+            self.write_requests(stage, lines)
+            if self.executor is None:
+                raise BatchPending(stage, self.requests_path(stage), self.responses_path(stage))
+            self.executor(self.requests_path(stage), self.responses_path(stage))
+
+        meter = UsageMeter()
+        model_name = getattr(find_chat_model(chain), "model_name", None)
+        results = self.read_responses(stage, request_ids, default_model, meter, model_name)
+        if results.failed:
+            logger.warning(f"Batch responses of {stage} with default models by status: {results.status_counts()}")
+        meter.log_summary("LLM batch usage")
+        get_usage_meter().merge(meter)
+        usage = meter.total()
+        return results, usage.cost, usage.input_tokens, usage.output_tokens
+
+
+async def run_chain_on_inputs_or_batch(chain: Any, inputs: List[Any], default_model: type, stage: str, batch: Optional[BatchJob] = None) -> Tuple[ChainResults, float, int, int]:
+    """Run a stage online with run_chain_on_inputs, or through the batch files when a BatchJob is given."""
+    if batch is None:
+        return await run_chain_on_inputs(chain, inputs, default_model, stage=stage)
+    return await batch.run_chain_on_inputs(chain, inputs, default_model, stage)
@@ -0,0 +1,348 @@
+from typing import Any, Dict, Optional, Hashable, Sequence
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import itertools
+import sqlite3
+import threading
+import time
+import numpy as np
+from loguru import logger
+
+
+def hash_key(*parts: Any) -> str:
+    """Build a stable sha256 cache key from the string form of the parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with a size bound and an optional time-to-live.
+
+    Args:
+        max_size (int): The maximum number of entries before the least recently used entry is evicted.
+        ttl_seconds (float): Entries older than this are treated as missing. None disables expiry.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    Thread-safe persistent key-value cache backed by a single SQLite table.
+
+    Values are stored as bytes. Entries can expire after a time-to-live, and the least recently
+    accessed entries are evicted once the table grows past max_entries or max_bytes. Access times of
+    hits are buffered in memory and written in one batch, before eviction or once access_flush_size
+    hits are pending, so a hit does not cost a write.
+
+    Args:
+        path (str): The SQLite database file.
+        table (str): The table name, so several caches can share one file.
+        ttl_seconds (float): Entries older than this are treated as missing. None disables expiry.
+        max_entries (int): The maximum number of entries. None disables the bound.
+        max_bytes (int): The maximum total size of stored values. None disables the bound.
+        read_only (bool): If True, the database is opened read-only and the cache never writes or evicts. A missing
+            database or table reads as an empty cache.
+        access_flush_size (int): The number of buffered access times that triggers a batch write.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "cache",
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        read_only: bool = False,
+        access_flush_size: int = 256,
+    ):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.access_flush_size = access_flush_size
+        # key -> last access time not yet written to the table
+        self._pending_access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        if read_only:
+            self._connection = self._connect_read_only(path, table)
+            return
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+
+    @staticmethod
+    def _connect_read_only(path: str, table: str) -> Optional[sqlite3.Connection]:
+        if path == ":memory:" or not Path(path).exists():
+            return None
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is None:
+            connection.close()
+            return None
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self._connection is None:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            now = time.time()
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                if not self.read_only:
+                    self._pending_access.pop(key, None)
+                    self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            if not self.read_only:
+                self._pending_access[key] = now
+                if len(self._pending_access) >= self.access_flush_size:
+                    self._flush_access_times()
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if self.read_only:
+            return
+        with self._lock:
+            now = time.time()
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._pending_access.pop(key, None)
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        if self.read_only:
+            return
+        with self._lock:
+            self._pending_access.pop(key, None)
+            self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def flush(self) -> None:
+        """Write the buffered access times of recent hits."""
+        if self.read_only:
+            return
+        with self._lock:
+            self._flush_access_times()
+
+    def _flush_access_times(self) -> None:
+        if not self._pending_access:
+            return
+        updates = [(accessed_at, key) for key, accessed_at in self._pending_access.items()]
+        self._pending_access.clear()
+        self._connection.execute("BEGIN")
+        try:
+            self._connection.executemany(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", updates)
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _evict(self) -> None:
+        # Eviction order depends on access times, so write the buffered ones first
+        self._flush_access_times()
+        if self.ttl_seconds is not None:
+            self._connection.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_entries is not None:
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total_bytes = self._connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total_bytes > self.max_bytes:
+                # Walk entries from least to most recently used until enough bytes are freed
+                excess = total_bytes - self.max_bytes
+                evict_keys = []
+                for key, size in self._connection.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at ASC"):
+                    evict_keys.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                self._connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", evict_keys)
+
+    def __len__(self) -> int:
+        if self._connection is None:
+            return 0
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def total_bytes(self) -> int:
+        if self._connection is None:
+            return 0
+        with self._lock:
+            return self._connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def close(self) -> None:
+        if self._connection is None:
+            return
+        with self._lock:
+            if not self.read_only:
+                self._flush_access_times()
+            self._connection.close()
+
+
+class SemanticCache:
+    """
+    Thread-safe in-memory cache of values keyed by an exact key plus a nearby query embedding.
+
+    A lookup hits when an entry has the same exact key and dataset version, and its embedding has a cosine
+    similarity of at least threshold with the query embedding. Entries from another dataset version are
+    dropped when they are seen. The least recently used entries are evicted past max_entries.
+
+    Args:
+        threshold (float): The minimum cosine similarity between query embeddings for a hit.
+        max_entries (int): The maximum number of entries across all keys.
+        ttl_seconds (float): Entries older than this are treated as missing. None disables expiry.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: Optional[float] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # exact key -> entry id -> (normalized embedding, dataset version, value, created_at)
+        self._buckets: Dict[Hashable, Dict[int, tuple]] = {}
+        # (exact key, entry id) in least to most recently used order
+        self._lru: OrderedDict = OrderedDict()
+        self._entry_ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, key: Hashable, entry_id: int) -> None:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.pop(entry_id, None)
+            if not bucket:
+                del self._buckets[key]
+        self._lru.pop((key, entry_id), None)
+
+    def get(self, key: Hashable, embedding: Sequence[float], version: Optional[str] = None) -> Optional[Any]:
+        """
+        Return the value of the most similar entry for the key, or None on a miss.
+
+        Args:
+            key (Hashable): The exact part of the key, e.g. the search filters.
+            embedding (Sequence[float]): The query embedding.
+            version (str): The current dataset version.
+
+        Returns:
+            Optional[Any]: The cached value.
+        """
+        query_vector = self._normalize(embedding)
+        with self._lock:
+            now = time.time()
+            best_id, best_similarity = None, self.threshold
+            for entry_id, (vector, entry_version, _, created_at) in list(self._buckets.get(key, {}).items()):
+                if entry_version != version:
+                    self.invalidations += 1
+                    self._remove(key, entry_id)
+                    continue
+                if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                    self._remove(key, entry_id)
+                    continue
+                similarity = float(vector @ query_vector)
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._lru.move_to_end((key, best_id))
+            return self._buckets[key][best_id][2]
+
+    def set(self, key: Hashable, embedding: Sequence[float], value: Any, version: Optional[str] = None) -> None:
+        with self._lock:
+            entry_id = next(self._entry_ids)
+            self._buckets.setdefault(key, {})[entry_id] = (self._normalize(embedding), version, value, time.time())
+            self._lru[(key, entry_id)] = None
+            while len(self._lru) > self.max_entries:
+                self._remove(*next(iter(self._lru)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self._lru.clear()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the hit/miss counters, the number of entries dropped for a stale dataset version, and the hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._lru),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def log_stats(self, name: str = "Semantic cache") -> None:
+        stats = self.stats()
+        logger.info(
+            f"{name}: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), "
+            f"{stats['entries']} entries, {stats['invalidations']} invalidated"
+        )
@@ -0,0 +1,115 @@
+from typing import Any, Dict, List, Set
+from itertools import combinations
+import re
+from loguru import logger
+from langchain_core.documents import Document
+from backend.core.utils.utils_ingredients import recipe_ingredient_ids, singularize
+
+# Title words that say nothing about which dish a post is
+TITLE_STOPWORDS = {"a", "an", "the", "and", "with", "of", "in", "on", "for", "my", "our", "i", "made", "make", "recipe", "homemade", "easy", "best", "quick", "simple"}
+
+
+def title_tokens(title: str) -> Set[str]:
+    return {singularize(token) for token in re.findall(r"[a-z0-9]+", title.lower()) if token not in TITLE_STOPWORDS}
+
+
+def jaccard(a: Set[Any], b: Set[Any]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parents = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parents[i] != i:
+            self.parents[i] = self.parents[self.parents[i]]
+            i = self.parents[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        root_i, root_j = self.find(i), self.find(j)
+        # The lower row stays the root, so the cluster id is the uuid of the first recipe in the data
+        if root_i != root_j:
+            self.parents[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def assign_recipe_clusters(
+    recipe_data: List[Dict],
+    title_threshold: float = 0.6,
+    ingredient_threshold: float = 0.6,
+    max_block_size: int = 200,
+) -> int:
+    """
+    Group near-duplicate recipes (e.g. Reddit reposts) and store a shared "cluster_id" on each recipe.
+
+    Two recipes are near-duplicates if both their title tokens and their canonical ingredient sets
+    have a Jaccard similarity above the thresholds. Only recipes sharing a title token are compared,
+    and title tokens shared by more than max_block_size recipes are skipped to keep this near-linear.
+
+    Args:
+        recipe_data (List[Dict]): Recipe dicts with "uuid", "title" and "ingredients", updated in place.
+        title_threshold (float): The minimum title token Jaccard similarity.
+        ingredient_threshold (float): The minimum canonical ingredient Jaccard similarity.
+        max_block_size (int): Title tokens shared by more recipes than this are not used for blocking.
+
+    Returns:
+        int: The number of clusters.
+    """
+    titles = [title_tokens(str(recipe.get("title", ""))) for recipe in recipe_data]
+    ingredients = [set(recipe.get("ingredient_ids") or recipe_ingredient_ids(recipe.get("ingredients", []))) for recipe in recipe_data]
+
+    blocks: Dict[str, List[int]] = {}
+    for row, tokens in enumerate(titles):
+        for token in tokens:
+            blocks.setdefault(token, []).append(row)
+
+    clusters = _UnionFind(len(recipe_data))
+    compared = set()
+    for rows in blocks.values():
+        if len(rows) > max_block_size:
+            continue
+        for i, j in combinations(rows, 2):
+            if (i, j) in compared or clusters.find(i) == clusters.find(j):
+                continue
+            compared.add((i, j))
+            if jaccard(titles[i], titles[j]) >= title_threshold and jaccard(ingredients[i], ingredients[j]) >= ingredient_threshold:
+                clusters.union(i, j)
+
+    for row, recipe in enumerate(recipe_data):
+        recipe["cluster_id"] = recipe_data[clusters.find(row)]["uuid"]
+    n_clusters = len({recipe["cluster_id"] for recipe in recipe_data})
+    logger.info(f"Grouped {len(recipe_data)} recipes into {n_clusters} near-duplicate clusters")
+    return n_clusters
+
+
+def collapse_by_cluster(documents: List[Document], k: int) -> List[Document]:
+    """
+    Keep the best-ranked document of each near-duplicate cluster, backfilling from later hits up to k.
+
+    Documents without a cluster_id (e.g. indexed before clustering) are their own cluster.
+
+    Args:
+        documents (List[Document]): The search results, best first, ideally more than k.
+        k (int): The number of documents to return.
+
+    Returns:
+        List[Document]: At most k documents, one per cluster, in their original order.
+    """
+    seen = set()
+    unique = []
+    duplicates = 0
+    for document in documents:
+        cluster_id = document.metadata.get("cluster_id") or document.metadata.get("uuid") or document.metadata.get("_id") or id(document)
+        if cluster_id in seen:
+            duplicates += 1
+            continue
+        seen.add(cluster_id)
+        unique.append(document)
+        if len(unique) == k:
+            break
+    if duplicates:
+        logger.info(f"Dropped {duplicates} near-duplicate recipes before rerank")
+    return unique
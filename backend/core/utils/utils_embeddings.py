@@ -0,0 +1,157 @@
+from typing import List, Optional, Dict
+import asyncio
+import re
+import threading
+import numpy as np
+from loguru import logger
+from langchain_core.embeddings import Embeddings
+from backend.core.utils.utils_cache import LRUCache, SQLiteCache, hash_key
+
+
+def normalize_embedding_text(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different prompts share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Two-tier cache in front of an embeddings model.
+
+    Lookups go to an in-memory LRU first, then to an on-disk SQLite store, and only then to the model.
+    Entries are keyed by the model name and the normalized text.
+
+    Args:
+        embeddings (Embeddings): The wrapped embeddings model, e.g. VertexAIEmbeddings.
+        cache_path (str): The SQLite file for the on-disk tier. None disables the disk tier.
+        max_memory_entries (int): The size bound of the in-memory LRU.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_path: Optional[str] = None, max_memory_entries: int = 10000):
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.memory_cache = LRUCache(max_size=max_memory_entries)
+        self.disk_cache = SQLiteCache(cache_path, table="embeddings") if cache_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _key(self, text: str) -> str:
+        return hash_key(self.model_name, normalize_embedding_text(text))
+
+    def _lookup_memory(self, key: str) -> Optional[List[float]]:
+        vector = self.memory_cache.get(key)
+        if vector is not None:
+            with self._stats_lock:
+                self.memory_hits += 1
+        return vector
+
+    def _lookup_disk(self, key: str) -> Optional[List[float]]:
+        if self.disk_cache is not None:
+            value = self.disk_cache.get(key)
+            if value is not None:
+                vector = np.frombuffer(value, dtype=np.float32).tolist()
+                self.memory_cache.set(key, vector)
+                with self._stats_lock:
+                    self.disk_hits += 1
+                return vector
+        with self._stats_lock:
+            self.misses += 1
+        return None
+
+    def _lookup_disk_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        return [self._lookup_disk(key) for key in keys]
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self._lookup_memory(key)
+        return vector if vector is not None else self._lookup_disk(key)
+
+    async def _alookup_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        # Memory hits are answered on the event loop, the remaining SQLite reads go to one worker thread
+        vectors = [self._lookup_memory(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_keys = [keys[i] for i in missing]
+            if self.disk_cache is not None:
+                disk_vectors = await asyncio.to_thread(self._lookup_disk_many, missing_keys)
+            else:
+                disk_vectors = self._lookup_disk_many(missing_keys)
+            for i, vector in zip(missing, disk_vectors):
+                vectors[i] = vector
+        return vectors
+
+    def _store(self, key: str, vector: List[float]) -> None:
+        self.memory_cache.set(key, vector)
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, np.asarray(vector, dtype=np.float32).tobytes())
+
+    def _store_many(self, keys: List[str], vectors: List[List[float]]) -> None:
+        for key, vector in zip(keys, vectors):
+            self._store(key, vector)
+
+    async def _astore_many(self, keys: List[str], vectors: List[List[float]]) -> None:
+        if self.disk_cache is not None:
+            await asyncio.to_thread(self._store_many, keys, vectors)
+        else:
+            self._store_many(keys, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = (await self._alookup_many([key]))[0]
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await self._astore_many([key], [vector])
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed all misses in one batched request
+            new_vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+                self._store(keys[i], vector)
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = await self._alookup_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            new_vectors = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+            await self._astore_many([keys[i] for i in missing], new_vectors)
+        return vectors
+
+    def close(self) -> None:
+        if self.disk_cache is not None:
+            self.disk_cache.close()
+
+    def stats(self) -> Dict[str, float]:
+        """Return the hit/miss counters and the overall hit rate."""
+        with self._stats_lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        logger.info(
+            f"Embedding cache: {stats['memory_hits']} memory hits, {stats['disk_hits']} disk hits, "
+            f"{stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)"
+        )
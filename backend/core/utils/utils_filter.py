@@ -0,0 +1,153 @@
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+COMPARISON_OPERATORS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin"}
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(_hashable(i) for i in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+class MetadataFilterIndex:
+    """
+    Evaluates MongoDB (MQL) pre_filter expressions against a list of metadata dicts.
+
+    Columns are built lazily per field the first time a filter touches them:
+        - numeric fields are stored as a float64 array (NaN for missing values) for range operators
+        - every field gets an inverted index of value -> sorted row ids for equality and $in operators
+
+    Array fields follow MongoDB semantics, i.e. {"meal_types": {"$in": ["dinner"]}} matches
+    if any element of the array is in the requested values.
+    """
+
+    def __init__(self, metadatas: List[Dict[str, Any]]):
+        self.metadatas = metadatas
+        self.size = len(metadatas)
+        self._numeric_columns: Dict[str, Optional[np.ndarray]] = {}
+        self._inverted_columns: Dict[str, Dict[Any, np.ndarray]] = {}
+
+    def numeric_column(self, field: str) -> Optional[np.ndarray]:
+        """Return the field as a float64 array, or None if it holds non-numeric values."""
+        if field not in self._numeric_columns:
+            column = np.full(self.size, np.nan, dtype=np.float64)
+            is_numeric = True
+            for row, metadata in enumerate(self.metadatas):
+                value = metadata.get(field)
+                if value is None:
+                    continue
+                if not _is_number(value):
+                    is_numeric = False
+                    break
+                column[row] = value
+            self._numeric_columns[field] = column if is_numeric else None
+        return self._numeric_columns[field]
+
+    def inverted_column(self, field: str) -> Dict[Any, np.ndarray]:
+        """Return a mapping of value -> row ids for the field, unrolling array values one level."""
+        if field not in self._inverted_columns:
+            postings: Dict[Any, List[int]] = {}
+            for row, metadata in enumerate(self.metadatas):
+                value = metadata.get(field)
+                values = value if isinstance(value, (list, tuple)) else [value]
+                for item in values:
+                    postings.setdefault(_hashable(item), []).append(row)
+            self._inverted_columns[field] = {
+                key: np.unique(np.asarray(rows, dtype=np.int64)) for key, rows in postings.items()
+            }
+        return self._inverted_columns[field]
+
+    def mask(self, mql_filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        """
+        Compute a boolean mask of the rows matching the filter.
+
+        Args:
+            mql_filter (dict): An MQL match expression, e.g. the pre_filter built by retrieve_recipes.
+
+        Returns:
+            np.ndarray: Boolean array with one entry per metadata row.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        if not mql_filter:
+            return mask
+        for key, condition in mql_filter.items():
+            if key == "$and":
+                for sub_filter in condition:
+                    mask &= self.mask(sub_filter)
+            elif key == "$or":
+                any_mask = np.zeros(self.size, dtype=bool)
+                for sub_filter in condition:
+                    any_mask |= self.mask(sub_filter)
+                mask &= any_mask
+            elif key == "$nor":
+                for sub_filter in condition:
+                    mask &= ~self.mask(sub_filter)
+            elif isinstance(condition, dict) and condition and set(condition) <= COMPARISON_OPERATORS:
+                for operator, operand in condition.items():
+                    mask &= self._field_mask(key, operator, operand)
+            else:
+                mask &= self._field_mask(key, "$eq", condition)
+        return mask
+
+    def _rows_mask(self, field: str, values: List[Any]) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        inverted = self.inverted_column(field)
+        for value in values:
+            rows = inverted.get(_hashable(value))
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def _field_mask(self, field: str, operator: str, operand: Any) -> np.ndarray:
+        if operator == "$eq":
+            return self._rows_mask(field, [operand])
+        if operator == "$ne":
+            return ~self._rows_mask(field, [operand])
+        if operator == "$in":
+            return self._rows_mask(field, list(operand))
+        if operator == "$nin":
+            return ~self._rows_mask(field, list(operand))
+
+        numeric = self.numeric_column(field)
+        if numeric is not None and _is_number(operand):
+            with np.errstate(invalid="ignore"):
+                if operator == "$gt":
+                    return numeric > operand
+                if operator == "$gte":
+                    return numeric >= operand
+                if operator == "$lt":
+                    return numeric < operand
+                if operator == "$lte":
+                    return numeric <= operand
+
+        # Fall back to a row-by-row comparison for mixed-type or array fields
+        compare = {
+            "$gt": lambda a, b: a > b,
+            "$gte": lambda a, b: a >= b,
+            "$lt": lambda a, b: a < b,
+            "$lte": lambda a, b: a <= b,
+        }[operator]
+        mask = np.zeros(self.size, dtype=bool)
+        for row, metadata in enumerate(self.metadatas):
+            value = metadata.get(field)
+            values = value if isinstance(value, (list, tuple)) else [value]
+            for item in values:
+                try:
+                    if item is not None and compare(item, operand):
+                        mask[row] = True
+                        break
+                except TypeError:
+                    continue
+        return mask
+
+
+def matches_filter(metadata: Dict[str, Any], mql_filter: Optional[Dict[str, Any]]) -> bool:
+    """Check whether a single metadata dict matches an MQL filter."""
+    return bool(MetadataFilterIndex([metadata]).mask(mql_filter)[0])
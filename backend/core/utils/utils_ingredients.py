@@ -0,0 +1,235 @@
+from typing import Dict, Iterable, List, Optional, Set
+from functools import lru_cache
+from pathlib import Path
+import json
+import re
+from loguru import logger
+
+# Words that describe an ingredient's state, preparation, size or variety rather than the ingredient itself
+INGREDIENT_MODIFIERS = {
+    "fresh", "freshly", "frozen", "dried", "raw", "cooked", "chopped", "finely", "roughly", "diced", "sliced", "thinly",
+    "minced", "grated", "shredded", "crushed", "peeled", "deseeded", "halved", "quartered", "cubed", "mashed", "softened",
+    "melted", "beaten", "large", "small", "medium", "whole", "organic", "ripe", "extra", "virgin", "boneless", "skinless",
+    "salted", "unsalted",
+    "roma", "heirloom", "baby", "jumbo", "optional", "to", "taste", "of", "and", "or", "a", "for",
+    "garnish", "serving", "can", "tin", "canned", "tinned", "packet", "bunch", "handful", "pinch", "piece", "pieces",
+}
+
+# Cuts and parts of an ingredient, stripped to find the base ingredient, e.g. "chicken thigh" -> "chicken"
+INGREDIENT_PARTS = {
+    "thigh", "breast", "drumstick", "wing", "leg", "fillet", "cutlet", "chop", "loin", "shank", "rib", "steak",
+    "clove", "bulb", "head", "leaf", "stalk", "stem", "sprig", "floret",
+}
+
+# Heads that name a different product than the word before them, e.g. "coconut milk" is not "milk" and
+# "bell pepper" is not "black pepper", so multi-word ingredients are never indexed under these alone
+NON_INGREDIENT_HEADS = {
+    "milk", "butter", "cream", "sauce", "paste", "pepper", "powder", "stock", "broth", "juice", "extract", "water",
+}
+
+# Regional and common alternative names, mapped to one canonical name
+INGREDIENT_SYNONYMS = {
+    "scallion": "green onion",
+    "spring onion": "green onion",
+    "cilantro": "coriander",
+    "aubergine": "eggplant",
+    "courgette": "zucchini",
+    "capsicum": "bell pepper",
+    "bell capsicum": "bell pepper",
+    "garbanzo bean": "chickpea",
+    "prawn": "shrimp",
+    "rocket": "arugula",
+    "minced beef": "ground beef",
+    "beef mince": "ground beef",
+    "mince": "ground beef",
+    "pork mince": "ground pork",
+    "chicken mince": "ground chicken",
+    "caster sugar": "sugar",
+    "granulated sugar": "sugar",
+    "white sugar": "sugar",
+    "plain flour": "flour",
+    "all purpose flour": "flour",
+    "icing sugar": "powdered sugar",
+    "confectioner sugar": "powdered sugar",
+    "double cream": "heavy cream",
+    "thickened cream": "heavy cream",
+    "egg yolk": "egg",
+    "egg white": "egg",
+}
+
+# Synonym phrases as token tuples, longest first, matched inside an ingredient before modifiers are removed
+SYNONYM_PHRASES = sorted((tuple(name.split(" ")) for name in INGREDIENT_SYNONYMS), key=len, reverse=True)
+
+# Plurals that do not follow the suffix rules below
+IRREGULAR_SINGULARS = {
+    "leaves": "leaf",
+    "loaves": "loaf",
+    "halves": "half",
+    "knives": "knife",
+    "geese": "goose",
+    "teeth": "tooth",
+    "molasses": "molasses",
+    "couscous": "couscous",
+    "hummus": "hummus",
+    "asparagus": "asparagus",
+    "swiss": "swiss",
+}
+
+
+def singularize(token: str) -> str:
+    """Crude English singularization for ingredient tokens."""
+    if token in IRREGULAR_SINGULARS:
+        return IRREGULAR_SINGULARS[token]
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("oes") or token.endswith("ches") or token.endswith("shes") or token.endswith("sses"):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss") and not token.endswith("us") and len(token) > 3:
+        return token[:-1]
+    return token
+
+
+def replace_synonyms(tokens: List[str]) -> List[str]:
+    """Replace synonym phrases in a token list by their canonical tokens, e.g. ["beef", "mince"] -> ["ground", "beef"]."""
+    replaced, position = [], 0
+    while position < len(tokens):
+        for phrase in SYNONYM_PHRASES:
+            if tuple(tokens[position:position + len(phrase)]) == phrase:
+                replaced.extend(INGREDIENT_SYNONYMS[" ".join(phrase)].split(" "))
+                position += len(phrase)
+                break
+        else:
+            replaced.append(tokens[position])
+            position += 1
+    return replaced
+
+
+def ingredient_tokens(ingredient: str) -> List[str]:
+    """Split an ingredient name into singular, lowercase tokens without modifiers, quantities or notes."""
+    # Drop parenthesised notes, e.g. "tomatoes (diced)"
+    ingredient = re.sub(r"\([^)]*\)", " ", ingredient.lower())
+    # Drop anything after a comma, e.g. "onion, finely chopped"
+    ingredient = ingredient.split(",")[0]
+    tokens = [singularize(token) for token in re.findall(r"[a-z]+", ingredient)]
+    # Synonyms first, so modifiers that are part of a synonym, e.g. "minced" in "minced beef", are kept
+    return [token for token in replace_synonyms(tokens) if token not in INGREDIENT_MODIFIERS]
+
+
+@lru_cache(maxsize=65536)
+def canonicalize_ingredient(ingredient: str) -> str:
+    """
+    Reduce an ingredient name to its canonical form, e.g. "Roma Tomatoes" -> "tomato", "scallions" -> "green onion".
+
+    Args:
+        ingredient (str): The raw ingredient name.
+
+    Returns:
+        str: The canonical name, or an empty string if nothing is left after removing modifiers.
+    """
+    canonical = " ".join(ingredient_tokens(ingredient))
+    return INGREDIENT_SYNONYMS.get(canonical, canonical)
+
+
+def ingredient_id(canonical: str) -> str:
+    return canonical.replace(" ", "_")
+
+
+def canonical_ingredient_ids(ingredient: str) -> List[str]:
+    """
+    Return the canonical ids a recipe ingredient is indexed under.
+
+    Multi-word ingredients are indexed under their full form, their base ingredient without cuts and parts,
+    and their head noun:
+        - "chicken thighs" -> chicken_thigh, chicken
+        - "heirloom beefsteak tomato" -> beefsteak_tomato, tomato
+        - "tomato sauce" -> tomato_sauce, since "sauce" is not an ingredient on its own and the tomato is processed
+        - "coconut milk" -> coconut_milk, since "milk" names a different product
+    """
+    canonical = canonicalize_ingredient(ingredient)
+    if not canonical:
+        return []
+    ids = [ingredient_id(canonical)]
+    tokens = canonical.split(" ")
+    base_tokens = [token for token in tokens if token not in INGREDIENT_PARTS] or tokens
+    names = [" ".join(base_tokens)]
+    if len(tokens) > 1 and base_tokens[-1] not in NON_INGREDIENT_HEADS:
+        names.append(base_tokens[-1])
+    for name in names:
+        name_id = ingredient_id(INGREDIENT_SYNONYMS.get(name, name))
+        if name_id not in ids:
+            ids.append(name_id)
+    return ids
+
+
+def recipe_ingredient_ids(ingredients: Iterable[str]) -> List[str]:
+    """Return the sorted, unique canonical ids of a recipe's ingredient list."""
+    ids: Set[str] = set()
+    for ingredient in ingredients:
+        if isinstance(ingredient, str):
+            ids.update(canonical_ingredient_ids(ingredient))
+    return sorted(ids)
+
+
+class IngredientVocabulary:
+    """
+    The canonical ingredient vocabulary of the recipe corpus, with a fast query-side normalizer.
+
+    Built at ingest from every recipe ingredient. Each canonical id records the number of recipes
+    that use it, which the search can use to estimate filter selectivity.
+
+    Args:
+        id_counts (Dict[str, int]): The canonical ids and their recipe counts.
+    """
+
+    def __init__(self, id_counts: Dict[str, int]):
+        self.id_counts = id_counts
+        self._normalize = lru_cache(maxsize=65536)(self._normalize_uncached)
+
+    @classmethod
+    def build(cls, recipe_ingredient_lists: Iterable[Iterable[str]]) -> "IngredientVocabulary":
+        id_counts: Dict[str, int] = {}
+        for ingredients in recipe_ingredient_lists:
+            for canonical_id in recipe_ingredient_ids(ingredients):
+                id_counts[canonical_id] = id_counts.get(canonical_id, 0) + 1
+        return cls(id_counts)
+
+    def __contains__(self, canonical_id: str) -> bool:
+        return canonical_id in self.id_counts
+
+    def __len__(self) -> int:
+        return len(self.id_counts)
+
+    def _normalize_uncached(self, ingredient: str) -> Optional[str]:
+        for canonical_id in canonical_ingredient_ids(ingredient):
+            if canonical_id in self.id_counts:
+                return canonical_id
+        return None
+
+    def normalize(self, ingredient: str) -> Optional[str]:
+        """
+        Map a query ingredient to a canonical id in the vocabulary.
+
+        Tries the full canonical form first, then backs off to the base ingredient and the head noun.
+
+        Args:
+            ingredient (str): The ingredient as the user or extract_ingredients_node wrote it.
+
+        Returns:
+            Optional[str]: The canonical id, or None if the ingredient is not in the corpus.
+        """
+        return self._normalize(ingredient)
+
+    def ids(self, ingredients: Iterable[str]) -> List[str]:
+        """Map query ingredients to their unique canonical ids, dropping ingredients not in the corpus."""
+        return sorted({canonical_id for canonical_id in map(self.normalize, ingredients) if canonical_id})
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.id_counts, f, indent=0, sort_keys=True)
+        logger.info(f"Saved ingredient vocabulary with {len(self.id_counts)} canonical ingredients to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "IngredientVocabulary":
+        with open(path) as f:
+            return cls(json.load(f))
@@ -1,24 +1,41 @@
 from langchain_google_vertexai import HarmCategory, HarmBlockThreshold
 from backend.core.utils.chat_model import ChatVertexAIWX
 from backend.core.env import GEMINI_PRO_FAMILY, GEMINI_FLASH
+from backend.core.env import LLM_MAX_RETRIES, LLM_RETRY_BUDGET_RATIO, LLM_CALL_TIMEOUT_SECONDS
+from backend.core.env import LLM_RESPONSE_CACHE_MODE
+from backend.core.utils.utils_cache import hash_key
+from backend.core.utils.utils_llm_cache import LLMResponseCache, find_chat_model, get_llm_response_cache, get_single_flight, llm_request_key
+from backend.core.utils.utils_llm_limits import AdaptiveConcurrencyLimiter, RetryBudget
+from backend.core.utils.utils_llm_limits import get_latency_tracker, get_llm_rate_limiter, invoke_hedged, is_retryable_error, retry_delay
 from langchain_google_vertexai.model_garden import ChatAnthropicVertex
 from vertexai.preview.tokenization import get_tokenizer_for_model
+from google.api_core.exceptions import GoogleAPICallError
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
 import random
-from typing import List, Any, Tuple
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from uuid import UUID
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Any, Optional, Tuple, get_args, get_origin
 import asyncio
-from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.rate_limiters import BaseRateLimiter, InMemoryRateLimiter
 from pydantic import BaseModel
 from loguru import logger
-from typing import List
-from pydantic import BaseModel
 from pydantic_core import PydanticUndefined
-from typing import List, get_args, get_origin, Any
 
-tokenizer = get_tokenizer_for_model(GEMINI_PRO_FAMILY)
+
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    """Load the Gemini tokenizer on first use, it downloads the vocabulary the first time."""
+    return get_tokenizer_for_model(GEMINI_PRO_FAMILY)
 
 
-def create_anthropic_llm_client(project_id: str, location: str = "us-east5", requests_per_second: int = 5, max_bucket_size: int = 5, model_name: str = "claude-3-5-sonnet-v2@20241022") -> ChatAnthropicVertex:
-    rate_limiter = InMemoryRateLimiter(
+def create_anthropic_llm_client(project_id: str, location: str = "us-east5", requests_per_second: int = 5, max_bucket_size: int = 5, model_name: str = "claude-3-5-sonnet-v2@20241022", rate_limiter: Optional[BaseRateLimiter] = None) -> ChatAnthropicVertex:
+    rate_limiter = rate_limiter or InMemoryRateLimiter(
         requests_per_second=requests_per_second,  # Requests per second
         check_every_n_seconds=0.1,  # Wake up every 100 ms to check,
         max_bucket_size=max_bucket_size,  # Controls the maximum burst size.
@@ -36,8 +53,8 @@ def create_anthropic_llm_client(project_id: str, location: str = "us-east5", req
 
     return model
 
-def create_gemini_llm_client(project_id: str, location: str, requests_per_second: int = 5, max_bucket_size: int = 5, model_name: str = GEMINI_FLASH) -> ChatVertexAIWX:
-    rate_limiter = InMemoryRateLimiter(
+def create_gemini_llm_client(project_id: str, location: str, requests_per_second: int = 5, max_bucket_size: int = 5, model_name: str = GEMINI_FLASH, rate_limiter: Optional[BaseRateLimiter] = None) -> ChatVertexAIWX:
+    rate_limiter = rate_limiter or InMemoryRateLimiter(
         requests_per_second=requests_per_second,  # Requests per second
         check_every_n_seconds=0.1,  # Wake up every 100 ms to check,
         max_bucket_size=max_bucket_size,  # Controls the maximum burst size.
@@ -65,18 +82,83 @@ def create_gemini_llm_client(project_id: str, location: str, requests_per_second
     return model
 
 
+# Shared clients per event loop, see _get_loop_llm_client
+_loop_llm_clients: Dict[Optional[asyncio.AbstractEventLoop], Dict[Tuple, BaseChatModel]] = {}
+_loop_llm_clients_lock = threading.Lock()
+
+
+def _get_loop_llm_client(key: Tuple, create: Callable[[], BaseChatModel]) -> BaseChatModel:
+    """
+    Return the client of a key for the running event loop, created on first use.
+
+    The clients' async transports bind to the event loop that first uses them, so a client is only shared within
+    one loop. Each loop gets its own clients, dropped once the loop is closed, and all of them share the rate limiter.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _loop_llm_clients_lock:
+        for closed_loop in [i for i in _loop_llm_clients if i is not None and i.is_closed()]:
+            del _loop_llm_clients[closed_loop]
+        clients = _loop_llm_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = create()
+        return clients[key]
+
+
+def get_gemini_llm_client(project_id: str, location: str, model_name: str = GEMINI_FLASH) -> ChatVertexAIWX:
+    """
+    Return the shared Gemini client of a (model, location) for the running event loop, created on first use.
+
+    Concurrent requests share the client and its get_llm_rate_limiter bucket, instead of each getting a fresh
+    5 RPS bucket and together exceeding the project quota. The rate limiter is process-wide, the client is per
+    event loop because its async transport binds to the loop that first uses it.
+    """
+    return _get_loop_llm_client(
+        ("gemini", project_id, location, model_name),
+        lambda: create_gemini_llm_client(project_id, location, model_name=model_name, rate_limiter=get_llm_rate_limiter(model_name, location)),
+    )
+
+
+def get_anthropic_llm_client(project_id: str, location: str = "us-east5", model_name: str = "claude-3-5-sonnet-v2@20241022") -> ChatAnthropicVertex:
+    """Return the shared Anthropic client of a (model, location) for the running event loop, see get_gemini_llm_client."""
+    return _get_loop_llm_client(
+        ("anthropic", project_id, location, model_name),
+        lambda: create_anthropic_llm_client(project_id, location, model_name=model_name, rate_limiter=get_llm_rate_limiter(model_name, location)),
+    )
+
+
 def get_token_count(text: str) -> int:
-    response = tokenizer.count_tokens(text)
+    response = get_tokenizer().count_tokens(text)
     return response.total_tokens
 
 
-def calculate_vertex_ai_cost(input_tokens: int, output_tokens: int) -> float:
-    INPUT_PRICE_PER_MILLION_TOKENS = 0.075  # $0.075 per 1M input tokens
-    OUTPUT_PRICE_PER_MILLION_TOKENS = 0.30  # $0.30 per 1M output tokens
-    USD_TO_AUD_RATE = 1.5  # Fixed exchange rate for estimate
+USD_TO_AUD_RATE = 1.5  # Fixed exchange rate for estimate
+
+# USD per 1M (input, output) tokens, matched by model name prefix. Gemini 1.5 prices are for prompts up to 128k tokens.
+MODEL_PRICES_PER_MILLION_TOKENS = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+}
+
+
+@lru_cache(maxsize=None)
+def get_model_prices(model_name: Optional[str]) -> Tuple[float, float]:
+    """Return the USD (input, output) prices per 1M tokens of a model, Flash prices for unknown models."""
+    for prefix, prices in MODEL_PRICES_PER_MILLION_TOKENS.items():
+        if model_name and model_name.startswith(prefix):
+            return prices
+    logger.warning(f"No price for model {model_name}, costing it at {GEMINI_FLASH} prices")
+    return get_model_prices(GEMINI_FLASH)
 
-    input_cost = (input_tokens / 1_000_000) * INPUT_PRICE_PER_MILLION_TOKENS
-    output_cost = (output_tokens / 1_000_000) * OUTPUT_PRICE_PER_MILLION_TOKENS
+
+def calculate_vertex_ai_cost(input_tokens: int, output_tokens: int, model_name: Optional[str] = GEMINI_FLASH) -> float:
+    input_price, output_price = get_model_prices(model_name)
+
+    input_cost = (input_tokens / 1_000_000) * input_price
+    output_cost = (output_tokens / 1_000_000) * output_price
 
     total_cost_usd = input_cost + output_cost
     total_cost_aud = total_cost_usd * USD_TO_AUD_RATE
@@ -84,6 +166,163 @@ def calculate_vertex_ai_cost(input_tokens: int, output_tokens: int) -> float:
     return total_cost_aud
 
 
+@dataclass
+class TokenUsage:
+    """Metered usage of one (stage, chain, model), cost in AUD."""
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    # Calls whose response carried no usage metadata, their tokens are estimated
+    unmetered_calls: int = 0
+    # Attempts that failed after the model processed them, e.g. timed out or cancelled, included in calls
+    failed_calls: int = 0
+
+    def add(self, other: "TokenUsage") -> None:
+        self.calls += other.calls
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cost += other.cost
+        self.unmetered_calls += other.unmetered_calls
+        self.failed_calls += other.failed_calls
+
+
+def response_token_usage(response: LLMResult) -> Optional[Tuple[int, int]]:
+    """
+    Return the (input, output) tokens reported by a model response, None if it reported none.
+
+    Reads the standard AIMessage.usage_metadata, and Vertex's raw usage_metadata for models that only set that.
+    """
+    for generations in response.generations:
+        for generation in generations[:1]:
+            message = getattr(generation, "message", None)
+            if message is not None and getattr(message, "usage_metadata", None):
+                return message.usage_metadata["input_tokens"], message.usage_metadata["output_tokens"]
+            metadata = (message.response_metadata if message is not None else generation.generation_info) or {}
+            usage = metadata.get("usage_metadata") or {}
+            if "prompt_token_count" in usage:
+                return usage["prompt_token_count"], usage.get("candidates_token_count", 0)
+    return None
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Records the usage metadata of every model response under one stage and chain of a UsageMeter."""
+
+    # Recording is a few additions, no need for an executor thread per callback
+    run_inline = True
+
+    def __init__(self, meter: "UsageMeter", stage: str, chain: str):
+        self.meter = meter
+        self.stage = stage
+        self.chain = chain
+        self.model_names: Dict[UUID, Optional[str]] = {}
+
+    def _start(self, run_id: UUID, metadata: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> None:
+        invocation_params = kwargs.get("invocation_params") or {}
+        self.model_names[run_id] = (metadata or {}).get("ls_model_name") or invocation_params.get("model_name") or invocation_params.get("model")
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, metadata, kwargs)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, metadata, kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        model_name = self.model_names.pop(run_id, None) or (response.llm_output or {}).get("model_name")
+        usage = response_token_usage(response)
+        if usage is None:
+            self.meter.record_unmetered(self.stage, self.chain, model_name)
+        else:
+            self.meter.record(self.stage, self.chain, model_name, *usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, response: Optional[LLMResult] = None, **kwargs: Any) -> None:
+        model_name = self.model_names.pop(run_id, None)
+        usage = response_token_usage(response) if response is not None else None
+        if usage is not None:
+            self.meter.record(self.stage, self.chain, model_name, *usage, failed=True)
+        elif not isinstance(error, GoogleAPICallError):
+            # API errors are rejected before any tokens are processed, but a timed out or cancelled request
+            # may still be billed, so it is counted with estimated tokens
+            self.meter.record_unmetered(self.stage, self.chain, model_name, failed=True)
+
+
+class UsageMeter:
+    """
+    Token usage and cost of LLM calls by stage, chain and model, from the usage metadata of each response.
+
+    Each model response is priced with its own model's prices, so retries are counted and a stage calling
+    Pro is not costed at Flash prices. Failed attempts the model still processed are counted too. Cached
+    responses never reach the model and cost nothing. Thread-safe, the process-wide meter is updated from
+    every session's thread.
+    """
+
+    def __init__(self):
+        self.usage: Dict[Tuple[str, str, str], TokenUsage] = {}
+        self._lock = threading.Lock()
+
+    def _usage(self, stage: str, chain: str, model_name: Optional[str]) -> TokenUsage:
+        return self.usage.setdefault((stage, chain, model_name or "unknown"), TokenUsage())
+
+    def record(
+        self, stage: str, chain: str, model_name: Optional[str], input_tokens: int, output_tokens: int,
+        calls: int = 1, price_factor: float = 1.0, failed: bool = False,
+    ) -> None:
+        # price_factor discounts e.g. batch prediction
+        cost = calculate_vertex_ai_cost(input_tokens, output_tokens, model_name) * price_factor
+        with self._lock:
+            usage = self._usage(stage, chain, model_name)
+            usage.calls += calls
+            usage.input_tokens += input_tokens
+            usage.output_tokens += output_tokens
+            usage.cost += cost
+            usage.failed_calls += calls if failed else 0
+
+    def record_unmetered(self, stage: str, chain: str, model_name: Optional[str], failed: bool = False) -> None:
+        with self._lock:
+            usage = self._usage(stage, chain, model_name)
+            usage.calls += 1
+            usage.unmetered_calls += 1
+            usage.failed_calls += 1 if failed else 0
+
+    def callback(self, stage: str, chain: str) -> UsageCallbackHandler:
+        return UsageCallbackHandler(self, stage, chain)
+
+    def _snapshot(self) -> Dict[Tuple[str, str, str], TokenUsage]:
+        with self._lock:
+            return {key: TokenUsage(**usage.__dict__) for key, usage in self.usage.items()}
+
+    def merge(self, other: "UsageMeter") -> None:
+        # Copy first, so the two meters' locks are never held together
+        other_usage = other._snapshot()
+        with self._lock:
+            for key, usage in other_usage.items():
+                self._usage(*key).add(usage)
+
+    def total(self) -> TokenUsage:
+        total = TokenUsage()
+        for usage in self._snapshot().values():
+            total.add(usage)
+        return total
+
+    def summary(self) -> List[Dict[str, Any]]:
+        return [{"stage": stage, "chain": chain, "model": model_name, **usage.__dict__} for (stage, chain, model_name), usage in sorted(self._snapshot().items())]
+
+    def log_summary(self, title: str = "LLM usage") -> None:
+        for row in self.summary():
+            logger.info(f"{title}: {row['stage']}/{row['chain']} on {row['model']}: {row['calls']} calls, {row['input_tokens']} input and "
+                        f"{row['output_tokens']} output tokens, ${row['cost']:.4f} AUD" +
+                        (f" ({row['unmetered_calls']} calls without usage metadata)" if row["unmetered_calls"] else "") +
+                        (f" ({row['failed_calls']} failed calls)" if row["failed_calls"] else ""))
+        total = self.total()
+        logger.info(f"{title} total: {total.calls} calls, {total.input_tokens} input and {total.output_tokens} output tokens, ${total.cost:.4f} AUD")
+
+
+@lru_cache(maxsize=None)
+def get_usage_meter() -> UsageMeter:
+    """The process-wide meter, every run_chain_on_inputs call adds its usage to it."""
+    return UsageMeter()
+
+
 def create_empty_model(model: BaseModel):
     def empty_value(field_type: Any):
         origin = get_origin(field_type)
@@ -120,48 +359,450 @@ def create_empty_model(model: BaseModel):
     
     return model(**fields)
 
-async def apply_chain_to_input(chain: Any, input: Any, default_model: BaseModel) -> Any:
+class ChainCallStatus(str, Enum):
+    """How a chain call ended. Anything but OK means the result is the default empty model."""
+    OK = "ok"
+    RETRIES_EXHAUSTED = "retries_exhausted"
+    BUDGET_EXHAUSTED = "budget_exhausted"
+    PERMANENT_ERROR = "permanent_error"
+    REPLAY_MISS = "replay_miss"
+    # Still in flight, or not started, when the caller's deadline passed
+    DEADLINE_EXCEEDED = "deadline_exceeded"
+
+
+class ChainCallSource(str, Enum):
+    """Where the result of a chain call came from, to tell the calls sent to the model from the ones that were not."""
+    MODEL = "model"
+    # Served by the LLM response cache, replay misses included, neither is sent to the model
+    CACHE = "cache"
+    # Shared from an identical call already in flight
+    COALESCED = "coalesced"
+
+
+class ChainResults(list):
+    """
+    The results of run_chain_on_inputs, a list with the status of each call alongside.
+
+    Args:
+        results (List[Any]): The chain outputs, default empty models for failed calls.
+        statuses (List[ChainCallStatus]): The status of each call, in the same order.
+    """
+
+    def __init__(self, results: List[Any], statuses: List[ChainCallStatus]):
+        super().__init__(results)
+        self.statuses = statuses
+
+    @property
+    def failed(self) -> List[int]:
+        """The positions of the inputs that got a default model instead of an answer."""
+        return [i for i, status in enumerate(self.statuses) if status != ChainCallStatus.OK]
+
+    def status_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for status in self.statuses:
+            counts[status.value] = counts.get(status.value, 0) + 1
+        return counts
+
+
+async def apply_chain_to_input_with_status(
+    chain: Any,
+    input: Any,
+    default_model: BaseModel,
+    limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+    retry_budget: Optional[RetryBudget] = None,
+    max_retries: int = LLM_MAX_RETRIES,
+    timeout: Optional[float] = LLM_CALL_TIMEOUT_SECONDS,
+    cache: Optional[LLMResponseCache] = None,
+    callbacks: Optional[List[BaseCallbackHandler]] = None,
+    coalesce: bool = True,
+    hedge_percentile: Optional[float] = None,
+) -> Tuple[Any, ChainCallStatus]:
     """
-    Apply a chain to a single input asynchronously.
+    Apply a chain to a single input, retrying transient errors with jittered exponential backoff.
+
+    Identical requests already in flight, e.g. two sessions running the same search, are coalesced onto one
+    call through the process-wide SingleFlight when they share the same retry, timeout and hedge policy, and
+    every caller gets a copy of its result and status.
 
     Args:
         chain (Any): The chain to apply.
         input (Any): The input to process.
+        default_model (BaseModel): The output model, its empty instance is returned on errors.
+        limiter (AdaptiveConcurrencyLimiter): Waits for a slot before each attempt and learns from its outcome.
+        retry_budget (RetryBudget): The retries shared with the rest of the batch, unlimited if None.
+        max_retries (int): The maximum number of retries of this call.
+        timeout (float): The seconds an attempt may take before it is cancelled and retried.
+        cache (LLMResponseCache): Serves repeated requests without calling the model, and stores successful outputs.
+        callbacks (List[BaseCallbackHandler]): Callbacks of every attempt, e.g. a UsageMeter callback.
+        coalesce (bool): Share the call with identical requests in flight, unless LLM_COALESCE_REQUESTS is disabled.
+        hedge_percentile (float): Send a duplicate of an attempt running past this latency percentile of the chain,
+            e.g. 0.95, and keep the first answer. None never hedges.
+
+    Returns:
+        Tuple[Any, ChainCallStatus]: The result, or the empty default model, and how the call ended.
+    """
+    result, status, _ = await _apply_chain_to_input(
+        chain, input, default_model, limiter, retry_budget, max_retries, timeout, cache, callbacks, coalesce, hedge_percentile
+    )
+    return result, status
+
+
+async def _apply_chain_to_input(
+    chain: Any,
+    input: Any,
+    default_model: BaseModel,
+    limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+    retry_budget: Optional[RetryBudget] = None,
+    max_retries: int = LLM_MAX_RETRIES,
+    timeout: Optional[float] = LLM_CALL_TIMEOUT_SECONDS,
+    cache: Optional[LLMResponseCache] = None,
+    callbacks: Optional[List[BaseCallbackHandler]] = None,
+    coalesce: bool = True,
+    hedge_percentile: Optional[float] = None,
+) -> Tuple[Any, ChainCallStatus, ChainCallSource]:
+    """apply_chain_to_input_with_status, also returning where the result came from."""
+    single_flight = get_single_flight() if coalesce else None
+    cache_key = llm_request_key(chain, input, default_model) if cache is not None or single_flight is not None else None
+    # Only calls made under the same retry, timeout and hedge policy are coalesced, so no caller inherits
+    # a call that could outlive its own budget or give up before it would
+    flight_key = hash_key(cache_key, max_retries, timeout, hedge_percentile) if cache_key is not None else None
+    if cache_key is not None and cache is not None:
+        cached = await cache.aget(cache_key, default_model)
+        if cached is not None:
+            return cached, ChainCallStatus.OK, ChainCallSource.CACHE
+        if cache.read_only:
+            logger.warning(f"No cached LLM response to replay for input: {input}. Returning default model.")
+            return create_empty_model(default_model), ChainCallStatus.REPLAY_MISS, ChainCallSource.CACHE
+
+    async def call() -> Tuple[Any, ChainCallStatus]:
+        return await _apply_chain_with_retries(
+            chain, input, default_model, limiter, retry_budget, max_retries, timeout, cache, cache_key, callbacks, hedge_percentile
+        )
+
+    if single_flight is None or flight_key is None:
+        return (*await call(), ChainCallSource.MODEL)
+    (answer, status), shared = await single_flight.run(flight_key, call)
+    if not shared:
+        return answer, status, ChainCallSource.MODEL
+    # Waiters get their own copy, callers may modify their result
+    return (answer.model_copy(deep=True) if isinstance(answer, BaseModel) else answer), status, ChainCallSource.COALESCED
+
+
+async def _apply_chain_with_retries(
+    chain: Any,
+    input: Any,
+    default_model: BaseModel,
+    limiter: Optional[AdaptiveConcurrencyLimiter],
+    retry_budget: Optional[RetryBudget],
+    max_retries: int,
+    timeout: Optional[float],
+    cache: Optional[LLMResponseCache],
+    cache_key: Optional[str],
+    callbacks: Optional[List[BaseCallbackHandler]],
+    hedge_percentile: Optional[float],
+) -> Tuple[Any, ChainCallStatus]:
+    """Call the chain until it succeeds or its retries run out, see apply_chain_to_input_with_status."""
+    latency_tracker = get_latency_tracker(default_model.__name__, getattr(find_chat_model(chain), "model_name", None))
+    attempt = 0
+    while True:
+        started_at = await limiter.acquire() if limiter is not None else time.monotonic()
+        error = None
+        abandoned = False
+        try:
+            hedge_after = latency_tracker.percentile(hedge_percentile) if hedge_percentile is not None else None
+            config = {"max_concurrency": 10, "callbacks": callbacks}
+            attempt_started_at = time.monotonic()
+            answer = await invoke_hedged(chain, input, config, timeout, hedge_after, latency_tracker)
+            latency_tracker.record(time.monotonic() - attempt_started_at)
+            if cache is not None and cache_key is not None and isinstance(answer, default_model):
+                await cache.aset(cache_key, answer)
+            return answer, ChainCallStatus.OK
+        except Exception as e:
+            error = e
+        except BaseException:
+            # Cancelled, e.g. at a deadline or by a disconnected client, which must not grow the window
+            abandoned = True
+            raise
+        finally:
+            if limiter is not None:
+                # Shielded, so a second cancellation cannot leak the slot
+                await asyncio.shield(limiter.release(started_at, error, abandoned=abandoned))
+
+        if not is_retryable_error(error):
+            status = ChainCallStatus.PERMANENT_ERROR
+        elif attempt >= max_retries:
+            status = ChainCallStatus.RETRIES_EXHAUSTED
+        elif retry_budget is not None and not retry_budget.try_spend():
+            status = ChainCallStatus.BUDGET_EXHAUSTED
+        else:
+            delay = retry_delay(attempt)
+            logger.warning(f"Retrying in {delay:.1f}s after attempt {attempt + 1} failed: {type(error).__name__}: {error}")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        logger.error(f"Error processing input: {input}. Error: {type(error).__name__}: {error}. Returning default model ({status.value}).")
+        return create_empty_model(default_model), status
+
+
+async def apply_chain_to_input(chain: Any, input: Any, default_model: BaseModel, **kwargs: Any) -> Any:
+    """
+    Apply a chain to a single input asynchronously, see apply_chain_to_input_with_status for the arguments.
 
     Returns:
-        Any: The result of applying the chain to the input.
+        Any: The result of applying the chain to the input, or the empty default model if it failed.
+    """
+    result, _ = await apply_chain_to_input_with_status(chain, input, default_model, **kwargs)
+    return result
+
+
+@dataclass
+class ChainProgress:
+    """A progress report of stream_chain_on_inputs."""
+    completed: int
+    # None when the inputs are an iterator of unknown length
+    total: Optional[int]
+    errors: int
+    elapsed_seconds: float
+    # Completions per second since the start, and over the limiter's recent window
+    rate: float
+    recent_rate: float
+    eta_seconds: Optional[float]
+    window: int
+    in_flight: int
+
+
+def log_chain_progress(progress: ChainProgress) -> None:
+    """Default progress callback, logs one line per report."""
+    total = f"/{progress.total}" if progress.total is not None else ""
+    eta = f", ETA {progress.eta_seconds:.0f}s" if progress.eta_seconds is not None else ""
+    logger.info(f"Chain progress: {progress.completed}{total} done, {progress.errors} errors, {progress.rate:.2f} calls/s "
+                f"({progress.recent_rate:.2f} recent){eta}, window {progress.window}, {progress.in_flight} in flight")
+
+
+async def stream_chain_on_inputs(
+    chain: Any,
+    inputs: Iterable[Any],
+    default_model: BaseModel,
+    limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+    cache: Optional[LLMResponseCache] = None,
+    cache_mode: str = LLM_RESPONSE_CACHE_MODE,
+    retry_budget: Optional[RetryBudget] = None,
+    progress_callback: Optional[Callable[[ChainProgress], None]] = log_chain_progress,
+    progress_interval_seconds: float = 10.0,
+    callbacks: Optional[List[BaseCallbackHandler]] = None,
+    deadline_seconds: Optional[float] = None,
+    hedge_percentile: Optional[float] = None,
+    source_counts: Optional[Dict[ChainCallSource, int]] = None,
+) -> AsyncIterator[Tuple[int, Any, ChainCallStatus]]:
+    """
+    Run a chain on the inputs and yield each result as soon as its call completes.
+
+    Work is bounded end to end: inputs are drawn lazily by max_limit workers, the limiter bounds the calls
+    in flight, and finished results wait in a queue of max_limit entries, so a slow consumer (e.g. one
+    persisting each result) pauses the workers instead of accumulating results in memory.
+
+    Args:
+        chain (Any): The chain to run.
+        inputs (Iterable[Any]): The inputs, a list or a lazy iterator.
+        default_model (BaseModel): The output model, its empty instance is yielded for failed inputs.
+        limiter (AdaptiveConcurrencyLimiter): Shared limiter, a new one by default.
+        cache (LLMResponseCache): The response cache, the process-wide one of cache_mode by default.
+        cache_mode (str): The mode of the default response cache, e.g. LLM_INTERACTIVE_RESPONSE_CACHE_MODE for
+            interactive chains. Ignored when a cache is given.
+        retry_budget (RetryBudget): The retries shared by the inputs, sized from the inputs by default.
+        progress_callback (Callable[[ChainProgress], None]): Called at most every progress_interval_seconds
+            and once at the end. None disables progress reports.
+        progress_interval_seconds (float): The minimum time between progress reports.
+        callbacks (List[BaseCallbackHandler]): Callbacks of every model call, e.g. a UsageMeter callback.
+        deadline_seconds (float): The time budget of the whole run. When it passes, the calls in flight are
+            cancelled and yielded as DEADLINE_EXCEEDED with default models, as are the inputs not started when
+            the inputs are sized. None waits for every call.
+        hedge_percentile (float): Hedge calls slower than this latency percentile, see apply_chain_to_input_with_status.
+        source_counts (Dict[ChainCallSource, int]): Incremented with the source of every completed call, so a run can
+            tell its own cache hits and coalesced calls from those of runs overlapping it. Stragglers are not counted.
+
+    Yields:
+        Tuple[int, Any, ChainCallStatus]: The input position, the result and the call status, in completion order.
     """
+    limiter = limiter or AdaptiveConcurrencyLimiter()
+    # Opening the cache database on first use is blocking SQLite work
+    cache = cache if cache is not None else await asyncio.to_thread(get_llm_response_cache, cache_mode)
+    total = len(inputs) if hasattr(inputs, "__len__") else None
+    if retry_budget is None:
+        retry_budget = RetryBudget.for_batch(total) if total is not None else RetryBudget(10, per_input=LLM_RETRY_BUDGET_RATIO)
+    pending = iter(enumerate(inputs))
+    completions: asyncio.Queue = asyncio.Queue(maxsize=limiter.max_limit)
+    n_workers = limiter.max_limit if total is None else min(limiter.max_limit, total)
+    in_flight = set()
+
+    async def worker() -> None:
+        try:
+            # Workers share one iterator, the limiter decides how many of them are calling the model at once
+            for i, input in pending:
+                in_flight.add(i)
+                retry_budget.record_input()
+                result, status, source = await _apply_chain_to_input(
+                    chain, input, default_model=default_model, limiter=limiter, retry_budget=retry_budget, cache=cache,
+                    callbacks=callbacks, hedge_percentile=hedge_percentile,
+                )
+                if source_counts is not None:
+                    source_counts[source] = source_counts.get(source, 0) + 1
+                await completions.put((i, result, status))
+                in_flight.discard(i)
+        except asyncio.CancelledError:
+            # Cancelled by the consumer, which no longer waits for the end marker
+            raise
+        except BaseException:
+            await completions.put(None)
+            raise
+        await completions.put(None)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(n_workers)]
+    started_at = time.monotonic()
+    deadline = started_at + deadline_seconds if deadline_seconds is not None else None
+    reported_at = started_at
+    completed = errors = 0
+
+    def report() -> None:
+        elapsed = time.monotonic() - started_at
+        rate = completed / elapsed if elapsed > 0 else 0.0
+        eta = (total - completed) / rate if total is not None and rate > 0 else None
+        progress_callback(ChainProgress(completed, total, errors, elapsed, rate, limiter.throughput, eta, limiter.limit, limiter.in_flight))
+
     try:
-        answer = await chain.ainvoke(input=input, config={"max_concurrency": 10})
-        return answer
-    except Exception as e:
-        logger.error(f"Error processing input: {input}. Error: {str(e)}. Returning default model.")
-        return create_empty_model(default_model)
+        running = n_workers
+        while running:
+            try:
+                item = await asyncio.wait_for(completions.get(), max(deadline - time.monotonic(), 0) if deadline is not None else None)
+            except asyncio.TimeoutError:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                # Results already queued made it in time
+                while not completions.empty():
+                    item = completions.get_nowait()
+                    if item is not None:
+                        in_flight.discard(item[0])
+                        completed += 1
+                        errors += item[2] != ChainCallStatus.OK
+                        yield item
+                stragglers = sorted(in_flight) + ([i for i, _ in pending] if total is not None else [])
+                logger.warning(f"Deadline of {deadline_seconds:.1f}s passed with {completed} calls done, returning default models for {len(stragglers)} stragglers")
+                for i in stragglers:
+                    completed += 1
+                    errors += 1
+                    yield i, create_empty_model(default_model), ChainCallStatus.DEADLINE_EXCEEDED
+                break
+            if item is None:
+                running -= 1
+                continue
+            completed += 1
+            errors += item[2] != ChainCallStatus.OK
+            yield item
+            if progress_callback is not None and time.monotonic() - reported_at >= progress_interval_seconds:
+                reported_at = time.monotonic()
+                report()
+        # Surface worker errors (e.g. an input iterator that raised) instead of ending silently
+        for task in workers:
+            if not task.cancelled():
+                task.result()
+        if progress_callback is not None:
+            report()
+        if errors:
+            logger.warning(f"{errors} of {completed} inputs got default models, {retry_budget.used} of {retry_budget.max_retries:.0f} retries used")
+    finally:
+        for task in workers:
+            task.cancel()
 
 
 async def run_chain_on_inputs(
-    chain: Any, inputs: List[Any], default_model: BaseModel
-) -> Tuple[List[Any], float, int, int]:
+    chain: Any,
+    inputs: List[Any],
+    default_model: BaseModel,
+    limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+    cache: Optional[LLMResponseCache] = None,
+    cache_mode: str = LLM_RESPONSE_CACHE_MODE,
+    progress_callback: Optional[Callable[[ChainProgress], None]] = log_chain_progress,
+    stage: Optional[str] = None,
+    deadline_seconds: Optional[float] = None,
+    hedge_percentile: Optional[float] = None,
+) -> Tuple[ChainResults, float, int, int]:
     """
-    Run a chain on a list of inputs asynchronously and estimate the cost.
+    Run a chain on a list of inputs asynchronously and meter the cost.
+
+    Collects the results of stream_chain_on_inputs in input order: in-flight calls are bounded by an
+    AdaptiveConcurrencyLimiter, transient errors are retried within a retry budget shared by the batch, and
+    the returned results carry a status per input. Requests answered before are served from the LLM response
+    cache.
+
+    Tokens and cost come from the usage metadata of each response, priced per model and added to the
+    process-wide get_usage_meter(). Calls whose responses carry no usage metadata are estimated by tokenizing a
+    sample of the prompts and outputs.
 
     Args:
         chain (Any): The chain to run.
         inputs (List[Any]): The list of inputs to process.
+        default_model (BaseModel): The output model, its empty instance is returned for failed inputs.
+        limiter (AdaptiveConcurrencyLimiter): Shared limiter, e.g. across stages calling the same model. A new one by default.
+        cache (LLMResponseCache): The response cache, the process-wide one of cache_mode by default.
+        cache_mode (str): The mode of the default response cache, e.g. LLM_INTERACTIVE_RESPONSE_CACHE_MODE for
+            interactive chains. Ignored when a cache is given.
+        progress_callback (Callable[[ChainProgress], None]): Receives progress reports, logs them by default.
+        stage (str): The stage the usage is reported under, the output model name by default.
+        deadline_seconds (float): The time budget of the run. Calls not done by then are cancelled, and their
+            inputs get default models with the DEADLINE_EXCEEDED status. None waits for every call.
+        hedge_percentile (float): Send a duplicate of calls running past this latency percentile of the chain
+            and keep the first answer, e.g. 0.95 for interactive paths. None never hedges.
 
     Returns:
-        Tuple[List[Any], float, int, int]: A tuple containing:
-            - The list of results
-            - The estimated cost
-            - The estimated input tokens
-            - The estimated output tokens
-    """
-    tasks = [apply_chain_to_input(chain, input, default_model=default_model) for input in inputs]
-    results = await asyncio.gather(*tasks)
-    estimated_cost, est_input_tokens, est_output_tokens = estimate_cost_from_sample(
-        inputs, results, chain
-    )
-    return results, estimated_cost, est_input_tokens, est_output_tokens
+        Tuple[ChainResults, float, int, int]: A tuple containing:
+            - The list of results, with their ChainCallStatus in results.statuses
+            - The cost in AUD
+            - The input tokens
+            - The output tokens
+    """
+    # Opening the cache database on first use is blocking SQLite work
+    cache = cache if cache is not None else await asyncio.to_thread(get_llm_response_cache, cache_mode)
+    chain_name = default_model.__name__
+    stage = stage or chain_name
+    meter = UsageMeter()
+    results: List[Any] = [None] * len(inputs)
+    statuses: List[ChainCallStatus] = [ChainCallStatus.OK] * len(inputs)
+    # Counted per run, the cache and SingleFlight totals also count the hits of other runs overlapping this one
+    source_counts = {source: 0 for source in ChainCallSource}
+    async for i, result, status in stream_chain_on_inputs(
+        chain, inputs, default_model, limiter=limiter, cache=cache, cache_mode=cache_mode, progress_callback=progress_callback,
+        callbacks=[meter.callback(stage, chain_name)], deadline_seconds=deadline_seconds, hedge_percentile=hedge_percentile,
+        source_counts=source_counts,
+    ):
+        results[i], statuses[i] = result, status
+    results = ChainResults(results, statuses)
+    if results.failed:
+        logger.warning(f"Inputs with default models by status: {results.status_counts()}")
+
+    # Cached, unreplayed and coalesced requests, and stragglers never started, were not sent, so they cost nothing
+    cache_hits = source_counts[ChainCallSource.CACHE] - results.statuses.count(ChainCallStatus.REPLAY_MISS)
+    coalesced = source_counts[ChainCallSource.COALESCED]
+    sent = source_counts[ChainCallSource.MODEL]
+    usage = meter.total()
+    # Calls that returned no usage metadata, or never reached a metered chat model
+    unmetered = usage.unmetered_calls + max(sent - usage.calls, 0)
+    if unmetered:
+        chat_model = find_chat_model(chain)
+        model_name = getattr(chat_model, "model_name", None)
+        logger.warning(f"{unmetered} calls of {stage} returned no usage metadata, estimating their tokens from a sample")
+        # The tokenizer calls are synchronous, keep them off the event loop
+        _, sample_input_tokens, sample_output_tokens = await asyncio.to_thread(estimate_cost_from_sample, inputs, results, chain)
+        meter.record(stage, chain_name, model_name, int(sample_input_tokens * unmetered / len(inputs)),
+                     int(sample_output_tokens * unmetered / len(inputs)), calls=max(sent - usage.calls, 0))
+        usage = meter.total()
+    if cache is not None:
+        logger.info(f"LLM response cache: {cache_hits} hits, {len(inputs) - cache_hits} misses")
+    if coalesced:
+        logger.info(f"Coalesced {coalesced} calls onto identical requests in flight")
+    meter.log_summary()
+    get_usage_meter().merge(meter)
+    return results, usage.cost, usage.input_tokens, usage.output_tokens
 
 
 def estimate_cost_from_sample(
@@ -189,7 +830,8 @@ def estimate_cost_from_sample(
     estimated_output_tokens = (output_tokens / max(sample_size, 1)) * total_items
 
     # Calculate estimated cost
-    estimated_cost = calculate_vertex_ai_cost(estimated_input_tokens, estimated_output_tokens)
+    chat_model = find_chat_model(chain)
+    estimated_cost = calculate_vertex_ai_cost(estimated_input_tokens, estimated_output_tokens, getattr(chat_model, "model_name", None))
 
     return estimated_cost, estimated_input_tokens, estimated_output_tokens
 
@@ -0,0 +1,188 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import concurrent.futures
+import json
+import threading
+from functools import lru_cache
+from langchain_core.language_models import BaseChatModel
+from pydantic import BaseModel, ValidationError
+from loguru import logger
+from backend.core.env import LLM_RESPONSE_CACHE_MODE, LLM_RESPONSE_CACHE_PATH, LLM_RESPONSE_CACHE_MAX_BYTES, LLM_COALESCE_REQUESTS
+from backend.core.utils.utils_cache import SQLiteCache, hash_key
+
+
+def find_chat_model(runnable: Any) -> Optional[BaseChatModel]:
+    """Return the chat model inside a chain, e.g. prompt | model.with_structured_output(Schema)."""
+    if isinstance(runnable, BaseChatModel):
+        return runnable
+    for child in [getattr(runnable, "bound", None), *getattr(runnable, "steps", [])]:
+        if child is not None and (model := find_chat_model(child)) is not None:
+            return model
+    return None
+
+
+@lru_cache(maxsize=256)
+def _schema_json(schema: type) -> str:
+    return json.dumps(schema.model_json_schema(), sort_keys=True)
+
+
+def llm_request_key(chain: Any, input: Any, schema: type) -> Optional[str]:
+    """
+    Hash the content of a chain call: the fully formatted prompt, the model type, its params and the output schema.
+
+    Args:
+        chain (Any): A chain of a prompt and a chat model, e.g. prompt | model.with_structured_output(schema).
+        input (Any): The chain input.
+        schema (type): The Pydantic output model.
+
+    Returns:
+        Optional[str]: The key, None if the chain has no prompt and chat model to key on.
+    """
+    model = find_chat_model(chain)
+    steps = getattr(chain, "steps", None)
+    if model is None or not steps:
+        return None
+    prompt_text = steps[0].invoke(input).to_string()
+    params = json.dumps(model._identifying_params, sort_keys=True, default=str)
+    return hash_key(prompt_text, model._llm_type, params, _schema_json(schema))
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of validated structured chain outputs, addressed by the content of the request.
+
+    The key hashes the fully formatted prompt, the model type and name, its generation params and the output
+    schema, so a change to any of them is a miss. Values are the outputs as JSON, validated again on read.
+    The least recently used entries are evicted past max_bytes.
+
+    Args:
+        path (str): The SQLite database file.
+        max_bytes (int): The maximum total size of cached outputs.
+        read_only (bool): Replay mode, for offline runs: never writes, and misses are not sent to the model.
+    """
+
+    def __init__(self, path: str = LLM_RESPONSE_CACHE_PATH, max_bytes: Optional[int] = LLM_RESPONSE_CACHE_MAX_BYTES, read_only: bool = False):
+        self.disk_cache = SQLiteCache(path, table="llm_responses", max_bytes=max_bytes, read_only=read_only)
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        # Lookups run on worker threads, see aget
+        self._stats_lock = threading.Lock()
+
+    def key(self, chain: Any, input: Any, schema: type) -> Optional[str]:
+        """Build the cache key of a chain call, see llm_request_key."""
+        return llm_request_key(chain, input, schema)
+
+    def get(self, key: str, schema: type) -> Optional[BaseModel]:
+        value = self.disk_cache.get(key)
+        if value is not None:
+            try:
+                result = schema.model_validate_json(value)
+                with self._stats_lock:
+                    self.hits += 1
+                return result
+            except ValidationError:
+                logger.warning(f"Discarding cached LLM response that no longer validates against {schema.__name__}")
+        with self._stats_lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: BaseModel) -> None:
+        self.disk_cache.set(key, value.model_dump_json().encode("utf-8"))
+
+    async def aget(self, key: str, schema: type) -> Optional[BaseModel]:
+        """get on a worker thread, so the SQLite read does not block the event loop."""
+        return await asyncio.to_thread(self.get, key, schema)
+
+    async def aset(self, key: str, value: BaseModel) -> None:
+        """set on a worker thread, so the SQLite write and eviction do not block the event loop."""
+        await asyncio.to_thread(self.set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def close(self) -> None:
+        self.disk_cache.close()
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls in flight at the same time onto one call, and fans its result out to every waiter.
+
+    The first caller of a key (the leader) makes the call. Callers arriving while it runs wait on its
+    concurrent.futures.Future, so sessions running on different event loops and threads coalesce too. If
+    the leader is cancelled, one of the waiters takes over the call instead of failing. A waiter that is
+    cancelled itself re-raises its own cancellation, even when the leader was cancelled too.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run call(), or wait for the identical call already in flight under the key.
+
+        Args:
+            key (str): The request key, e.g. from llm_request_key.
+            call (Callable[[], Awaitable[Any]]): Makes the call, only awaited by the leader.
+
+        Returns:
+            Tuple[Any, bool]: The result of the call, shared by every caller of the key, and whether this caller
+                waited on another caller's call instead of making it.
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = self._calls[key] = concurrent.futures.Future()
+                    self.calls += 1
+            if is_leader:
+                break
+            try:
+                # Shielded, so a cancelled waiter does not cancel the call of the others
+                result = await asyncio.shield(asyncio.wrap_future(future))
+            except (asyncio.CancelledError, concurrent.futures.CancelledError):
+                task = asyncio.current_task()
+                if future.cancelled() and not (task is not None and task.cancelling()):
+                    # Only the leader was cancelled, retry as a new leader
+                    continue
+                raise
+            with self._lock:
+                self.coalesced += 1
+            return result, True
+
+        try:
+            result = await call()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+@lru_cache(maxsize=None)
+def get_single_flight() -> Optional[SingleFlight]:
+    """The process-wide SingleFlight, None when LLM_COALESCE_REQUESTS is disabled."""
+    return SingleFlight() if LLM_COALESCE_REQUESTS else None
+
+
+@lru_cache(maxsize=None)
+def get_llm_response_cache(mode: str = LLM_RESPONSE_CACHE_MODE) -> Optional[LLMResponseCache]:
+    """The process-wide response cache of a cache mode, LLM_RESPONSE_CACHE_MODE by default. None when it is off."""
+    if mode == "off":
+        return None
+    return LLMResponseCache(read_only=mode == "replay")
@@ -0,0 +1,413 @@
+from typing import Any, Deque, Dict, Optional
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from google.api_core.exceptions import ResourceExhausted, ServerError, TooManyRequests
+from langchain_core.exceptions import OutputParserException
+from langchain_core.rate_limiters import BaseRateLimiter, InMemoryRateLimiter
+from pydantic import ValidationError
+from loguru import logger
+from backend.core.env import LLM_INITIAL_CONCURRENCY, LLM_MAX_CONCURRENCY, LLM_HEDGE_MIN_SAMPLES
+from backend.core.env import LLM_RETRY_BASE_DELAY_SECONDS, LLM_RETRY_MAX_DELAY_SECONDS, LLM_RETRY_BUDGET_RATIO
+from backend.core.env import LLM_RATE_LIMITER_BACKEND, LLM_RATE_LIMITER_PATH, LLM_REQUESTS_PER_SECOND, LLM_MAX_BUCKET_SIZE
+
+
+class SQLiteRateLimiter(BaseRateLimiter):
+    """
+    Token bucket stored in SQLite, shared by every process on the host using the same file and key.
+
+    Each acquire refills the bucket from the wall-clock time since the last update and takes one token,
+    in an immediate transaction so concurrent processes never spend the same token.
+
+    Args:
+        path (str): The SQLite database file.
+        key (str): The bucket name, e.g. the model and location.
+        requests_per_second (float): The refill rate.
+        max_bucket_size (int): The maximum burst size.
+        check_every_n_seconds (float): The wait between attempts when the bucket is empty.
+    """
+
+    def __init__(self, path: str, key: str, requests_per_second: float = 1, max_bucket_size: int = 1, check_every_n_seconds: float = 0.1):
+        self.path = path
+        self.key = key
+        self.requests_per_second = requests_per_second
+        self.max_bucket_size = max_bucket_size
+        self.check_every_n_seconds = check_every_n_seconds
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # A short busy timeout: a locked bucket counts as empty, so async callers never block the event loop for long
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=check_every_n_seconds)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+
+    def _consume(self) -> bool:
+        with self._lock:
+            try:
+                self._connection.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                return False
+            try:
+                now = time.time()
+                row = self._connection.execute("SELECT tokens, updated_at FROM rate_limits WHERE key = ?", (self.key,)).fetchone()
+                # A new bucket starts empty like InMemoryRateLimiter, so restarts do not burst
+                tokens, updated_at = row if row is not None else (0.0, now)
+                tokens = min(self.max_bucket_size, tokens + max(now - updated_at, 0) * self.requests_per_second)
+                consumed = tokens >= 1
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (self.key, tokens - consumed, now),
+                )
+                self._connection.execute("COMMIT")
+                return consumed
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while not self._consume():
+            if not blocking:
+                return False
+            time.sleep(self.check_every_n_seconds)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        while not self._consume():
+            if not blocking:
+                return False
+            await asyncio.sleep(self.check_every_n_seconds)
+        return True
+
+
+@lru_cache(maxsize=None)
+def get_llm_rate_limiter(
+    model_name: str,
+    location: str,
+    requests_per_second: float = LLM_REQUESTS_PER_SECOND,
+    max_bucket_size: int = LLM_MAX_BUCKET_SIZE,
+    backend: str = LLM_RATE_LIMITER_BACKEND,
+) -> BaseRateLimiter:
+    """
+    Return the token bucket of a (model, location), one per process.
+
+    Quotas are per model and region, so every client of the same model and location must draw from the same
+    bucket. With the "sqlite" backend the bucket is also shared with the other processes on the host.
+
+    Args:
+        model_name (str): The model name.
+        location (str): The Vertex AI location.
+        requests_per_second (float): The refill rate.
+        max_bucket_size (int): The maximum burst size.
+        backend (str): "memory" or "sqlite".
+
+    Returns:
+        BaseRateLimiter: The shared rate limiter.
+    """
+    if backend == "sqlite":
+        logger.info(f"Sharing a {requests_per_second} RPS bucket for {model_name} in {location} through {LLM_RATE_LIMITER_PATH}")
+        return SQLiteRateLimiter(LLM_RATE_LIMITER_PATH, f"{model_name}@{location}", requests_per_second, max_bucket_size)
+    if backend != "memory":
+        raise ValueError(f"Unknown rate limiter backend: {backend}")
+    return InMemoryRateLimiter(
+        requests_per_second=requests_per_second,  # Requests per second
+        check_every_n_seconds=0.1,  # Wake up every 100 ms to check,
+        max_bucket_size=max_bucket_size,  # Controls the maximum burst size.
+    )
+
+
+class RetryBudget:
+    """
+    Caps the retries of one batch, so an outage fails the remaining inputs fast instead of retrying every one of them.
+
+    Args:
+        max_retries (float): The retries shared by all calls of the batch.
+        per_input (float): Retries added for every input started, for batches of unknown size.
+    """
+
+    def __init__(self, max_retries: float, per_input: float = 0.0):
+        self.max_retries = max_retries
+        self.per_input = per_input
+        self.used = 0
+
+    def record_input(self) -> None:
+        self.max_retries += self.per_input
+
+    @classmethod
+    def for_batch(cls, n_inputs: int, ratio: float = LLM_RETRY_BUDGET_RATIO, minimum: int = 10) -> "RetryBudget":
+        return cls(max(minimum, int(ratio * n_inputs)))
+
+    def try_spend(self) -> bool:
+        if self.used + 1 > self.max_retries:
+            return False
+        self.used += 1
+        return True
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """Return True for rate limit and quota errors (HTTP 429 / RESOURCE_EXHAUSTED), which mean the caller should slow down."""
+    if isinstance(error, (ResourceExhausted, TooManyRequests)):
+        return True
+    message = str(error).lower()
+    return "429" in message or "resource exhausted" in message or "quota" in message or "rate limit" in message
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Return True for errors a retry can fix: quota, timeouts, 5xx and connection errors, and malformed function calls.
+
+    Schema validation failures and safety blocks are permanent, the same prompt fails the same way again.
+    """
+    message = str(error).lower()
+    if "safety" in message or "blocked" in message:
+        return False
+    # Gemini occasionally emits an unparsable tool call, a fresh sample usually succeeds
+    if "malformed_function_call" in message:
+        return True
+    if isinstance(error, (ValidationError, OutputParserException)):
+        return False
+    if is_quota_error(error) or isinstance(error, (ServerError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return any(pattern in message for pattern in ("timeout", "timed out", "deadline", "unavailable", "500", "502", "503", "504"))
+
+
+def retry_delay(attempt: int, base_delay: float = LLM_RETRY_BASE_DELAY_SECONDS, max_delay: float = LLM_RETRY_MAX_DELAY_SECONDS) -> float:
+    """Exponential backoff with full jitter, so calls failing together do not retry together."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on the number of in-flight LLM calls, in the style of TCP congestion control.
+
+    - Additive increase: every healthy completion adds increase / limit, so the window grows by about
+      `increase` per window of completions. Healthy means a latency within latency_tolerance of the best
+      recent latency and a recent error rate below error_rate_threshold.
+    - Multiplicative decrease: a quota error, or an error rate over the threshold, multiplies the window by
+      decrease_factor. A slow completion multiplies it by latency_decrease_factor, since calls queueing behind
+      a rate limiter add latency without adding throughput. Calls started before the last decrease were sent
+      under the old window and do not decrease it again.
+    - Calls cancelled before they end, e.g. at a deadline, free their slot without adjusting the window.
+
+    The window stays within [min_limit, max_limit], max_limit being the hard ceiling.
+
+    Args:
+        initial_limit (int): The starting window.
+        min_limit (int): The smallest window.
+        max_limit (int): The hard ceiling on in-flight calls.
+        increase (float): The additive increase per window of healthy completions.
+        decrease_factor (float): The multiplicative decrease on quota errors.
+        latency_decrease_factor (float): The multiplicative decrease on slow completions.
+        latency_tolerance (float): Completions slower than this multiple of the best recent latency are unhealthy.
+        error_rate_threshold (float): The error rate over the last error_window outcomes that triggers a decrease.
+        error_window (int): The number of recent outcomes the error rate is computed over.
+        throughput_window_seconds (float): The period the throughput metric is averaged over.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = LLM_INITIAL_CONCURRENCY,
+        min_limit: int = 1,
+        max_limit: int = LLM_MAX_CONCURRENCY,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_decrease_factor: float = 0.9,
+        latency_tolerance: float = 2.0,
+        error_rate_threshold: float = 0.2,
+        error_window: int = 50,
+        throughput_window_seconds: float = 30.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_decrease_factor = latency_decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.error_rate_threshold = error_rate_threshold
+        self.throughput_window_seconds = throughput_window_seconds
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._best_latency: Optional[float] = None
+        self._outcomes: Deque[bool] = deque(maxlen=error_window)
+        self._completions: Deque[float] = deque()
+        self._last_decrease_at = float("-inf")
+        self._first_started_at: Optional[float] = None
+        self.successes = 0
+        self.errors = 0
+        self.quota_errors = 0
+
+    @property
+    def limit(self) -> int:
+        """The current window, the number of calls allowed in flight."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def throughput(self) -> float:
+        """Completions per second over the last throughput_window_seconds."""
+        now = time.monotonic()
+        while self._completions and now - self._completions[0] > self.throughput_window_seconds:
+            self._completions.popleft()
+        if self._first_started_at is None:
+            return 0.0
+        return len(self._completions) / max(min(self.throughput_window_seconds, now - self._first_started_at), 1e-3)
+
+    @property
+    def error_rate(self) -> float:
+        return 1 - sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free slot in the window.
+
+        Returns:
+            float: The monotonic time the call started, to pass back to release.
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        started_at = time.monotonic()
+        if self._first_started_at is None:
+            self._first_started_at = started_at
+        return started_at
+
+    def _decrease(self, factor: float, started_at: float, reason: str) -> None:
+        if started_at < self._last_decrease_at:
+            return
+        previous = self.limit
+        self._limit = max(self._limit * factor, self.min_limit)
+        self._last_decrease_at = time.monotonic()
+        logger.debug(f"Concurrency window {previous} -> {self.limit} ({reason})")
+
+    async def release(self, started_at: float, error: Optional[BaseException] = None, abandoned: bool = False) -> None:
+        """
+        Free the slot of a finished call and adjust the window from its outcome.
+
+        Args:
+            started_at (float): The start time returned by acquire.
+            error (BaseException): The error the call failed with, None on success.
+            abandoned (bool): The call was cancelled before it ended, e.g. at a deadline. Its slot is freed
+                without counting it as a success or an error, since it says nothing about the model's health.
+        """
+        if not abandoned:
+            self._record_outcome(started_at, error)
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _record_outcome(self, started_at: float, error: Optional[BaseException]) -> None:
+        now = time.monotonic()
+        latency = now - started_at
+        self._completions.append(now)
+        self._outcomes.append(error is None)
+        if error is None:
+            self.successes += 1
+            # The best latency slowly forgets, so a permanently slower endpoint becomes the new baseline
+            self._best_latency = latency if self._best_latency is None else min(self._best_latency * 1.01, latency)
+            if latency > self.latency_tolerance * self._best_latency:
+                self._decrease(self.latency_decrease_factor, started_at, f"latency {latency:.2f}s")
+            elif self.error_rate <= self.error_rate_threshold:
+                self._limit = min(self._limit + self.increase / self._limit, self.max_limit)
+        elif is_quota_error(error):
+            self.errors += 1
+            self.quota_errors += 1
+            self._decrease(self.decrease_factor, started_at, "quota error")
+        else:
+            self.errors += 1
+            if self.error_rate > self.error_rate_threshold:
+                self._decrease(self.decrease_factor, started_at, f"error rate {self.error_rate:.0%}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "throughput": self.throughput,
+            "successes": self.successes,
+            "errors": self.errors,
+            "quota_errors": self.quota_errors,
+            "error_rate": self.error_rate,
+        }
+
+    def log_stats(self, name: str = "LLM calls") -> None:
+        stats = self.stats()
+        logger.info(f"{name}: window {stats['limit']}, {stats['in_flight']} in flight, {stats['throughput']:.2f} calls/s, "
+                    f"{stats['successes']} ok, {stats['errors']} errors ({stats['quota_errors']} quota)")
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies of one chain and model, and the hedged requests they triggered.
+
+    Args:
+        window (int): The number of recent latencies kept.
+        min_samples (int): The number of latencies needed before percentiles are reported.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def record(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Return the q-quantile (0 to 1) of the recent latencies, None until min_samples are known."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"samples": len(self._latencies), "p50": self.percentile(0.5), "p95": self.percentile(0.95), "hedges": self.hedges, "hedges_won": self.hedges_won}
+
+
+@lru_cache(maxsize=None)
+def get_latency_tracker(chain_name: str, model_name: Optional[str]) -> LatencyTracker:
+    """The process-wide latency tracker of a chain (its output schema) on a model."""
+    return LatencyTracker()
+
+
+async def invoke_hedged(chain: Any, input: Any, config: Dict[str, Any], timeout: Optional[float], hedge_after: Optional[float], latency_tracker: LatencyTracker) -> Any:
+    """
+    Invoke the chain, and a duplicate if it has not answered after hedge_after seconds. The first answer wins
+    and the other call is cancelled, a failure waits for the other call.
+    """
+    if hedge_after is None:
+        return await asyncio.wait_for(chain.ainvoke(input=input, config=config), timeout)
+
+    async def race() -> Any:
+        tasks = [asyncio.ensure_future(chain.ainvoke(input=input, config=config))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                latency_tracker.hedges += 1
+                logger.debug(f"Hedging a call still running after {hedge_after:.1f}s")
+                tasks.append(asyncio.ensure_future(chain.ainvoke(input=input, config=config)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        latency_tracker.hedges_won += task is not tasks[0]
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return await asyncio.wait_for(race(), timeout)
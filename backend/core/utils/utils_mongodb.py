@@ -1,5 +1,23 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
+import asyncio
+import weakref
+
+# AsyncMongoClient is bound to the event loop it was first used on, so clients are kept per loop
+_async_clients = weakref.WeakKeyDictionary()
 
 def get_mongodb_collection(cluster_uri: str, db_name: str, collection_name: str):
     client = MongoClient(cluster_uri)
     return client[db_name][collection_name]
+
+def get_async_mongodb_collection(cluster_uri: str, db_name: str, collection_name: str):
+    """Return a collection on a shared AsyncMongoClient for the running event loop."""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if cluster_uri not in clients:
+        clients[cluster_uri] = AsyncMongoClient(cluster_uri)
+    return clients[cluster_uri][db_name][collection_name]
+
+async def aclose_async_mongodb_clients():
+    """Close the shared AsyncMongoClients of the running event loop."""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
@@ -0,0 +1,126 @@
+from typing import List, Optional
+from pathlib import Path
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from loguru import logger
+from backend.core.tools.local_vector_search import LocalVectorSearch
+from backend.core.tools.vector_quantization import FLOAT32, FLOAT16, INT8
+
+# The retrieval_evaluation results directory. It is not imported from there, because that module loads the
+# credentialed env module, which the synthetic source does not need
+QUANTIZATION_RESULTS_PATH = "backend/evaluation/results"
+
+
+def synthetic_vectors(n_rows: int, dimensions: int = 768, n_clusters: int = 256, seed: int = 42) -> np.ndarray:
+    """Clustered Gaussian vectors, a dense stand-in for recipe embeddings when no index is available."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(n_clusters, size=n_rows)] + 0.8 * rng.standard_normal((n_rows, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def query_vectors_near(vectors: np.ndarray, n_queries: int, noise: float = 0.5, seed: int = 7) -> np.ndarray:
+    """Queries near random index vectors, so each has a dense neighbourhood like a real search."""
+    rng = np.random.default_rng(seed)
+    queries = np.asarray(vectors[rng.choice(len(vectors), size=n_queries, replace=False)], dtype=np.float32)
+    queries = queries + noise * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def quantization_report(
+    vector_store: LocalVectorSearch,
+    query_vectors: np.ndarray,
+    k: int = 10,
+    rescore_factors: Optional[List[int]] = None,
+) -> pd.DataFrame:
+    """
+    Measure recall@k and memory of the quantized indexes against the float32 exact results.
+
+    Args:
+        vector_store (LocalVectorSearch): The float32 index, its vectors are quantized for each row of the report.
+        query_vectors (np.ndarray): The query embeddings, shape (n_queries, d).
+        k (int): The number of results compared per query.
+        rescore_factors (List[int]): The rescore factors to try, 0 reports the quantized scores without rescoring.
+
+    Returns:
+        pd.DataFrame: One row per quantization and rescore factor.
+    """
+    rescore_factors = rescore_factors or [0, 1, 2, 4, 8]
+    vectors = np.asarray(vector_store.vectors, dtype=np.float32)
+    texts, metadatas = vector_store.texts, vector_store.metadatas
+
+    def run(index: LocalVectorSearch) -> tuple:
+        ranked, latencies = [], []
+        for query_vector in query_vectors:
+            start = time.perf_counter()
+            results = index.similarity_search_by_vector_with_score(query_vector, k)
+            latencies.append(time.perf_counter() - start)
+            ranked.append({document.metadata["_id"] for document, _ in results})
+        return ranked, latencies
+
+    truth, float32_latencies = run(vector_store)
+    rows = [{
+        "quantization": FLOAT32,
+        "rescore_factor": 0,
+        "bytes_per_vector": vectors.shape[1] * 4,
+        "memory_mib": vectors.nbytes / 2**20,
+        "compression": 1.0,
+        f"recall@{k}": 1.0,
+        "p50_latency_ms": 1000 * float(np.median(float32_latencies)),
+    }]
+    for quantization in (FLOAT16, INT8):
+        index = LocalVectorSearch.from_vectors(vectors, texts, metadatas, vector_store.embeddings, quantization=quantization)
+        quantized = index.quantized
+        for rescore_factor in rescore_factors:
+            index.rescore_factor = rescore_factor
+            ranked, latencies = run(index)
+            recall = float(np.mean([len(found & expected) / max(len(expected), 1) for found, expected in zip(ranked, truth)]))
+            rows.append({
+                "quantization": quantization,
+                "rescore_factor": rescore_factor,
+                "bytes_per_vector": quantized.nbytes / len(quantized),
+                "memory_mib": quantized.nbytes / 2**20,
+                "compression": vectors.nbytes / quantized.nbytes,
+                f"recall@{k}": recall,
+                "p50_latency_ms": 1000 * float(np.median(latencies)),
+            })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report recall and memory of float16 and int8 quantized local vector indexes.")
+    parser.add_argument("--source", choices=["recorded", "fake", "synthetic"], default="synthetic",
+                        help="recorded: the local index and recorded query embeddings, fake: hashing embeddings of the CSV, "
+                             "synthetic: clustered random vectors.")
+    parser.add_argument("--csv", default=None, help="The processed recipes CSV of the fake source, PROCESSED_REDDIT_RECIPE_DATA_PATH by default.")
+    parser.add_argument("--queries", default=None, help="The eval queries of the recorded and fake sources, EVAL_QUERIES_PATH by default.")
+    parser.add_argument("--output", default=QUANTIZATION_RESULTS_PATH)
+    parser.add_argument("--synthetic-size", type=int, default=100000)
+    parser.add_argument("--n-queries", type=int, default=200, help="Queries sampled near index vectors, added to the eval queries.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    args = parser.parse_args()
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    if args.source == "synthetic":
+        vectors = synthetic_vectors(args.synthetic_size)
+        vector_store = LocalVectorSearch.from_vectors(vectors, [""] * len(vectors), [{} for _ in vectors], embedding=None)
+        query_vectors = query_vectors_near(vectors, args.n_queries)
+    else:
+        # Only the recorded and fake sources need the environment and the evaluation corpus loaders
+        from backend.core.env import PROCESSED_REDDIT_RECIPE_DATA_PATH, LOCAL_RECIPE_INDEX_PATH, EMBEDDING_CACHE_PATH
+        from backend.evaluation.retrieval_evaluation import EVAL_QUERIES_PATH, load_eval_queries, load_fake_corpus, load_recorded_corpus
+        if args.source == "recorded":
+            vector_store, _, embeddings = load_recorded_corpus(LOCAL_RECIPE_INDEX_PATH, EMBEDDING_CACHE_PATH)
+        else:
+            vector_store, _, embeddings = load_fake_corpus(args.csv or PROCESSED_REDDIT_RECIPE_DATA_PATH, args.output)
+        eval_queries = [np.asarray(embeddings.embed_query(eval_query.query), dtype=np.float32) for eval_query in load_eval_queries(args.queries or EVAL_QUERIES_PATH)]
+        query_vectors = np.concatenate([np.stack(eval_queries), query_vectors_near(vector_store.vectors, min(args.n_queries, len(vector_store)))])
+
+    report = quantization_report(vector_store, query_vectors, args.k, args.rescore_factor)
+    report_path = Path(args.output) / f"quantization_report_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    report.to_csv(report_path, index=False)
+    logger.info(f"Quantization report:\n{report.to_string(index=False, float_format='%.3f')}")
+    logger.info(f"Saved quantization report to {report_path}")
@@ -0,0 +1,481 @@
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import asdict, dataclass, field
+from itertools import product
+from pathlib import Path
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+import numpy as np
+import pandas as pd
+from loguru import logger
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
+from backend.core.env import PROJECT_ID, LOCATION, PROCESSED_REDDIT_RECIPE_DATA_PATH, LOCAL_RECIPE_INDEX_PATH, EMBEDDING_CACHE_PATH, RERANK_CACHE_PATH
+from backend.core.env import RECIPE_DEDUPE_OVERFETCH
+from backend.core.data_loading.recipe_to_mongo import recipe_data_from_csv, recipe_data_to_documents, add_canonical_ingredients
+from backend.core.tools.local_vector_search import LocalVectorSearch
+from backend.core.tools.local_fulltext_search import LocalBM25Index
+from backend.core.tools.hybrid_search import local_hybrid_search
+from backend.core.tools.recipe_rerank import RecipeMatch, RecipeMatchList, CandidateRecipeMatch, RerankJudgmentCache
+from backend.core.tools.recipe_rerank import format_recipe_candidate, judge_recipes, rerank_recipes
+from backend.core.tools.recipe_search import build_pre_filter, rank_recipe_matches
+from backend.core.utils.utils_cache import SQLiteCache, hash_key
+from backend.core.utils.utils_dedupe import assign_recipe_clusters, collapse_by_cluster
+from backend.core.utils.utils_embeddings import normalize_embedding_text
+from backend.core.utils.utils_llm import ChainCallStatus, get_gemini_llm_client, get_token_count
+
+EVAL_QUERIES_PATH = "backend/evaluation/retrieval_queries.jsonl"
+EVAL_LABELS_PATH = "backend/evaluation/retrieval_labels.jsonl"
+EVAL_RESULTS_PATH = "backend/evaluation/results"
+EMBEDDING_MODEL_NAME = "textembedding-gecko@003"
+
+
+@dataclass
+class EvalQuery:
+    query: str
+    pantry_ingredients: List[str] = field(default_factory=list)
+    # Keyword arguments of build_pre_filter, e.g. {"max_total_time": 30}
+    filters: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class RetrievalConfig:
+    top_k: int
+    vector_penalty: float
+    fulltext_penalty: float
+    llm_cutoff: int
+    rerank_mode: str
+
+
+@dataclass
+class QueryRun:
+    ranked_uuids: List[str]
+    latency_seconds: float
+    llm_calls: int
+    input_tokens: int
+    output_tokens: int
+
+
+def load_eval_queries(path: str = EVAL_QUERIES_PATH) -> List[EvalQuery]:
+    with open(path) as f:
+        return [EvalQuery(**json.loads(line)) for line in f if line.strip()]
+
+
+def load_relevance_labels(path: str = EVAL_LABELS_PATH) -> Dict[str, Dict[str, float]]:
+    """
+    Load graded relevance labels, one JSON line per {"query", "recipe_uuid", "grade"} with the grade in [0, 1].
+
+    Labels are hand-written or recorded from LLM judgments with --record-labels. Recipes without a label
+    for a query count as not relevant.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The grade of each labelled recipe uuid, per query.
+    """
+    labels: Dict[str, Dict[str, float]] = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                label = json.loads(line)
+                labels.setdefault(label["query"], {})[label["recipe_uuid"]] = float(label["grade"])
+    return labels
+
+
+# ====================================================================================
+# Offline stand-ins for the embedding model and the LLM judge
+# ====================================================================================
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings via feature hashing, so fake vectors still carry lexical similarity.
+
+    Args:
+        size (int): The embedding dimensions.
+    """
+
+    def __init__(self, size: int = 768):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:8], "little")
+            vector[digest % self.size] += 1.0 if (digest >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+
+class RecordedEmbeddings(Embeddings):
+    """
+    Query embeddings replayed from the CachedEmbeddings SQLite store written by recipe_search.
+
+    Args:
+        cache_path (str): The embedding cache file.
+        model_name (str): The model the vectors were recorded with, part of the cache key.
+    """
+
+    def __init__(self, cache_path: str = EMBEDDING_CACHE_PATH, model_name: str = EMBEDDING_MODEL_NAME):
+        self.disk_cache = SQLiteCache(cache_path, table="embeddings", read_only=True)
+        self.model_name = model_name
+
+    def embed_query(self, text: str) -> List[float]:
+        value = self.disk_cache.get(hash_key(self.model_name, normalize_embedding_text(text)))
+        if value is None:
+            raise KeyError(f"No recorded embedding for query: {text}")
+        return np.frombuffer(value, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class FakeJudgeModel:
+    """
+    Stand-in for the Gemini judge, answering the rerank prompts from graded relevance labels.
+
+    Candidates are recognised by their formatted text in the prompt. A recorded judgment is replayed
+    when one exists for the (query, recipe), otherwise the judgment is derived from the label grade, as a
+    judge that agrees with the labels. Calls and prompt/response tokens are counted as if every call went
+    to the model.
+
+    Args:
+        latency_seconds (float): Simulated latency per call, to model pointwise vs listwise wall time.
+        recorded_judgments (RerankJudgmentCache): Optional read-only cache of real judgments.
+    """
+
+    model_name = "fake-judge"
+
+    def __init__(self, latency_seconds: float = 0.0, recorded_judgments: Optional[RerankJudgmentCache] = None):
+        self.latency_seconds = latency_seconds
+        self.recorded_judgments = recorded_judgments
+        self.query = ""
+        # Stripped candidate text -> (recipe uuid, label grade, content hash of the unstripped text)
+        self.candidates: Dict[str, Tuple[str, float, str]] = {}
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def set_candidates(self, query: str, results: List[Document], grades: Dict[str, float]) -> None:
+        """Register the candidates of the current query, grades are keyed by cluster id or uuid as in label_grades."""
+        self.query = query
+        self.candidates = {}
+        for result in results:
+            recipe_candidate = format_recipe_candidate(result)
+            grade = grades.get(result.metadata.get("cluster_id") or result.metadata["uuid"], 0.0)
+            self.candidates[recipe_candidate.strip()] = (result.metadata["uuid"], grade, hash_key(recipe_candidate))
+
+    def judge(self, recipe_candidate: str) -> RecipeMatch:
+        recipe_uuid, grade, content_hash = self.candidates.get(recipe_candidate.strip(), ("", 0.0, ""))
+        if self.recorded_judgments is not None and recipe_uuid:
+            recorded = self.recorded_judgments.get(self.query, recipe_uuid, content_hash)
+            if recorded is not None:
+                return recorded
+        return RecipeMatch(reasoning=f"Label grade {grade:.2f}", is_match=grade > 0, match_score=100 * grade)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> RunnableLambda:
+        async def respond(prompt_value: Any) -> Any:
+            prompt = prompt_value.to_string()
+            self.calls += 1
+            self.input_tokens += get_token_count(prompt)
+            if self.latency_seconds:
+                await asyncio.sleep(self.latency_seconds)
+            if schema is RecipeMatchList:
+                blocks = re.split(r"\[Candidate (\d+)\]\n", prompt.split("Recipe candidates:", 1)[1])
+                response = RecipeMatchList(matches=[
+                    CandidateRecipeMatch(candidate_id=int(candidate_id), **self.judge(text).model_dump())
+                    for candidate_id, text in zip(blocks[1::2], blocks[2::2])
+                ])
+            else:
+                recipe_candidate = next((text for text in self.candidates if text in prompt), "")
+                response = self.judge(recipe_candidate)
+            self.output_tokens += get_token_count(response.model_dump_json())
+            return response
+        return RunnableLambda(respond)
+
+
+# ====================================================================================
+# Labels and metrics
+# ====================================================================================
+def label_grades(query_labels: Dict[str, float], metadatas: List[Dict[str, Any]], mask: np.ndarray) -> Dict[str, float]:
+    """
+    The relevant recipes of a query among those passing its filters, keyed by cluster id or uuid.
+
+    The grades come from the labels only, never from the ingredient overlap the rerank cascade scores
+    candidates with, so a sweep over the cascade cutoff shows what pruning costs in quality.
+
+    Args:
+        query_labels (Dict[str, float]): The labelled grade of each recipe uuid.
+        metadatas (List[Dict[str, Any]]): The metadata of every indexed recipe.
+        mask (np.ndarray): The recipes passing the query filters.
+
+    Returns:
+        Dict[str, float]: The positive grades, near-duplicates share the best grade of their cluster.
+    """
+    grades = {}
+    for row in np.flatnonzero(mask):
+        metadata = metadatas[row]
+        grade = query_labels.get(metadata["uuid"], 0.0)
+        if grade > 0:
+            key = metadata.get("cluster_id") or metadata["uuid"]
+            grades[key] = max(grades.get(key, 0.0), grade)
+    return grades
+
+
+def recall_at_k(ranked: List[str], grades: Dict[str, float], k: int) -> float:
+    """Number of relevant recipes in the top k, divided by the number of relevant recipes capped at k."""
+    if not grades:
+        return float("nan")
+    return len(set(ranked[:k]) & set(grades)) / min(len(grades), k)
+
+
+def ndcg_at_k(ranked: List[str], grades: Dict[str, float], k: int) -> float:
+    if not grades:
+        return float("nan")
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    gains = np.array([grades.get(key, 0.0) for key in ranked[:k]])
+    ideal = np.sort(np.array(list(grades.values())))[::-1][:k]
+    return float((gains * discounts[:len(gains)]).sum() / (ideal * discounts[:len(ideal)]).sum())
+
+
+def pareto_frontier(rows: List[Dict[str, Any]], quality: str = "ndcg", cost: str = "p95_latency_ms") -> List[bool]:
+    """Flag the configurations no other configuration beats on both quality and cost."""
+    return [
+        not any(other[quality] >= row[quality] and other[cost] <= row[cost] and (other[quality] > row[quality] or other[cost] < row[cost]) for other in rows)
+        for row in rows
+    ]
+
+
+# ====================================================================================
+# Sweep
+# ====================================================================================
+async def run_query(
+    eval_query: EvalQuery,
+    config: RetrievalConfig,
+    vector_store: LocalVectorSearch,
+    fulltext_index: LocalBM25Index,
+    embeddings: Embeddings,
+    judge: FakeJudgeModel,
+    grades: Dict[str, float],
+) -> QueryRun:
+    """Run one query through search, near-duplicate collapse and rerank, as aretrieve_recipes does."""
+    judge.reset_counters()
+    pre_filter = build_pre_filter(**eval_query.filters)
+
+    start = time.perf_counter()
+    query_vector = embeddings.embed_query(eval_query.query)
+    results = local_hybrid_search(
+        vector_store,
+        fulltext_index,
+        eval_query.query,
+        query_vector,
+        top_k=max(config.top_k, int(config.top_k * RECIPE_DEDUPE_OVERFETCH)),
+        pre_filter=pre_filter,
+        vector_penalty=config.vector_penalty,
+        fulltext_penalty=config.fulltext_penalty,
+    )
+    results = collapse_by_cluster(results, config.top_k)
+    judge.set_candidates(eval_query.query, results, grades)
+    recipe_matches = await rerank_recipes(
+        eval_query.query,
+        results,
+        judge,
+        cache=None,
+        requested_ingredients=eval_query.pantry_ingredients,
+        llm_cutoff=config.llm_cutoff,
+        mode=config.rerank_mode,
+    )
+    ranked = rank_recipe_matches(results, recipe_matches)
+    latency_seconds = time.perf_counter() - start
+
+    return QueryRun(
+        ranked_uuids=[result.metadata.get("cluster_id") or result.metadata["uuid"] for result in ranked],
+        latency_seconds=latency_seconds,
+        llm_calls=judge.calls,
+        input_tokens=judge.input_tokens,
+        output_tokens=judge.output_tokens,
+    )
+
+
+async def run_sweep(
+    eval_queries: List[EvalQuery],
+    configs: List[RetrievalConfig],
+    vector_store: LocalVectorSearch,
+    fulltext_index: LocalBM25Index,
+    embeddings: Embeddings,
+    judge: FakeJudgeModel,
+    labels: Dict[str, Dict[str, float]],
+    eval_k: int = 10,
+) -> pd.DataFrame:
+    """
+    Evaluate every configuration on every query.
+
+    Args:
+        labels (Dict[str, Dict[str, float]]): The relevance labels per query, see load_relevance_labels.
+            Queries without labels are left out of the quality metrics.
+
+    Returns:
+        pd.DataFrame: One row per configuration with recall@k, nDCG@k, p50/p95 latency,
+            LLM calls and tokens per query, and whether it is on the nDCG / p95 latency frontier.
+    """
+    unlabelled = [eval_query.query for eval_query in eval_queries if eval_query.query not in labels]
+    if unlabelled:
+        logger.warning(f"{len(unlabelled)} of {len(eval_queries)} queries have no relevance labels: {unlabelled}")
+    query_grades = [
+        label_grades(labels.get(eval_query.query, {}), vector_store.metadatas, vector_store.filter_index.mask(build_pre_filter(**eval_query.filters)))
+        for eval_query in eval_queries
+    ]
+    rows = []
+    for config in configs:
+        runs = [
+            await run_query(eval_query, config, vector_store, fulltext_index, embeddings, judge, grades)
+            for eval_query, grades in zip(eval_queries, query_grades)
+        ]
+        latencies_ms = np.array([run.latency_seconds for run in runs]) * 1000
+        rows.append({
+            **asdict(config),
+            "recall": np.nanmean([recall_at_k(run.ranked_uuids, grades, eval_k) for run, grades in zip(runs, query_grades)]),
+            "ndcg": np.nanmean([ndcg_at_k(run.ranked_uuids, grades, eval_k) for run, grades in zip(runs, query_grades)]),
+            "p50_latency_ms": float(np.percentile(latencies_ms, 50)),
+            "p95_latency_ms": float(np.percentile(latencies_ms, 95)),
+            "llm_calls_per_query": np.mean([run.llm_calls for run in runs]),
+            "input_tokens_per_query": np.mean([run.input_tokens for run in runs]),
+            "output_tokens_per_query": np.mean([run.output_tokens for run in runs]),
+        })
+        logger.info(f"Evaluated {config}: nDCG@{eval_k} {rows[-1]['ndcg']:.3f}, p95 {rows[-1]['p95_latency_ms']:.0f} ms")
+    report = pd.DataFrame(rows)
+    report["frontier"] = pareto_frontier(rows)
+    return report.rename(columns={"recall": f"recall@{eval_k}", "ndcg": f"ndcg@{eval_k}"})
+
+
+async def record_relevance_labels(
+    eval_queries: List[EvalQuery],
+    vector_store: LocalVectorSearch,
+    fulltext_index: LocalBM25Index,
+    embeddings: Embeddings,
+    model: Optional[Any] = None,
+    cache: Optional[RerankJudgmentCache] = None,
+    pool_k: int = 50,
+    labels_path: str = EVAL_LABELS_PATH,
+) -> None:
+    """
+    Record relevance labels from LLM judgments of a deep candidate pool per query.
+
+    Every pooled recipe is judged by the LLM, without the ingredient cascade or a cutoff. Existing labels of a
+    (query, recipe), e.g. hand corrections, are kept, and only new ones are appended.
+
+    Args:
+        eval_queries (List[EvalQuery]): The queries to label.
+        vector_store (LocalVectorSearch): The local vector index.
+        fulltext_index (LocalBM25Index): The local fulltext index.
+        embeddings (Embeddings): The query embeddings.
+        model (Any): The chat model used as the judge, by default the Gemini judge of recipe_search.
+        cache (RerankJudgmentCache): Optional judgment cache, so relabelling reuses earlier judgments.
+        pool_k (int): The number of candidates pooled per query.
+        labels_path (str): The labels file.
+    """
+    model = model or get_gemini_llm_client(project_id=PROJECT_ID, location=LOCATION, model_name="gemini-1.5-pro-002")
+    labels = load_relevance_labels(labels_path) if Path(labels_path).exists() else {}
+    n_labels = 0
+    with open(labels_path, "a") as f:
+        for eval_query in eval_queries:
+            results = local_hybrid_search(
+                vector_store,
+                fulltext_index,
+                eval_query.query,
+                embeddings.embed_query(eval_query.query),
+                top_k=pool_k,
+                pre_filter=build_pre_filter(**eval_query.filters),
+            )
+            results = [result for result in results if result.metadata["uuid"] not in labels.get(eval_query.query, {})]
+            recipe_matches = await judge_recipes(eval_query.query, results, model, cache)
+            for result, recipe_match, status in zip(results, recipe_matches, recipe_matches.statuses):
+                # Failed judgments are left unlabelled, a rerun retries them
+                if status != ChainCallStatus.OK:
+                    continue
+                grade = recipe_match.match_score / 100 if recipe_match.is_match else 0.0
+                f.write(json.dumps({"query": eval_query.query, "recipe_uuid": result.metadata["uuid"], "grade": grade, "reasoning": recipe_match.reasoning}) + "\n")
+                n_labels += 1
+    logger.info(f"Recorded {n_labels} relevance labels of {len(eval_queries)} queries to {labels_path}")
+
+
+def load_fake_corpus(csv_path: str, output_path: str) -> Tuple[LocalVectorSearch, LocalBM25Index, Embeddings]:
+    """Build the local indexes from the processed recipes CSV with hashing embeddings, no API calls."""
+    recipe_data = recipe_data_from_csv(csv_path, "raw_comment")
+    _ = add_canonical_ingredients(recipe_data, vocabulary_path=str(Path(output_path) / "ingredient_vocabulary.json"))
+    _ = assign_recipe_clusters(recipe_data)
+    documents = recipe_data_to_documents(recipe_data)
+    embeddings = HashingEmbeddings()
+    vector_store = LocalVectorSearch.from_documents(documents, embeddings)
+    fulltext_index = LocalBM25Index.build([document.page_content for document in documents])
+    return vector_store, fulltext_index, embeddings
+
+
+def load_recorded_corpus(index_path: str, embedding_cache_path: str) -> Tuple[LocalVectorSearch, LocalBM25Index, Embeddings]:
+    """Load the local indexes built by recipe_data_to_local_index, with query embeddings recorded by recipe_search."""
+    embeddings = RecordedEmbeddings(embedding_cache_path)
+    vector_store = LocalVectorSearch.load(index_path, embeddings)
+    if LocalBM25Index.exists(index_path):
+        fulltext_index = LocalBM25Index.load(index_path)
+    else:
+        fulltext_index = LocalBM25Index.build(vector_store.texts)
+    return vector_store, fulltext_index, embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep retrieval settings offline and report quality, latency and LLM cost.")
+    parser.add_argument("--queries", default=EVAL_QUERIES_PATH)
+    parser.add_argument("--csv", default=PROCESSED_REDDIT_RECIPE_DATA_PATH)
+    parser.add_argument("--output", default=EVAL_RESULTS_PATH)
+    parser.add_argument("--recorded", action="store_true", help="Use the local index, recorded query embeddings and recorded rerank judgments.")
+    parser.add_argument("--labels", default=EVAL_LABELS_PATH, help="The relevance labels, hand-written or recorded with --record-labels.")
+    parser.add_argument("--record-labels", action="store_true", help="Record relevance labels with the Gemini judge instead of sweeping.")
+    parser.add_argument("--label-pool-k", type=int, default=50, help="The candidates judged per query when recording labels.")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[10, 15, 25])
+    parser.add_argument("--vector-penalty", type=float, nargs="+", default=[50])
+    parser.add_argument("--fulltext-penalty", type=float, nargs="+", default=[50])
+    parser.add_argument("--llm-cutoff", type=int, nargs="+", default=[3, 6, 10])
+    parser.add_argument("--rerank-mode", nargs="+", default=["listwise", "pointwise"])
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency of each judge call.")
+    parser.add_argument("--eval-k", type=int, default=10)
+    args = parser.parse_args()
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    if args.recorded:
+        vector_store, fulltext_index, embeddings = load_recorded_corpus(LOCAL_RECIPE_INDEX_PATH, EMBEDDING_CACHE_PATH)
+        recorded_judgments = RerankJudgmentCache(RERANK_CACHE_PATH, read_only=True)
+    else:
+        vector_store, fulltext_index, embeddings = load_fake_corpus(args.csv, args.output)
+        recorded_judgments = None
+
+    if args.record_labels:
+        asyncio.run(record_relevance_labels(
+            load_eval_queries(args.queries), vector_store, fulltext_index, embeddings,
+            cache=RerankJudgmentCache(RERANK_CACHE_PATH), pool_k=args.label_pool_k, labels_path=args.labels,
+        ))
+        raise SystemExit(0)
+    if not Path(args.labels).exists():
+        raise SystemExit(f"No relevance labels at {args.labels}, write them by hand or record them with --record-labels")
+
+    configs = [
+        RetrievalConfig(top_k, vector_penalty, fulltext_penalty, llm_cutoff, rerank_mode)
+        for top_k, vector_penalty, fulltext_penalty, llm_cutoff, rerank_mode in product(
+            args.top_k, args.vector_penalty, args.fulltext_penalty, args.llm_cutoff, args.rerank_mode
+        )
+    ]
+    judge = FakeJudgeModel(latency_seconds=args.llm_latency_ms / 1000, recorded_judgments=recorded_judgments)
+    report = asyncio.run(run_sweep(load_eval_queries(args.queries), configs, vector_store, fulltext_index, embeddings, judge, load_relevance_labels(args.labels), args.eval_k))
+
+    report_path = Path(args.output) / f"retrieval_sweep_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    report.to_csv(report_path, index=False)
+    logger.info(f"Retrieval sweep:\n{report.sort_values(f'ndcg@{args.eval_k}', ascending=False).to_string(index=False, float_format='%.3f')}")
+    logger.info(f"Saved retrieval sweep report to {report_path}")
@@ -1,20 +1,25 @@
 import pandas as pd
 from pydantic import BaseModel, Field
 from langchain.prompts import PromptTemplate
-from backend.core.utils.utils_llm import run_chain_on_inputs
+from backend.core.utils.utils_llm import get_usage_meter
+from backend.core.utils.utils_batch import BatchJob, BatchPending, execute_batch_locally, run_chain_on_inputs_or_batch
+from backend.core.env import PROJECT_ID, LOCATION
 import asyncio
 from backend.core.utils.chat_model import ChatVertexAIWX
 from loguru import logger
-from typing import List
+from typing import List, Optional
+import argparse
+from pathlib import Path
 from backend.preprocessing.preprocessing_enums import DifficultyLevel, CookingMethod, Equipment, MealType, CourseType, DietaryRestriction, CleanupEffort
 
-async def extract_title(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_title(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the title of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
     
     Returns:
         A pandas DataFrame containing the extracted titles.
@@ -54,7 +59,7 @@ async def extract_title(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) ->
             "comment_str": comment
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(extract_title_chain, title_extract_inputs, ExtractedTitle)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(extract_title_chain, title_extract_inputs, ExtractedTitle, stage="extract_title", batch=batch)
     logger.info(f"Titles extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['title'] = [result.title for result in results]
@@ -62,13 +67,14 @@ async def extract_title(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) ->
 
     return df_recipes
 
-async def extract_time(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_time(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the preparation time of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
     
     Returns:
         A pandas DataFrame containing the extracted preparation times.
@@ -110,7 +116,7 @@ async def extract_time(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) ->
             "comment_str": comment
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(time_extract_chain, time_extract_inputs, ExtractedRecipe)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(time_extract_chain, time_extract_inputs, ExtractedRecipe, stage="extract_time", batch=batch)
     logger.info(f"Time extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['active_preparation_time'] = [result.active_preparation_time for result in results]
@@ -120,13 +126,14 @@ async def extract_time(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) ->
     
     return df_recipes
 
-async def extract_practical_metadata(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_practical_metadata(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the number of servings of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
     
     Returns:
         A pandas DataFrame containing the extracted recipes.
@@ -171,7 +178,7 @@ async def extract_practical_metadata(df_recipes: pd.DataFrame, chat_model: ChatV
             "comment_str": comment
         })
 
-    results, estimated_cost, est_input_tokens, est_output_tokens = await run_chain_on_inputs(practical_metadata_extract_chain, practical_metadata_extract_inputs, ExtractedPracticalMetadata)
+    results, estimated_cost, est_input_tokens, est_output_tokens = await run_chain_on_inputs_or_batch(practical_metadata_extract_chain, practical_metadata_extract_inputs, ExtractedPracticalMetadata, stage="extract_practical_metadata", batch=batch)
     logger.info(f"Practical metadata extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['difficulty_level'] = [result.difficulty_level.value for result in results]
@@ -183,13 +190,14 @@ async def extract_practical_metadata(df_recipes: pd.DataFrame, chat_model: ChatV
     return df_recipes
 
 
-async def extract_cooking_metadata(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_cooking_metadata(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the cooking metadata of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
             
     Returns:
         A pandas DataFrame containing the extracted recipes.
@@ -238,7 +246,7 @@ async def extract_cooking_metadata(df_recipes: pd.DataFrame, chat_model: ChatVer
             "comment_str": comment
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(cooking_metadata_extract_chain, cooking_metadata_extract_inputs, ExtractedCookingMetadata)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(cooking_metadata_extract_chain, cooking_metadata_extract_inputs, ExtractedCookingMetadata, stage="extract_cooking_metadata", batch=batch)
     logger.info(f"Cooking metadata extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['servings'] = [result.servings for result in results]
@@ -248,13 +256,14 @@ async def extract_cooking_metadata(df_recipes: pd.DataFrame, chat_model: ChatVer
     df_recipes.reset_index(drop=True, inplace=True)
     return df_recipes
 
-async def extract_structure(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_structure(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the structure of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
             
     Returns:
         A pandas DataFrame containing the extracted recipes.
@@ -302,7 +311,7 @@ async def extract_structure(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX
             "comment_str": comment
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(structure_extract_chain, structure_extract_inputs, ExtractedStructure)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(structure_extract_chain, structure_extract_inputs, ExtractedStructure, stage="extract_structure", batch=batch)
     logger.info(f"Structure extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['ingredient_groups'] = [result.ingredient_groups for result in results]
@@ -311,13 +320,14 @@ async def extract_structure(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX
     return df_recipes
 
 
-async def extract_instructions(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_instructions(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the instructions of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
             
     Returns:
         A pandas DataFrame containing the extracted recipes.
@@ -362,20 +372,21 @@ async def extract_instructions(df_recipes: pd.DataFrame, chat_model: ChatVertexA
             "method_groups": df_recipes['method_groups'].iloc[i]
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(instructions_extract_chain, instructions_extract_inputs, ExtractedInstructions)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(instructions_extract_chain, instructions_extract_inputs, ExtractedInstructions, stage="extract_instructions", batch=batch)
     logger.info(f"Instructions extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['instructions'] = [result.instructions for result in results]
     df_recipes.reset_index(drop=True, inplace=True)
     return df_recipes
 
-async def extract_ingredients(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_ingredients(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the ingredients of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
 
     Returns:
         A pandas DataFrame containing the extracted recipes.
@@ -421,7 +432,7 @@ async def extract_ingredients(df_recipes: pd.DataFrame, chat_model: ChatVertexAI
             "ingredient_groups": df_recipes['ingredient_groups'].iloc[i]
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(ingredients_extract_chain, ingredients_extract_inputs, ExtractedIngredients)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(ingredients_extract_chain, ingredients_extract_inputs, ExtractedIngredients, stage="extract_ingredients", batch=batch)
     logger.info(f"Ingredients extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['ingredient_names'] = [result.ingredient_names for result in results]
@@ -430,13 +441,14 @@ async def extract_ingredients(df_recipes: pd.DataFrame, chat_model: ChatVertexAI
     return df_recipes
 
 
-async def extract_search_description(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_search_description(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the search description of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
             
     Returns:
         A pandas DataFrame containing the extracted recipe search descriptions.
@@ -489,20 +501,21 @@ async def extract_search_description(df_recipes: pd.DataFrame, chat_model: ChatV
             "title": df_recipes['title'].iloc[i]
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(search_description_extract_chain, search_description_extract_inputs, ExtractedSearchDescription)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(search_description_extract_chain, search_description_extract_inputs, ExtractedSearchDescription, stage="extract_search_description", batch=batch)
     logger.info(f"Search description extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['search_description'] = [result.search_description for result in results]
     df_recipes.reset_index(drop=True, inplace=True)
     return df_recipes
 
-async def extract_display_description(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX) -> pd.DataFrame:
+async def extract_display_description(df_recipes: pd.DataFrame, chat_model: ChatVertexAIWX, batch: Optional[BatchJob] = None) -> pd.DataFrame:
     """
     Extracts the display description of a recipe from a piece of text.
     
     Args:
         df_recipes: A pandas DataFrame containing the text of recipes.
         chat_model: A ChatVertexAIWX instance.
+        batch: Runs the extraction through batch request/response files instead of online calls.
             
     Returns:
         A pandas DataFrame containing the extracted recipe display descriptions.
@@ -562,27 +575,43 @@ async def extract_display_description(df_recipes: pd.DataFrame, chat_model: Chat
             "method_groups": df_recipes['method_groups'].iloc[i]
         })
 
-    results, estimated_cost, _, _ = await run_chain_on_inputs(display_description_extract_chain, display_description_extract_inputs, ExtractedDisplayDescription)
+    results, estimated_cost, _, _ = await run_chain_on_inputs_or_batch(display_description_extract_chain, display_description_extract_inputs, ExtractedDisplayDescription, stage="extract_display_description", batch=batch)
     logger.info(f"Display description extracted for {len(results)} recipes. Estimated cost: ${estimated_cost} AUD.")
 
     df_recipes['display_description'] = [result.display_description for result in results]
     df_recipes.reset_index(drop=True, inplace=True)
     return df_recipes
 
-async def process_recipes(source: str):
+async def process_recipes(source: str, batch_dir: Optional[str] = None, local_batch: bool = False):
+    """
+    Extract the structured recipes of a source with the nine LLM stages and save them as CSV.
+
+    Args:
+        source: The source name, read from backend/data/recipes_{source}_raw.csv.
+        batch_dir: Run the stages in batch mode, with their JSONL request and response files in this directory.
+            Each run ingests the stages that have responses and stops at the first stage without, after writing
+            its requests for submission to the batch prediction endpoint. Rerun once its responses are in place.
+        local_batch: Answer the batch requests locally with placeholder outputs, to test the batch mode offline.
+            The results are written to the batch directory instead of backend/data.
+    """
     df_recipes = pd.read_csv(f"backend/data/recipes_{source}_raw.csv")
     chat_model = ChatVertexAIWX(model_name="gemini-1.5-pro-002", project_id=PROJECT_ID, location=LOCATION, temperature=0.5)
+    batch = BatchJob(batch_dir, executor=execute_batch_locally if local_batch else None) if batch_dir else None
     
     # Chain all the async operations
-    df_extracted_recipes = await extract_title(df_recipes, chat_model)
-    df_extracted_recipes = await extract_time(df_extracted_recipes, chat_model)
-    df_extracted_recipes = await extract_practical_metadata(df_extracted_recipes, chat_model)
-    df_extracted_recipes = await extract_cooking_metadata(df_extracted_recipes, chat_model)
-    df_extracted_recipes = await extract_structure(df_extracted_recipes, chat_model)
-    df_extracted_recipes = await extract_instructions(df_extracted_recipes, chat_model)
-    df_extracted_recipes = await extract_ingredients(df_extracted_recipes, chat_model)
-    df_extracted_recipes = await extract_search_description(df_extracted_recipes, chat_model)
-    df_extracted_recipes = await extract_display_description(df_extracted_recipes, chat_model)
+    try:
+        df_extracted_recipes = await extract_title(df_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_time(df_extracted_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_practical_metadata(df_extracted_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_cooking_metadata(df_extracted_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_structure(df_extracted_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_instructions(df_extracted_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_ingredients(df_extracted_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_search_description(df_extracted_recipes, chat_model, batch)
+        df_extracted_recipes = await extract_display_description(df_extracted_recipes, chat_model, batch)
+    except BatchPending as e:
+        logger.info(f"Submit {e.requests_path} as a batch prediction job, save its output to {e.responses_path} and rerun to continue from {e.stage}")
+        return
 
     # Create a new column for total time
     df_extracted_recipes['total_time'] = df_extracted_recipes['active_preparation_time'] + df_extracted_recipes['inactive_preparation_time'] + df_extracted_recipes['cooking_time']
@@ -595,7 +624,17 @@ async def process_recipes(source: str):
     df_extracted_recipes = df_extracted_recipes[[i != [] for i in df_extracted_recipes['instructions']]]
     df_extracted_recipes = df_extracted_recipes[[i != [] for i in df_extracted_recipes['ingredient_names']]]
     logger.info(f"Number of recipes after removing recipes with no instructions or ingredients: {len(df_extracted_recipes)}")
-    df_extracted_recipes.to_csv(f"backend/data/recipes_{source}_extracted.csv", index=False)
+    # Placeholder outputs of a local batch run must not replace the processed recipes
+    output_path = Path(batch_dir) / f"recipes_{source}_extracted.csv" if batch is not None and local_batch else f"backend/data/recipes_{source}_extracted.csv"
+    df_extracted_recipes.to_csv(output_path, index=False)
+    logger.info(f"Saved {len(df_extracted_recipes)} processed recipes to {output_path}")
+    get_usage_meter().log_summary(f"Preprocessing {source} recipes")
 
 if __name__ == "__main__":
-    asyncio.run(process_recipes("reddit"))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract structured recipes from raw recipe text with the LLM stages.")
+    parser.add_argument("--source", default="reddit")
+    parser.add_argument("--batch-dir", default=None, help="Run the stages through JSONL batch request/response files in this directory.")
+    parser.add_argument("--local-batch", action="store_true", help="Answer the batch requests locally with placeholder outputs.")
+    args = parser.parse_args()
+
+    asyncio.run(process_recipes(args.source, args.batch_dir, args.local_batch))
\ No newline at end of file
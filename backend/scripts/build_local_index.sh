@@ -0,0 +1 @@
+python backend/core/data_loading/recipe_to_mongo.py --target local "$@"
@@ -0,0 +1 @@
+python backend/evaluation/retrieval_evaluation.py "$@"
@@ -8,13 +8,15 @@ from frontend.astream_events_handler import invoke_graph
 import uuid
 import asyncio
 from backend.core.agents.extract_ingredients_node import extract_ingredients_node
-from backend.core.tools.recipe_search import retrieve_recipes
+from backend.core.tools.recipe_search import astream_recipes, recipe_search_service
+from backend.core.utils.utils_async import iterate_sync, run_sync
 from backend.preprocessing.preprocessing_enums import DifficultyLevel
 from backend.core.agents.extract_ingredients_node import assess_ingredient_node
 from backend.preprocessing.preprocessing_enums import DIFFICULTY_MAP, COOKING_METHOD_MAP, MEAL_TYPE_MAP, COURSE_TYPE_MAP, CLEANUP_EFFORT_MAP
 from streamlit_lottie import st_lottie
 import json
 import os
+import threading
 from PIL import Image
 from io import BytesIO
 
@@ -27,6 +29,15 @@ os.environ["LANGCHAIN_PROJECT"] = LANGCHAIN_PROJECT
 
 st.set_page_config(layout="wide")
 
+@st.cache_resource
+def warmup_recipe_search():
+    # Build the search clients once per process, off the request path
+    thread = threading.Thread(target=recipe_search_service.warmup, name="recipe-search-warmup", daemon=True)
+    thread.start()
+    return thread
+
+warmup_recipe_search()
+
 def load_lottie_local(path):
     with open(path, 'r') as f:
         return json.load(f)
@@ -242,7 +253,7 @@ if __name__ == "__main__":
                     ingredient_inspect_message.content.append(image)
 
                 loading_text.markdown("<h4 style='text-align: center;'>Assessing ingredients...</h4>", unsafe_allow_html=True)
-                ingredient_assessments_response = asyncio.run(assess_ingredient_node([ingredient_inspect_message], st.session_state['ingredients'], st.session_state['quantities']))
+                ingredient_assessments_response = run_sync(assess_ingredient_node([ingredient_inspect_message], st.session_state['ingredients'], st.session_state['quantities']))
                 st.session_state['ingredient_assessments'] = ingredient_assessments_response
 
                 # Replace the animation with results
@@ -329,13 +340,20 @@ if __name__ == "__main__":
                             st_lottie(st.session_state["recipe_retrieval_animation"], height=500, width=500)
                             recipe_loading_text = st.empty()
                             recipe_loading_text.markdown("<h4 style='text-align: center;'>Finding recipes...</h4>", unsafe_allow_html=True)
+                            recipe_preview_text = st.empty()
 
-                    # Fetch recipes (simulate with the retrieve_recipes function)
-                    st.session_state['recipes'] = retrieve_recipes(
+                    # Stream recipes in as they are judged, showing the best match found so far
+                    st.session_state['recipes'] = []
+                    for update in iterate_sync(astream_recipes(
                         prompt, 
                         difficulty_level=difficulty_level, 
-                        max_total_time=max_total_time
-                    )
+                        max_total_time=max_total_time,
+                        pantry_ingredients=selected_ingredients
+                    )):
+                        st.session_state['recipes'] = update.top_results
+                        recipe_loading_text.markdown(f"<h4 style='text-align: center;'>Checked {update.completed} of {update.total} recipes...</h4>", unsafe_allow_html=True)
+                        if update.top_results:
+                            recipe_preview_text.markdown(f"<p style='text-align: center;'>Best match so far: <b>{update.top_results[0].metadata['title']}</b></p>", unsafe_allow_html=True)
 
                     # Replace the animation with results
                     placeholder.empty()
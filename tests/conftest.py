@@ -0,0 +1,6 @@
+import os
+
+# Set before backend.core.env loads the .env file, which does not override variables already set:
+# tests must not send traces, or read and write the shared LLM response cache
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+os.environ["LLM_RESPONSE_CACHE_MODE"] = "off"
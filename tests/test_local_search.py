@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from backend.core.tools import local_vector_search
+from backend.core.tools.local_fulltext_search import LocalBM25Index, tokenize
+from backend.core.tools.local_vector_search import assign_ivf_partitions, nearest_centroids, train_ivf_centroids
+from backend.core.tools.vector_quantization import FLOAT16, INT8, QuantizedVectors
+
+TEXTS = [
+    "Chicken curry with rice",
+    "Beef stew with potatoes and carrots",
+    "Chicken noodle soup",
+    "Vegetable curry with chickpeas and spinach, a quick curry",
+    "Chocolate chip cookies",
+]
+
+
+def normalized(rows: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(rows, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_tokenize():
+    assert tokenize("Chicken-Noodle Soup, 2 bowls!") == ["chicken", "noodle", "soup", "2", "bowls"]
+
+
+def test_bm25_search_ranks_matching_rows():
+    index = LocalBM25Index.build(TEXTS)
+    rows, scores = index.search("chicken curry", k=10)
+    # Only rows containing a query term are returned, the one with both terms first
+    assert rows[0] == 0
+    assert set(rows.tolist()) == {0, 2, 3}
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_bm25_rare_terms_weigh_more():
+    index = LocalBM25Index.build(TEXTS)
+    scores = index.score("noodle chicken")
+    # Row 2 has the rare "noodle", row 0 only the more common "chicken"
+    assert scores[2] > scores[0] > 0
+    assert scores[4] == 0
+
+
+def test_bm25_search_respects_mask_and_k():
+    index = LocalBM25Index.build(TEXTS)
+    mask = np.array([False, True, True, True, True])
+    rows, _ = index.search("curry", k=5, mask=mask)
+    assert rows.tolist() == [3]
+    rows, _ = index.search("chicken curry", k=1)
+    assert rows.tolist() == [0]
+    rows, scores = index.search("lasagna", k=5)
+    assert len(rows) == 0 and len(scores) == 0
+
+
+def test_bm25_save_load_round_trip(tmp_path):
+    index = LocalBM25Index.build(TEXTS)
+    index.save(str(tmp_path))
+    assert LocalBM25Index.exists(str(tmp_path))
+    loaded = LocalBM25Index.load(str(tmp_path))
+    assert len(loaded) == len(TEXTS)
+    np.testing.assert_allclose(loaded.score("curry with rice"), index.score("curry with rice"))
+
+
+@pytest.mark.parametrize("quantization, tolerance", [(FLOAT16, 1e-3), (INT8, 2e-2)])
+def test_quantized_scores_approximate_dot_products(quantization, tolerance):
+    vectors = normalized(500, 64)
+    query = vectors[7]
+    quantized = QuantizedVectors.build(vectors, quantization)
+    exact = vectors @ query
+    np.testing.assert_allclose(quantized.score(query, slice(None)), exact, atol=tolerance)
+    rows = np.array([3, 7, 11])
+    np.testing.assert_allclose(quantized.score(query, rows), exact[rows], atol=tolerance)
+    assert np.argmax(quantized.score(query, slice(None))) == 7
+
+
+def test_int8_quantization_is_smaller_and_handles_zero_vectors():
+    vectors = normalized(100, 32)
+    vectors[5] = 0
+    quantized = QuantizedVectors.build(vectors, INT8)
+    assert quantized.nbytes == 100 * 32 + 100 * 4
+    assert quantized.score(vectors[0], np.array([5]))[0] == 0
+
+
+def test_quantized_vectors_reject_unknown_quantization():
+    with pytest.raises(ValueError):
+        QuantizedVectors.build(normalized(4, 8), "int4")
+    with pytest.raises(ValueError):
+        QuantizedVectors(INT8, np.zeros((4, 8), dtype=np.int8))
+
+
+@pytest.mark.parametrize("quantization", [FLOAT16, INT8])
+def test_quantized_vectors_save_load_round_trip(tmp_path, quantization):
+    vectors = normalized(50, 16)
+    quantized = QuantizedVectors.build(vectors, quantization)
+    quantized.save(str(tmp_path))
+    loaded = QuantizedVectors.load(str(tmp_path), quantization)
+    np.testing.assert_array_equal(loaded.score(vectors[0], slice(None)), quantized.score(vectors[0], slice(None)))
+
+
+def test_nearest_centroids_chunks_match_a_single_matmul(monkeypatch):
+    vectors, centroids = normalized(1000, 16, seed=1), normalized(37, 16, seed=2)
+    expected = np.argmax(vectors @ centroids.T, axis=1)
+    # A chunk of 2 vectors at a time
+    monkeypatch.setattr(local_vector_search, "CENTROID_SCORES_PER_CHUNK", 80)
+    np.testing.assert_array_equal(nearest_centroids(vectors, centroids), expected)
+
+
+def test_ivf_partitions_cover_every_row():
+    vectors = normalized(2000, 16)
+    centroids = train_ivf_centroids(vectors, nlist=20, n_iter=5, max_sample=500)
+    assert centroids.shape == (20, 16)
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1, atol=1e-5)
+    offsets, rows = assign_ivf_partitions(vectors, centroids)
+    assert offsets[0] == 0 and offsets[-1] == len(vectors)
+    assert sorted(rows.tolist()) == list(range(len(vectors)))
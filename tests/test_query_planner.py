@@ -0,0 +1,92 @@
+import pytest
+from backend.core.tools.query_planner import ANN_STRATEGY, EXACT_STRATEGY, MAX_NUM_CANDIDATES, FieldStatistics, plan_vector_search
+
+FIELDS = ["servings", "total_time", "meal_types", "difficulty"]
+
+
+def recipes(n: int = 1000):
+    return [
+        {
+            # 4 servings in half of the recipes, 2, 6 and 8 in the rest
+            "servings": [4, 2, 4, 6, 4, 8, 4, 2][i % 8],
+            "total_time": float(i % 200) + 0.5,
+            "meal_types": ["dinner"] if i % 10 else ["dinner", "breakfast"],
+            "difficulty": "hard" if i % 50 == 0 else "easy",
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture(scope="module")
+def statistics():
+    return FieldStatistics.build(recipes(), FIELDS)
+
+
+@pytest.mark.parametrize("mql_filter, selectivity", [
+    (None, 1.0),
+    ({}, 1.0),
+    ({"servings": 4}, 0.5),
+    # $in and $or assume independent values: 1 - (1 - 0.25) * (1 - 0.125)
+    ({"servings": {"$in": [2, 6]}}, 0.34375),
+    ({"servings": {"$ne": 4}}, 0.5),
+    ({"servings": {"$gte": 6}}, 0.25),
+    ({"meal_types": "breakfast"}, 0.1),
+    ({"meal_types": {"$in": ["dinner"]}}, 1.0),
+    ({"difficulty": "hard"}, 0.02),
+    ({"difficulty": "medium"}, 0.0),
+    # Fields without statistics are assumed not to filter
+    ({"cuisine": "thai"}, 1.0),
+    ({"$and": [{"servings": 4}, {"meal_types": "breakfast"}]}, 0.05),
+    ({"$or": [{"servings": 4}, {"servings": 2}]}, 0.625),
+    ({"$nor": [{"difficulty": "hard"}]}, 0.98),
+])
+def test_selectivity(statistics, mql_filter, selectivity):
+    assert statistics.selectivity(mql_filter) == pytest.approx(selectivity, abs=1e-3)
+
+
+@pytest.mark.parametrize("condition, selectivity", [
+    ({"$lte": 50}, 0.25),
+    ({"$gt": 150}, 0.25),
+    ({"$gte": 50, "$lt": 150}, 0.5),
+    ({"$lt": 0}, 0.0),
+    ({"$gt": 1000}, 0.0),
+])
+def test_numeric_range_selectivity(statistics, condition, selectivity):
+    # Continuous values are estimated from the equi-depth histogram
+    assert statistics.selectivity({"total_time": condition}) == pytest.approx(selectivity, abs=0.02)
+
+
+def test_statistics_save_load_round_trip(statistics, tmp_path):
+    path = str(tmp_path / "stats" / "field_statistics.json")
+    statistics.save(path)
+    loaded = FieldStatistics.load(path)
+    mql_filter = {"servings": {"$in": [2, 6]}, "total_time": {"$lte": 50}}
+    assert loaded.selectivity(mql_filter) == pytest.approx(statistics.selectivity(mql_filter))
+
+
+def test_plan_without_filter_or_statistics_is_default_ann(statistics):
+    assert plan_vector_search(None, 10, statistics).strategy == ANN_STRATEGY
+    plan = plan_vector_search({"servings": 4}, 10, None)
+    assert plan.strategy == ANN_STRATEGY
+    assert plan.oversampling_factor == 10
+
+
+def test_plan_scores_small_filtered_sets_exactly(statistics):
+    plan = plan_vector_search({"difficulty": "hard"}, 10, statistics, exact_max_matches=100)
+    assert plan.strategy == EXACT_STRATEGY
+    assert plan.estimated_matches == 20
+
+
+def test_plan_oversamples_selective_filters(statistics):
+    plan = plan_vector_search({"meal_types": "breakfast"}, 10, statistics, exact_max_matches=50)
+    assert plan.strategy == ANN_STRATEGY
+    assert plan.oversampling_factor == 100
+    assert plan.nprobe_multiplier == pytest.approx(10, rel=1e-3)
+
+
+def test_plan_caps_candidates(statistics):
+    plan = plan_vector_search({"difficulty": "hard"}, 100, statistics, exact_max_matches=0, base_oversampling_factor=20)
+    assert plan.oversampling_factor * 100 <= MAX_NUM_CANDIDATES
+    # Never below the unfiltered oversampling
+    plan = plan_vector_search({"servings": {"$ne": 100}}, 10, statistics, exact_max_matches=0)
+    assert plan.oversampling_factor == 10
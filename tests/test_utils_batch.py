@@ -0,0 +1,101 @@
+import asyncio
+import json
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+from backend.core.utils.utils_batch import BatchJob, BatchPending, batch_request_id, execute_batch_locally
+from backend.core.utils.utils_llm import ChainCallStatus
+
+STAGE = "extract_title"
+INPUTS = [{"post": "Best lasagna ever"}, {"post": "Quick weeknight curry"}, {"post": "Grandma's apple pie"}]
+
+
+class ExtractedTitle(BaseModel):
+    title: str
+
+
+def chain():
+    prompt = ChatPromptTemplate.from_messages([("system", "Extract the recipe title."), ("human", "{post}")])
+    return prompt | FakeListChatModel(responses=["unused"])
+
+
+def respond_with_post(request):
+    return {"title": request["contents"][0]["parts"][0]["text"].upper()}
+
+
+def run(job: BatchJob, inputs=INPUTS):
+    return asyncio.run(job.run_chain_on_inputs(chain(), inputs, ExtractedTitle, STAGE))
+
+
+def rewrite_responses(job: BatchJob, edit):
+    path = job.responses_path(STAGE)
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    path.write_text("".join(json.dumps(row) + "\n" for row in edit(rows)))
+
+
+def test_request_ids_carry_position_and_request_hash(tmp_path):
+    lines = BatchJob(str(tmp_path)).build_requests(chain(), INPUTS, ExtractedTitle, STAGE)
+    request_ids = [line["request"]["labels"]["request_id"] for line in lines]
+    assert request_ids[0].startswith(f"{STAGE}-000000-")
+    assert len(set(request_ids)) == len(INPUTS)
+    assert batch_request_id(STAGE, 12, "abcdef" * 8) == f"{STAGE}-000012-abcdefabcdefabcd"
+    request = lines[0]["request"]
+    assert request["systemInstruction"] == {"parts": [{"text": "Extract the recipe title."}]}
+    assert request["generationConfig"]["responseSchema"]["properties"] == {"title": {"title": "Title", "type": "string"}}
+
+
+def test_batch_pending_until_responses_exist(tmp_path):
+    job = BatchJob(str(tmp_path))
+    with pytest.raises(BatchPending):
+        run(job)
+    assert len(job.requests_path(STAGE).read_text().splitlines()) == len(INPUTS)
+
+    execute_batch_locally(job.requests_path(STAGE), job.responses_path(STAGE), respond_with_post)
+    results, _, _, _ = run(job)
+    assert [result.title for result in results] == [i["post"].upper() for i in INPUTS]
+    assert results.statuses == [ChainCallStatus.OK] * len(INPUTS)
+
+
+def test_responses_are_matched_by_id_not_position(tmp_path):
+    job = BatchJob(str(tmp_path), executor=lambda requests, responses: execute_batch_locally(requests, responses, respond_with_post))
+    run(job)
+    rewrite_responses(job, lambda rows: rows[::-1])
+    results, _, _, _ = run(job)
+    assert [result.title for result in results] == [i["post"].upper() for i in INPUTS]
+
+
+@pytest.mark.parametrize("edit", [
+    # A missing, a duplicate, and an unexpected response
+    lambda rows: rows[:-1],
+    lambda rows: rows + rows[:1],
+    lambda rows: rows[:-1] + [{**rows[-1], "request": {**rows[-1]["request"], "labels": {"request_id": "other-000002-0"}}}],
+])
+def test_mismatched_responses_are_rejected(tmp_path, edit):
+    job = BatchJob(str(tmp_path), executor=execute_batch_locally)
+    run(job)
+    rewrite_responses(job, edit)
+    with pytest.raises(ValueError, match="do not match its requests"):
+        run(job)
+
+
+def test_responses_of_other_inputs_are_rejected(tmp_path):
+    job = BatchJob(str(tmp_path), executor=execute_batch_locally)
+    run(job)
+    with pytest.raises(ValueError):
+        run(job, INPUTS[:2] + [{"post": "Banana bread"}])
+
+
+def test_failed_rows_get_default_models(tmp_path):
+    job = BatchJob(str(tmp_path), executor=execute_batch_locally)
+    run(job)
+
+    def fail_rows(rows):
+        rows[0]["status"] = "INTERNAL: model error"
+        rows[1]["response"]["candidates"][0]["content"]["parts"] = [{"text": "{\"name\": 1}"}]
+        return rows
+
+    rewrite_responses(job, fail_rows)
+    results, _, _, _ = run(job)
+    assert results.statuses == [ChainCallStatus.PERMANENT_ERROR, ChainCallStatus.PERMANENT_ERROR, ChainCallStatus.OK]
+    assert results[0] == ExtractedTitle(title="")
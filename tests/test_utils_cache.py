@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from backend.core.utils.utils_cache import LRUCache, SemanticCache, SQLiteCache
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(ttl_seconds=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=3, access_flush_size=100)
+    yield cache
+    cache.close()
+
+
+def test_sqlite_cache_round_trip(sqlite_cache):
+    sqlite_cache.set("a", b"1")
+    assert sqlite_cache.get("a") == b"1"
+    assert sqlite_cache.get("b") is None
+    sqlite_cache.delete("a")
+    assert sqlite_cache.get("a") is None
+
+
+def test_sqlite_cache_evicts_by_buffered_access_time(sqlite_cache):
+    for key in ("a", "b", "c"):
+        sqlite_cache.set(key, b"x")
+    # The hit on "a" is only buffered, but must still protect it from eviction
+    assert sqlite_cache.get("a") == b"x"
+    sqlite_cache.set("d", b"x")
+    assert [key for key in "abcd" if sqlite_cache.get(key) is not None] == ["a", "c", "d"]
+
+
+def test_sqlite_cache_persists_access_times_on_close(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SQLiteCache(path, max_entries=2)
+    cache.set("a", b"x")
+    cache.set("b", b"x")
+    cache.get("a")
+    cache.close()
+    cache = SQLiteCache(path, max_entries=2)
+    cache.set("c", b"x")
+    assert cache.get("a") == b"x"
+    assert cache.get("b") is None
+    cache.close()
+
+
+def test_sqlite_cache_read_only(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    assert SQLiteCache(path, read_only=True).get("a") is None
+    cache = SQLiteCache(path)
+    cache.set("a", b"1")
+    cache.close()
+    read_only = SQLiteCache(path, read_only=True)
+    read_only.set("b", b"2")
+    assert (read_only.get("a"), read_only.get("b")) == (b"1", None)
+    read_only.close()
+
+
+def test_semantic_cache_hits_similar_queries():
+    cache = SemanticCache(threshold=0.95)
+    cache.set("filters", unit(1, 0, 0), "result", version="v1")
+    assert cache.get("filters", unit(1, 0.1, 0), version="v1") == "result"
+    # Too far, another exact key, or another dataset version
+    assert cache.get("filters", unit(1, 1, 0), version="v1") is None
+    assert cache.get("other filters", unit(1, 0, 0), version="v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_semantic_cache_returns_the_most_similar_entry():
+    cache = SemanticCache(threshold=0.9)
+    cache.set("k", unit(1, 0.2, 0), "near")
+    cache.set("k", unit(1, 0.4, 0), "far")
+    assert cache.get("k", unit(1, 0.1, 0)) == "near"
+
+
+def test_semantic_cache_drops_stale_dataset_versions():
+    cache = SemanticCache()
+    cache.set("k", unit(0, 1), "old", version="v1")
+    assert cache.get("k", unit(0, 1), version="v2") is None
+    assert cache.stats()["invalidations"] == 1
+    assert len(cache) == 0
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticCache(max_entries=2)
+    cache.set("a", unit(1, 0), 1)
+    cache.set("b", unit(1, 0), 2)
+    assert cache.get("a", unit(1, 0)) == 1
+    cache.set("c", unit(1, 0), 3)
+    assert cache.get("b", unit(1, 0)) is None
+    assert (cache.get("a", unit(1, 0)), cache.get("c", unit(1, 0))) == (1, 3)
@@ -0,0 +1,51 @@
+from langchain_core.documents import Document
+from backend.core.utils.utils_dedupe import assign_recipe_clusters, collapse_by_cluster, jaccard, title_tokens
+
+CURRY_INGREDIENTS = ["2 chicken thighs", "1 onion", "3 cloves garlic", "1 tbsp curry powder", "400ml coconut milk"]
+
+
+def recipe(uuid: str, title: str, ingredients):
+    return {"uuid": uuid, "title": title, "ingredients": ingredients}
+
+
+def test_title_tokens_drop_stopwords_and_plurals():
+    assert title_tokens("My Easy Homemade Chicken Curries!") == {"chicken", "curry"}
+
+
+def test_jaccard():
+    assert jaccard({"a", "b"}, {"b", "c"}) == 1 / 3
+    assert jaccard(set(), set()) == 1.0
+
+
+def test_reposts_share_a_cluster():
+    recipe_data = [
+        recipe("a", "Chicken curry", CURRY_INGREDIENTS),
+        recipe("b", "Beef stew", ["500g beef", "2 carrots", "3 potatoes", "1 onion"]),
+        recipe("c", "Easy chicken curry", CURRY_INGREDIENTS[:4] + ["coconut milk, 1 can"]),
+        recipe("d", "Chicken curry", ["rice", "soy sauce", "chicken breast", "broccoli", "honey"]),
+        recipe("e", "My chicken curry recipe", CURRY_INGREDIENTS),
+    ]
+    assert assign_recipe_clusters(recipe_data) == 3
+    # The cluster id is the uuid of the first recipe of the cluster, transitively through c
+    assert [r["cluster_id"] for r in recipe_data] == ["a", "b", "a", "d", "a"]
+
+
+def test_oversized_title_blocks_are_skipped():
+    recipe_data = [recipe(str(i), "Chicken curry", CURRY_INGREDIENTS) for i in range(5)]
+    assert assign_recipe_clusters(recipe_data, max_block_size=4) == 5
+    assert assign_recipe_clusters(recipe_data, max_block_size=5) == 1
+
+
+def test_collapse_by_cluster_keeps_the_best_of_each_cluster():
+    documents = [
+        Document(page_content="1", metadata={"uuid": "a", "cluster_id": "a"}),
+        Document(page_content="2", metadata={"uuid": "c", "cluster_id": "a"}),
+        Document(page_content="3", metadata={"uuid": "b", "cluster_id": "b"}),
+        # Indexed before clustering, its own cluster
+        Document(page_content="4", metadata={"uuid": "d"}),
+        Document(page_content="5", metadata={"uuid": "e", "cluster_id": "a"}),
+        Document(page_content="6", metadata={"uuid": "f", "cluster_id": "f"}),
+    ]
+    assert [d.page_content for d in collapse_by_cluster(documents, k=10)] == ["1", "3", "4", "6"]
+    # Backfilled from later hits up to k
+    assert [d.page_content for d in collapse_by_cluster(documents, k=3)] == ["1", "3", "4"]
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from backend.core.utils.utils_filter import MetadataFilterIndex, matches_filter
+
+METADATAS = [
+    {"servings": 2, "total_time": 15, "meal_types": ["breakfast"], "difficulty": "easy"},
+    {"servings": 4, "total_time": 45, "meal_types": ["lunch", "dinner"], "difficulty": "medium"},
+    {"servings": 6, "total_time": 90, "meal_types": ["dinner"], "difficulty": "hard"},
+    {"servings": 4, "meal_types": [], "difficulty": "easy"},
+    {"total_time": 30, "meal_types": ["dinner", "snack"]},
+]
+
+
+def matching_rows(mql_filter):
+    return np.flatnonzero(MetadataFilterIndex(METADATAS).mask(mql_filter)).tolist()
+
+
+@pytest.mark.parametrize("mql_filter, rows", [
+    (None, [0, 1, 2, 3, 4]),
+    ({}, [0, 1, 2, 3, 4]),
+    ({"servings": 4}, [1, 3]),
+    ({"servings": {"$eq": 4}}, [1, 3]),
+    # Missing values do not equal the operand, so $ne keeps them as MongoDB does
+    ({"servings": {"$ne": 4}}, [0, 2, 4]),
+    ({"servings": {"$in": [2, 6]}}, [0, 2]),
+    ({"servings": {"$nin": [2, 6]}}, [1, 3, 4]),
+    # Range operators never match missing values
+    ({"total_time": {"$lte": 30}}, [0, 4]),
+    ({"total_time": {"$gt": 15, "$lt": 90}}, [1, 4]),
+    ({"total_time": {"$gte": 90}}, [2]),
+    # Array fields match if any element matches
+    ({"meal_types": "dinner"}, [1, 2, 4]),
+    ({"meal_types": {"$in": ["breakfast", "snack"]}}, [0, 4]),
+    ({"meal_types": {"$nin": ["dinner"]}}, [0, 3]),
+    ({"difficulty": {"$in": ["easy"]}, "servings": 4}, [3]),
+    ({"$and": [{"servings": {"$gte": 4}}, {"meal_types": "dinner"}]}, [1, 2]),
+    ({"$or": [{"servings": 2}, {"total_time": {"$gte": 90}}]}, [0, 2]),
+    ({"$nor": [{"difficulty": "easy"}, {"servings": 6}]}, [1, 4]),
+    ({"$and": [{"$or": [{"servings": 2}, {"servings": 6}]}, {"meal_types": "dinner"}]}, [2]),
+])
+def test_mask(mql_filter, rows):
+    assert matching_rows(mql_filter) == rows
+
+
+def test_range_on_non_numeric_field_compares_row_by_row():
+    # String fields have no numeric column, so the comparison falls back to Python ordering
+    assert matching_rows({"difficulty": {"$gt": "hard"}}) == [1]
+
+
+def test_range_on_mixed_types_skips_incomparable_values():
+    metadatas = [{"servings": 2}, {"servings": "4"}, {"servings": [1, 8]}, {"servings": None}]
+    assert np.flatnonzero(MetadataFilterIndex(metadatas).mask({"servings": {"$gt": 3}})).tolist() == [2]
+
+
+def test_matches_filter():
+    assert matches_filter(METADATAS[1], {"meal_types": "dinner", "servings": {"$gte": 4}})
+    assert not matches_filter(METADATAS[0], {"meal_types": "dinner"})
+    assert matches_filter(METADATAS[0], None)
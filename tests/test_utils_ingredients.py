@@ -0,0 +1,94 @@
+import pytest
+from backend.core.utils.utils_ingredients import (
+    IngredientVocabulary,
+    canonical_ingredient_ids,
+    canonicalize_ingredient,
+    recipe_ingredient_ids,
+    replace_synonyms,
+    singularize,
+)
+
+
+def pantry_matches(pantry_ingredient: str, recipe_ingredient: str) -> bool:
+    """Whether a pantry ingredient matches a recipe ingredient the way the rerank cascade and the prefilter compare them."""
+    return bool(set(canonical_ingredient_ids(pantry_ingredient)) & set(recipe_ingredient_ids([recipe_ingredient])))
+
+
+@pytest.mark.parametrize("token, singular", [
+    ("tomatoes", "tomato"),
+    ("berries", "berry"),
+    ("leaves", "leaf"),
+    ("peaches", "peach"),
+    ("molasses", "molasses"),
+    ("asparagus", "asparagus"),
+    ("egg", "egg"),
+])
+def test_singularize(token, singular):
+    assert singularize(token) == singular
+
+
+@pytest.mark.parametrize("ingredient, canonical", [
+    ("Roma Tomatoes", "tomato"),
+    ("scallions", "green onion"),
+    ("onion, finely chopped", "onion"),
+    ("tomatoes (diced)", "tomato"),
+    ("minced beef", "ground beef"),
+    ("beef mince", "ground beef"),
+    ("cherries", "cherry"),
+    ("plums", "plum"),
+    ("fresh", ""),
+])
+def test_canonicalize_ingredient(ingredient, canonical):
+    assert canonicalize_ingredient(ingredient) == canonical
+
+
+def test_replace_synonyms_matches_longest_phrase():
+    assert replace_synonyms(["chicken", "mince"]) == ["ground", "chicken"]
+    assert replace_synonyms(["mince"]) == ["ground", "beef"]
+
+
+@pytest.mark.parametrize("pantry_ingredient, recipe_ingredient", [
+    ("chicken", "chicken thighs"),
+    ("chicken", "boneless skinless chicken breasts"),
+    ("garlic", "garlic cloves"),
+    ("garlic", "2 cloves garlic"),
+    ("pork", "pork chops"),
+    ("cilantro", "fresh cilantro leaves"),
+    ("coriander", "fresh cilantro leaves"),
+    ("basil", "basil leaves"),
+    ("tomato", "heirloom beefsteak tomatoes"),
+    ("butter", "unsalted butter"),
+    ("milk", "whole milk"),
+    ("chicken thighs", "chicken thigh fillets"),
+    ("coconut milk", "coconut milk"),
+])
+def test_pantry_ingredient_matches_recipe_ingredient(pantry_ingredient, recipe_ingredient):
+    assert pantry_matches(pantry_ingredient, recipe_ingredient)
+
+
+@pytest.mark.parametrize("pantry_ingredient, recipe_ingredient", [
+    ("milk", "coconut milk"),
+    ("butter", "peanut butter"),
+    ("black pepper", "bell pepper"),
+    ("pepper", "bell pepper"),
+    ("tomato", "tomato sauce"),
+    ("chicken", "chicken stock"),
+    ("garlic", "garlic powder"),
+])
+def test_pantry_ingredient_does_not_match_recipe_ingredient(pantry_ingredient, recipe_ingredient):
+    assert not pantry_matches(pantry_ingredient, recipe_ingredient)
+
+
+def test_canonical_ingredient_ids_full_form_first():
+    assert canonical_ingredient_ids("chicken thighs") == ["chicken_thigh", "chicken"]
+    assert canonical_ingredient_ids("heirloom beefsteak tomatoes") == ["beefsteak_tomato", "tomato"]
+    assert canonical_ingredient_ids("of") == []
+
+
+def test_ingredient_vocabulary_normalize_backs_off_to_base_ingredient():
+    vocabulary = IngredientVocabulary.build([["chicken thighs", "garlic cloves"], ["chicken"]])
+    assert vocabulary.id_counts["chicken"] == 2
+    assert vocabulary.normalize("chicken breasts") == "chicken"
+    assert vocabulary.normalize("garlic") == "garlic"
+    assert vocabulary.normalize("saffron") is None
+    assert vocabulary.ids(["garlic", "chicken", "saffron"]) == ["chicken", "garlic"]
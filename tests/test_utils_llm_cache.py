@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+from backend.core.utils.utils_llm_cache import LLMResponseCache, SingleFlight, llm_request_key
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def chain(model_name: str = "fake"):
+    prompt = ChatPromptTemplate.from_messages([("system", "Answer briefly."), ("human", "{question}")])
+    return prompt | FakeListChatModel(responses=["unused"], name=model_name)
+
+
+def test_single_flight_coalesces_identical_calls():
+    async def run():
+        single_flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(single_flight.run("key", call) for _ in range(5)))
+        return results, calls, single_flight.stats()
+    results, calls, stats = asyncio.run(run())
+    assert len(calls) == 1
+    # Only the leader made the call
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert {result for result, _ in results} == {"answer"}
+    assert stats == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_single_flight_does_not_coalesce_other_keys_or_later_calls():
+    async def run():
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0)
+            return "answer"
+
+        await asyncio.gather(single_flight.run("a", call), single_flight.run("b", call))
+        await single_flight.run("a", call)
+        return single_flight.stats()
+    assert asyncio.run(run())["calls"] == 3
+
+
+def test_single_flight_shares_errors():
+    async def run():
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("model down")
+
+        return await asyncio.gather(*(single_flight.run("key", call) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+
+
+def test_single_flight_waiter_takes_over_from_a_cancelled_leader():
+    async def run():
+        single_flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leader = asyncio.ensure_future(single_flight.run("key", call))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(single_flight.run("key", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result = await waiter
+        return result, calls, leader.cancelled()
+    (result, shared), calls, leader_cancelled = asyncio.run(run())
+    assert leader_cancelled
+    assert (result, shared) == ("answer", False)
+    assert len(calls) == 2
+
+
+def test_request_key_covers_prompt_model_and_schema():
+    class OtherAnswer(BaseModel):
+        text: str
+        confidence: float
+
+    key = llm_request_key(chain(), {"question": "Is it done?"}, Answer)
+    assert key == llm_request_key(chain(), {"question": "Is it done?"}, Answer)
+    assert key != llm_request_key(chain(), {"question": "Is it ready?"}, Answer)
+    assert key != llm_request_key(chain(), {"question": "Is it done?"}, OtherAnswer)
+    assert llm_request_key(FakeListChatModel(responses=[]), {"question": "Is it done?"}, Answer) is None
+
+
+def test_response_cache_round_trip_and_replay(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = LLMResponseCache(path)
+    key = llm_request_key(chain(), {"question": "Is it done?"}, Answer)
+    assert cache.get(key, Answer) is None
+    asyncio.run(cache.aset(key, Answer(text="yes")))
+    assert asyncio.run(cache.aget(key, Answer)) == Answer(text="yes")
+    cache.close()
+
+    replay = LLMResponseCache(path, read_only=True)
+    replay.set("other", Answer(text="no"))
+    assert replay.get(key, Answer) == Answer(text="yes")
+    assert replay.get("other", Answer) is None
+    replay.close()
+
+
+def test_response_cache_discards_outputs_that_no_longer_validate(tmp_path):
+    class Renamed(BaseModel):
+        answer: str
+
+    cache = LLMResponseCache(str(tmp_path / "responses.sqlite"))
+    cache.set("key", Answer(text="yes"))
+    assert cache.get("key", Renamed) is None
+    assert cache.stats()["misses"] == 1
+    cache.close()
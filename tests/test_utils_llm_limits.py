@@ -0,0 +1,111 @@
+import asyncio
+import time
+import pytest
+from google.api_core.exceptions import ResourceExhausted
+from pydantic import BaseModel, ValidationError
+from backend.core.utils.utils_llm_limits import AdaptiveConcurrencyLimiter, RetryBudget, is_quota_error, is_retryable_error
+
+
+def release_after(limiter: AdaptiveConcurrencyLimiter, latency: float = 1.0, **kwargs):
+    """Release a slot as if its call took latency seconds, so the latency check does not depend on the test machine."""
+    return limiter.release(time.monotonic() - latency, **kwargs)
+
+
+def test_limiter_grows_on_healthy_completions():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+        for _ in range(20):
+            await limiter.acquire()
+            await release_after(limiter)
+        return limiter
+    limiter = asyncio.run(run())
+    assert limiter.limit == 4
+    assert limiter.successes == 20 and limiter.in_flight == 0
+
+
+def test_limiter_halves_on_quota_errors():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8, max_limit=8)
+        await limiter.acquire()
+        await release_after(limiter, error=ResourceExhausted("quota"))
+        return limiter
+    limiter = asyncio.run(run())
+    assert limiter.limit == 4
+    assert limiter.quota_errors == 1
+
+
+def test_limiter_decreases_once_per_window():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8, max_limit=8)
+        for _ in range(3):
+            await limiter.acquire()
+        # Calls sent under the old window do not decrease the new one again
+        for _ in range(3):
+            await release_after(limiter, error=ResourceExhausted("quota"))
+        return limiter
+    assert asyncio.run(run()).limit == 4
+
+
+def test_limiter_abandoned_calls_free_their_slot_without_an_outcome():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=4)
+        started_at = await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        await limiter.release(started_at, abandoned=True)
+        await waiter
+        await release_after(limiter)
+        return limiter
+    limiter = asyncio.run(run())
+    assert limiter.successes == 1 and limiter.errors == 0
+    assert limiter.in_flight == 0
+
+
+def test_limiter_bounds_calls_in_flight():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2)
+        in_flight, peak = 0, 0
+
+        async def call():
+            nonlocal in_flight, peak
+            await limiter.acquire()
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            await release_after(limiter)
+
+        await asyncio.gather(*(call() for _ in range(10)))
+        return peak
+    assert asyncio.run(run()) == 2
+
+
+def test_retry_budget():
+    budget = RetryBudget(2)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    assert RetryBudget.for_batch(1000, ratio=0.1).max_retries == 100
+    assert RetryBudget.for_batch(5).max_retries == 10
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (ResourceExhausted("quota"), True),
+    (TimeoutError(), True),
+    (RuntimeError("503 Service Unavailable"), True),
+    (RuntimeError("MALFORMED_FUNCTION_CALL"), True),
+    (RuntimeError("Response was blocked for safety reasons"), False),
+    (ValueError("bad input"), False),
+])
+def test_is_retryable_error(error, retryable):
+    assert is_retryable_error(error) == retryable
+
+
+def test_schema_validation_errors_are_not_retried():
+    class Out(BaseModel):
+        x: int
+
+    with pytest.raises(ValidationError) as error:
+        Out.model_validate({"x": "not a number"})
+    assert not is_retryable_error(error.value)
+    assert is_quota_error(RuntimeError("429 Too Many Requests"))